@@ -0,0 +1,182 @@
+"""
+Staff actions on complaints.
+
+The bulk actions read the affected rows once, change them with a single
+UPDATE, write every history row with one ``bulk_create`` and queue the
+rollup update, all in one transaction. ``QuerySet.update()`` and
+``bulk_create`` skip model signals, so stats invalidation, rollups and live
+events are done here.
+
+Each write transaction is rerun if it loses a lock race (see
+``transactions.py``). With sharded complaints the bulk actions work shard
+by shard inside the same outer transaction (see ``sharding.py``). Archived
+complaints are moved back to the hot tier before they change (see
+``tiering.py``).
+"""
+from django.db import transaction
+from django.utils import timezone
+
+from . import events, sharding, tiering
+from .models import Complaint, ComplaintComment, ComplaintHistory
+from .rollups import RollupBatch
+from .stats import invalidate_stats
+from .transactions import retry_on_lock
+
+UPDATED = 'updated'
+UNCHANGED = 'unchanged'
+NOT_FOUND = 'not_found'
+
+
+def update_status(complaint, status, changed_by, resolution_notes=''):
+    """Change one complaint's status and record it, as ``update_complaint_status`` does."""
+    tiering.thaw(complaint)
+    old_status = complaint.status
+    complaint.status = status
+    if resolution_notes:
+        complaint.resolution_notes = resolution_notes
+    _save_status(complaint, old_status, changed_by)
+    return old_status
+
+
+@retry_on_lock
+def _save_status(complaint, old_status, changed_by):
+    # Background jobs queued by the save commit together with it
+    with sharding.atomic_for(complaint):
+        complaint.save()
+        ComplaintHistory.objects.create(
+            complaint=complaint,
+            changed_by=changed_by,
+            field_name='status',
+            old_value=old_status,
+            new_value=complaint.status,
+        )
+
+
+@retry_on_lock
+def add_comment(complaint, user, text, is_internal):
+    """Add a comment, as the sync and async ``add_comment`` views do."""
+    tiering.thaw(complaint)
+    return ComplaintComment.objects.create(
+        complaint=complaint,
+        user=user,
+        comment=text,
+        is_internal=is_internal,
+    )
+
+
+def _outcomes(ticket_numbers, found, changed):
+    outcomes = {}
+    for ticket_number in ticket_numbers:
+        if ticket_number not in found:
+            outcomes[ticket_number] = NOT_FOUND
+        else:
+            outcomes[ticket_number] = UPDATED if ticket_number in changed else UNCHANGED
+    return outcomes
+
+
+def _by_shard(ticket_numbers):
+    shards = {}
+    for ticket_number in ticket_numbers:
+        shards.setdefault(sharding.shard_for_ticket(ticket_number), []).append(ticket_number)
+    # Always lock shards in the same order so two bulk actions can't deadlock
+    return sorted(shards.items())
+
+
+@retry_on_lock
+def bulk_update_status(ticket_numbers, status, changed_by, resolution_notes=''):
+    """Move complaints to ``status``; returns ``{ticket_number: outcome}``.
+
+    Complaints already in ``status`` are left alone and reported unchanged.
+    """
+    tiering.thaw_tickets(ticket_numbers)
+    rows, changed, entries = [], [], []
+    now = timezone.now()
+    with transaction.atomic():
+        for alias, shard_tickets in _by_shard(ticket_numbers):
+            with transaction.atomic(using=alias, savepoint=False):
+                shard_rows = list(
+                    Complaint.objects.using(alias).select_for_update()
+                    .filter(ticket_number__in=shard_tickets)
+                    .values_list('id', 'ticket_number', 'status', 'created_by_id', 'priority', 'resolution_notes')
+                )
+                shard_changed = [row for row in shard_rows if row[2] != status]
+                rows += shard_rows
+                if not shard_changed:
+                    continue
+
+                # Same resolved_at rule as Complaint.save()
+                fields = {'status': status, 'updated_at': now, 'resolved_at': now if status == 'resolved' else None}
+                if resolution_notes:
+                    fields['resolution_notes'] = resolution_notes
+                Complaint.objects.using(alias).filter(id__in=[row[0] for row in shard_changed]).update(**fields)
+
+                entries += ComplaintHistory.objects.using(alias).bulk_create([
+                    ComplaintHistory(
+                        complaint_id=row[0], changed_by=changed_by, field_name='status',
+                        old_value=row[2], new_value=status, changed_at=now,
+                    )
+                    for row in shard_changed
+                ])
+                changed += shard_changed
+
+        if changed:
+            rollups = RollupBatch()
+            for row in changed:
+                rollups.add_transition(now, 'status', row[2], status)
+            rollups.enqueue()
+
+            creator_ids = {row[3] for row in changed}
+            transaction.on_commit(lambda: invalidate_stats(creator_ids))
+
+            for (complaint_id, ticket_number, _, created_by_id, priority, notes), entry in zip(changed, entries):
+                complaint = Complaint(
+                    id=complaint_id, ticket_number=ticket_number, status=status, priority=priority,
+                    created_by_id=created_by_id, resolution_notes=resolution_notes or notes,
+                )
+                events.publish_status(complaint, entry, changed_by)
+
+    return _outcomes(ticket_numbers, {row[1] for row in rows}, {row[1] for row in changed})
+
+
+@retry_on_lock
+def bulk_assign(ticket_numbers, assignee, changed_by):
+    """Assign complaints to ``assignee`` (``None`` unassigns); returns ``{ticket_number: outcome}``.
+
+    The dashboard counters don't depend on the assignee, so cached stats
+    are left alone.
+    """
+    assignee_id = assignee.pk if assignee else None
+    new_value = assignee.username if assignee else 'Unassigned'
+    tiering.thaw_tickets(ticket_numbers)
+    rows, changed, entries = [], [], []
+    now = timezone.now()
+    with transaction.atomic():
+        for alias, shard_tickets in _by_shard(ticket_numbers):
+            with transaction.atomic(using=alias, savepoint=False):
+                shard_rows = list(
+                    Complaint.objects.using(alias).select_for_update()
+                    .filter(ticket_number__in=shard_tickets)
+                    .values_list('id', 'ticket_number', 'assigned_to_id', 'assigned_to__username')
+                )
+                shard_changed = [row for row in shard_rows if row[2] != assignee_id]
+                rows += shard_rows
+                if not shard_changed:
+                    continue
+
+                Complaint.objects.using(alias).filter(id__in=[row[0] for row in shard_changed]).update(
+                    assigned_to_id=assignee_id, updated_at=now,
+                )
+                entries += ComplaintHistory.objects.using(alias).bulk_create([
+                    ComplaintHistory(
+                        complaint_id=complaint_id, changed_by=changed_by, field_name='assigned_to',
+                        old_value=old_username or 'Unassigned', new_value=new_value, changed_at=now,
+                    )
+                    for complaint_id, _, _, old_username in shard_changed
+                ])
+                changed += shard_changed
+
+        for (complaint_id, ticket_number, _, _), entry in zip(changed, entries):
+            complaint = Complaint(id=complaint_id, ticket_number=ticket_number, assigned_to=assignee)
+            events.publish_assignment(complaint, entry, changed_by)
+
+    return _outcomes(ticket_numbers, {row[1] for row in rows}, {row[1] for row in changed})
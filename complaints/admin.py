@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Complaint, ComplaintCategory, ComplaintComment, ComplaintHistory
+from .models import Complaint, ComplaintCategory, ComplaintComment, ComplaintHistory, Job
 
 
 @admin.register(ComplaintCategory)
@@ -45,3 +45,10 @@ class ComplaintHistoryAdmin(admin.ModelAdmin):
     list_display = ['complaint', 'field_name', 'old_value', 'new_value', 'changed_by', 'changed_at']
     list_filter = ['field_name', 'changed_at']
     readonly_fields = ['complaint', 'changed_by', 'field_name', 'old_value', 'new_value', 'changed_at']
+
+
+@admin.register(Job)
+class JobAdmin(admin.ModelAdmin):
+    list_display = ['id', 'name', 'status', 'attempts', 'run_after', 'locked_by', 'created_at', 'finished_at']
+    list_filter = ['status', 'name']
+    readonly_fields = ['created_at', 'finished_at', 'locked_by', 'locked_at', 'last_error']
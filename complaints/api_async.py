@@ -0,0 +1,195 @@
+"""
+Async versions of the polled JSON API views and the live event streams.
+
+Served instead of the sync views in ``views.py`` when ``ASYNC_API_VIEWS`` is
+on (the default under ``asgi.py``). While a request waits on the database
+the event loop serves other clients, so one ASGI process holds many
+concurrent pollers without a thread each. Responses match the sync views.
+"""
+import json
+from functools import wraps
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth.views import redirect_to_login
+from django.http import Http404, HttpResponseNotAllowed, JsonResponse
+
+from . import actions, events, tiering
+from .models import Complaint
+from .pagination import KeysetPaginator
+from .search import asearch_complaints
+from .serializers import project, to_api_dict
+from .stats import aget_stats
+from .sync import CursorError, achanges_since, conditional_json, parse_since
+
+
+async def aget_user(request):
+    """Resolve ``request.user`` without touching the session from the event loop."""
+    if hasattr(request, 'auser'):
+        return await request.auser()
+
+    def resolve():
+        # Evaluates the lazy object (session + user lookup) on a worker thread
+        request.user.is_authenticated
+        return request.user
+
+    return await sync_to_async(resolve)()
+
+
+def async_login_required(view):
+    """``login_required`` for async views."""
+    @wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        user = await aget_user(request)
+        if not user.is_authenticated:
+            return redirect_to_login(request.get_full_path(), settings.LOGIN_URL)
+        return await view(request, user, *args, **kwargs)
+    return wrapper
+
+
+def async_require_post(view):
+    """``require_http_methods(["POST"])`` for async views (Django 4.2's is sync-only)."""
+    @wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        if request.method != 'POST':
+            return HttpResponseNotAllowed(['POST'])
+        return await view(request, *args, **kwargs)
+    return wrapper
+
+
+async def aget_complaint(ticket_number):
+    complaint = await Complaint.objects.for_ticket(ticket_number).afirst()
+    if complaint is None and tiering.is_enabled():
+        complaint = await tiering.cold_queryset(ticket_number).afirst()
+    if complaint is None:
+        raise Http404('No Complaint matches the given query.')
+    return complaint
+
+
+@async_login_required
+async def api_complaints(request, user):
+    """API endpoint for fetching complaints"""
+    try:
+        limit = min(max(int(request.GET.get('limit', 100)), 1), 100)
+    except ValueError:
+        limit = 100
+
+    # Delta sync: only what changed since the client's cursor
+    if 'since' in request.GET:
+        try:
+            since = parse_since(request.GET['since'])
+        except CursorError as e:
+            return JsonResponse({'success': False, 'error': str(e)}, status=e.status)
+        return conditional_json(request, await achanges_since(user, since, limit))
+
+    complaints = Complaint.objects.all()
+
+    if not user.is_staff:
+        complaints = complaints.filter(created_by=user)
+
+    # Archived (cold tier) complaints only with ?archived=1
+    if request.GET.get('archived'):
+        complaints = complaints.with_archived()
+
+    # Apply filters
+    status = request.GET.get('status')
+    priority = request.GET.get('priority')
+    search = request.GET.get('search')
+
+    if status:
+        complaints = complaints.filter(status=status)
+    if priority:
+        complaints = complaints.filter(priority=priority)
+    if search:
+        complaints = await asearch_complaints(complaints, search)
+    else:
+        complaints = complaints.order_by('-created_at')
+
+    page = await KeysetPaginator(project(complaints), limit).aget_page(request.GET.get('cursor'))
+
+    return conditional_json(request, {
+        'complaints': [to_api_dict(row) for row in page],
+        'next_cursor': page.next_cursor,
+        'prev_cursor': page.prev_cursor,
+    })
+
+
+@async_login_required
+async def api_stats(request, user):
+    """API endpoint for dashboard statistics"""
+    stats = await aget_stats(user)
+    keys = ['total', 'pending', 'in_progress', 'resolved', 'closed', 'urgent']
+    return conditional_json(request, {key: stats[key] for key in keys})
+
+
+@async_require_post
+@async_login_required
+async def update_complaint_status(request, user, ticket_number):
+    complaint = await aget_complaint(ticket_number)
+
+    if not user.is_staff:
+        return JsonResponse({'success': False, 'error': 'Permission denied'})
+
+    data = json.loads(request.body)
+    new_status = data.get('status')
+    resolution_notes = data.get('resolution_notes', '')
+
+    if new_status not in dict(Complaint.STATUS_CHOICES):
+        return JsonResponse({'success': False, 'error': 'Invalid status'})
+
+    # Saving runs signals and a transaction, which are sync-only
+    await sync_to_async(actions.update_status)(complaint, new_status, user, resolution_notes)
+
+    return JsonResponse({'success': True, 'status': new_status})
+
+
+@async_require_post
+@async_login_required
+async def add_comment(request, user, ticket_number):
+    complaint = await aget_complaint(ticket_number)
+
+    if not user.is_staff and complaint.created_by_id != user.pk:
+        return JsonResponse({'success': False, 'error': 'Permission denied'})
+
+    data = json.loads(request.body)
+    comment_text = data.get('comment', '')
+    is_internal = data.get('is_internal', False)
+
+    if not comment_text:
+        return JsonResponse({'success': False, 'error': 'Comment cannot be empty'})
+
+    comment = await sync_to_async(actions.add_comment)(
+        complaint, user, comment_text, is_internal and user.is_staff
+    )
+
+    return JsonResponse({
+        'success': True,
+        'comment': {
+            'id': comment.id,
+            'comment': comment.comment,
+            'user': user.username,
+            'created_at': comment.created_at.strftime('%Y-%m-%d %H:%M:%S'),
+            'is_internal': comment.is_internal
+        }
+    })
+
+
+@async_login_required
+async def complaint_events(request, user, ticket_number):
+    """Server-Sent Events stream of status, assignment and comment changes"""
+    complaint = await aget_complaint(ticket_number)
+
+    if not user.is_staff and complaint.created_by_id != user.pk:
+        return JsonResponse({'success': False, 'error': 'Permission denied'}, status=403)
+
+    subscription = events.get_broker().subscribe(
+        events.channels_for(user, ticket_number), events.last_event_id(request)
+    )
+    return events.event_stream_response(events.astream(subscription, user.is_staff))
+
+
+@async_login_required
+async def dashboard_events(request, user):
+    """Server-Sent Events stream of complaints created, changing status or deleted in the user's scope"""
+    subscription = events.get_broker().subscribe(events.channels_for(user), events.last_event_id(request))
+    return events.event_stream_response(events.astream(subscription, user.is_staff))
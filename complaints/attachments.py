@@ -0,0 +1,118 @@
+"""
+Attachment bookkeeping: reference counts and thumbnails.
+
+``ContentAddressedStorage`` calls ``acquire`` for every saved upload and the
+complaint delete signal calls ``release``. New images get a thumbnail
+rendered by a background job, so the request that uploaded them never
+waits on Pillow.
+"""
+import logging
+import os
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+from .jobs import enqueue, job
+from .models import AttachmentBlob, Complaint
+
+logger = logging.getLogger(__name__)
+
+IMAGE_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.gif', '.bmp', '.webp', '.tif', '.tiff'}
+THUMBNAIL_DIR = 'complaint_thumbnails'
+
+
+def _attachment_storage():
+    return Complaint._meta.get_field('attachment').storage
+
+
+def is_image(name):
+    return os.path.splitext(name)[1].lower() in IMAGE_EXTENSIONS
+
+
+def acquire(digest, name, size):
+    """Record one more reference to the file with ``digest``; returns its stored name."""
+    increment = dict(ref_count=F('ref_count') + 1)
+    if not AttachmentBlob.objects.filter(sha256=digest).update(**increment):
+        try:
+            with transaction.atomic():
+                AttachmentBlob.objects.create(sha256=digest, name=name, size=size, ref_count=1)
+        except IntegrityError:
+            # Stored concurrently; count this upload against that row
+            AttachmentBlob.objects.filter(sha256=digest).update(**increment)
+        else:
+            if is_image(name):
+                enqueue('attachments.thumbnail', {'digest': digest})
+            return name
+    return AttachmentBlob.objects.values_list('name', flat=True).get(sha256=digest)
+
+
+def release(name):
+    """Drop one reference; the file and its thumbnail are deleted with the last one."""
+    AttachmentBlob.objects.filter(name=name, ref_count__gt=0).update(ref_count=F('ref_count') - 1)
+    orphans = list(AttachmentBlob.objects.filter(name=name, ref_count=0).values_list('id', 'name', 'thumbnail'))
+    if orphans:
+        AttachmentBlob.objects.filter(id__in=[orphan[0] for orphan in orphans]).delete()
+        transaction.on_commit(lambda: delete_files(orphans))
+
+
+def delete_files(blobs):
+    """Remove the files of deleted blobs unless the same content was stored again since."""
+    for _, name, thumbnail in blobs:
+        if AttachmentBlob.objects.filter(name=name).exists():
+            continue
+        _attachment_storage().delete(name)
+        if thumbnail:
+            default_storage.delete(thumbnail)
+
+
+def thumbnail_url(name):
+    """URL of the thumbnail for a stored attachment, or None while there isn't one."""
+    thumbnail = AttachmentBlob.objects.filter(name=name).values_list('thumbnail', flat=True).first()
+    return default_storage.url(thumbnail) if thumbnail else None
+
+
+def render_thumbnail(source, size):
+    """JPEG bytes of ``source`` scaled to fit ``size`` x ``size``."""
+    with Image.open(source) as image:
+        # Lets the JPEG decoder skip most of the full-resolution work
+        image.draft('RGB', (size, size))
+        image = ImageOps.exif_transpose(image)
+        image.thumbnail((size, size))
+        if image.mode in ('RGBA', 'LA', 'P'):
+            image = image.convert('RGBA')
+            background = Image.new('RGB', image.size, 'white')
+            background.paste(image, mask=image.getchannel('A'))
+            image = background
+        elif image.mode != 'RGB':
+            image = image.convert('RGB')
+        output = BytesIO()
+        image.save(output, 'JPEG', quality=85, optimize=True)
+    return output.getvalue()
+
+
+# CPU-bound; keep a burst of uploads from taking over every worker
+@job('attachments.thumbnail', concurrency=2)
+def generate_thumbnail(digest):
+    """Render and record the thumbnail of a stored image; returns its name ('' if none)."""
+    blob = AttachmentBlob.objects.filter(sha256=digest).first()
+    if blob is None or blob.thumbnail or not is_image(blob.name):
+        return blob.thumbnail if blob else ''
+
+    size = getattr(settings, 'ATTACHMENT_THUMBNAIL_SIZE', 320)
+    try:
+        with _attachment_storage().open(blob.name) as source:
+            data = render_thumbnail(source, size)
+    except (UnidentifiedImageError, Image.DecompressionBombError, OSError) as e:
+        logger.warning('Cannot render a thumbnail for %s: %s', blob.name, e)
+        return ''
+
+    name = f'{THUMBNAIL_DIR}/{digest[:2]}/{digest}.jpg'
+    if not default_storage.exists(name):
+        name = default_storage.save(name, ContentFile(data))
+    AttachmentBlob.objects.filter(pk=blob.pk).update(thumbnail=name)
+    return name
@@ -0,0 +1,111 @@
+"""
+Authentication backend that resolves session users from memory.
+
+``AuthenticationMiddleware`` turns the user id in the session into a user
+row on every authenticated request, API polls included.
+``CachedModelBackend`` keeps the resolved users in an in-process LRU of
+``USER_CACHE_SIZE`` entries instead, so with cached sessions (see
+``sessions.py``) a request is authenticated without touching the database.
+
+Each entry remembers a version token kept per user in ``USER_CACHE_ALIAS``;
+saving or deleting a user replaces the token once the transaction commits
+(see ``signals.py``), which makes every process reload that user on its
+next request. A password change therefore still ends the user's other
+sessions, and ``is_active``/``is_staff`` changes apply at once. Writes that
+skip signals (``QuerySet.update()``) are only picked up when
+``USER_CACHE_TIMEOUT`` expires the entry; call ``invalidate_user`` after
+them.
+"""
+import copy
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+from django.conf import settings
+from django.contrib.auth.backends import ModelBackend
+from django.core.cache import caches
+from django.db import transaction
+
+from . import metrics
+
+user_cache_requests = metrics.registry.register(metrics.Counter(
+    'complaints_user_cache_requests_total', 'Session user lookups by result (hit/miss).', ('result',),
+))
+
+
+def _version_key(user_id):
+    return f'auth:user-version:{user_id}'
+
+
+def _versions():
+    return caches[getattr(settings, 'USER_CACHE_ALIAS', 'default')]
+
+
+class UserCache:
+    """LRU of ``user id -> (version, loaded at, user)``."""
+
+    def __init__(self, max_entries, timeout):
+        self.max_entries = max_entries
+        self.timeout = timeout
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, user_id):
+        with self.lock:
+            entry = self.entries.get(user_id)
+        if entry is None:
+            return None
+        version, loaded_at, user = entry
+        # A missing token (evicted or never set) can't vouch for the entry
+        if time.monotonic() - loaded_at > self.timeout or _versions().get(_version_key(user_id)) != version:
+            self.discard(user_id)
+            return None
+        with self.lock:
+            if user_id in self.entries:
+                self.entries.move_to_end(user_id)
+        return user
+
+    def set(self, user_id, version, user):
+        with self.lock:
+            self.entries[user_id] = (version, time.monotonic(), user)
+            self.entries.move_to_end(user_id)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def discard(self, user_id):
+        with self.lock:
+            self.entries.pop(user_id, None)
+
+
+cache = UserCache(getattr(settings, 'USER_CACHE_SIZE', 10000), getattr(settings, 'USER_CACHE_TIMEOUT', 300))
+
+
+def invalidate_user(user_id):
+    """Make every process reload ``user_id`` once the current transaction commits."""
+    def bump():
+        _versions().set(_version_key(user_id), uuid.uuid4().hex, None)
+        cache.discard(user_id)
+    transaction.on_commit(bump)
+
+
+class CachedModelBackend(ModelBackend):
+    def get_user(self, user_id):
+        if not cache.max_entries:
+            return super().get_user(user_id)
+        user = cache.get(user_id)
+        if user is not None:
+            user_cache_requests.inc('hit')
+            # Each request gets its own instance to modify and hang permission caches on
+            return copy.copy(user)
+        user_cache_requests.inc('miss')
+
+        # Read the token before the row: a change committed in between
+        # replaces it, so the entry can only be cached as already stale
+        versions = _versions()
+        versions.add(_version_key(user_id), uuid.uuid4().hex, None)
+        version = versions.get(_version_key(user_id))
+        user = super().get_user(user_id)
+        if user is not None and version is not None:
+            cache.set(user_id, version, copy.copy(user))
+        return user
@@ -0,0 +1,226 @@
+"""
+Load benchmark harness.
+
+Drives every complaints URL with concurrent clients and reports latency
+percentiles, throughput and database queries per request. Requests go either
+through Django's test client in this process (query counts are captured
+directly) or over HTTP to a running server.
+"""
+import http.cookiejar
+import json
+import math
+import random
+import re
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from dataclasses import dataclass, field
+
+from django.db import connection, connections
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+# Query count reported by RequestMetricsMiddleware
+SERVER_TIMING_QUERIES_RE = re.compile(r'db;dur=[\d.]+;desc="(\d+) queries"')
+
+
+@dataclass
+class Endpoint:
+    name: str
+    method: str
+    path: object  # callable(ticket) -> path
+    payload: object = None  # callable(ticket, sample) -> dict
+    content_type: str = 'application/json'
+
+
+def default_endpoints(assignee_id):
+    """Every URL in ``complaints/urls.py`` except login, register and logout."""
+    statuses = ['pending', 'in_progress', 'resolved']
+    return [
+        Endpoint('dashboard', 'GET', lambda t: reverse('dashboard')),
+        Endpoint('complaints_list', 'GET', lambda t: reverse('complaints_list')),
+        Endpoint('complaints_search', 'GET', lambda t: reverse('complaints_list') + '?search=printer'),
+        Endpoint('complaint_detail', 'GET', lambda t: reverse('complaint_detail', args=[t])),
+        Endpoint('create_complaint_form', 'GET', lambda t: reverse('create_complaint')),
+        Endpoint('api_complaints', 'GET', lambda t: reverse('api_complaints')),
+        Endpoint('api_stats', 'GET', lambda t: reverse('api_stats')),
+        Endpoint('update_status', 'POST', lambda t: reverse('update_status', args=[t]),
+                 lambda t, i: {'status': statuses[i % len(statuses)]}),
+        Endpoint('assign_complaint', 'POST', lambda t: reverse('assign_complaint', args=[t]),
+                 lambda t, i: {'user_id': assignee_id if i % 2 else None}),
+        Endpoint('add_comment', 'POST', lambda t: reverse('add_comment', args=[t]),
+                 lambda t, i: {'comment': f'Benchmark comment {i}'}),
+        Endpoint('create_complaint', 'POST', lambda t: reverse('create_complaint'),
+                 lambda t, i: {'title': f'Benchmark complaint {i}', 'description': 'Created by the benchmark',
+                               'priority': 'medium'},
+                 content_type='multipart/form-data'),
+    ]
+
+
+class InProcessTransport:
+    """Requests through Django's handler stack; one test client per thread."""
+
+    def __init__(self, user):
+        self.user = user
+        self.local = threading.local()
+
+    def client(self):
+        if not hasattr(self.local, 'client'):
+            self.local.client = Client()
+            self.local.client.force_login(self.user)
+        return self.local.client
+
+    def request(self, method, path, payload, content_type):
+        client = self.client()
+        with CaptureQueriesContext(connection) as queries:
+            if method == 'GET':
+                response = client.get(path)
+            elif content_type == 'application/json':
+                response = client.post(path, json.dumps(payload), content_type=content_type)
+            else:
+                response = client.post(path, payload)
+        return response.status_code, len(queries)
+
+    def close(self):
+        connections.close_all()
+
+
+class HTTPTransport:
+    """Requests over HTTP to a running server, logged in with a session cookie.
+
+    Query counts are read from the ``Server-Timing`` header when the server
+    runs ``RequestMetricsMiddleware``.
+    """
+
+    def __init__(self, base_url, username, password):
+        self.base_url = base_url.rstrip('/')
+        self.username = username
+        self.password = password
+        self.local = threading.local()
+
+    def _csrf(self, jar):
+        return next((cookie.value for cookie in jar if cookie.name == 'csrftoken'), '')
+
+    def opener(self):
+        if not hasattr(self.local, 'opener'):
+            jar = http.cookiejar.CookieJar()
+            opener = urllib.request.build_opener(urllib.request.HTTPCookieProcessor(jar))
+            opener.open(self.base_url + reverse('login')).read()
+            body = urllib.parse.urlencode({'username': self.username, 'password': self.password}).encode()
+            request = urllib.request.Request(
+                self.base_url + reverse('login'), data=body,
+                headers={'X-CSRFToken': self._csrf(jar), 'Referer': self.base_url + reverse('login')},
+            )
+            result = json.loads(opener.open(request).read())
+            if not result.get('success'):
+                raise RuntimeError(f"Login failed: {result.get('error')}")
+            self.local.opener, self.local.jar = opener, jar
+        return self.local.opener
+
+    def request(self, method, path, payload, content_type):
+        opener = self.opener()
+        headers = {'X-CSRFToken': self._csrf(self.local.jar), 'Referer': self.base_url + path}
+        data = None
+        if method == 'POST':
+            if content_type == 'application/json':
+                data = json.dumps(payload).encode()
+                headers['Content-Type'] = content_type
+            else:
+                data = urllib.parse.urlencode(payload).encode()
+        request = urllib.request.Request(self.base_url + path, data=data, headers=headers, method=method)
+        try:
+            with opener.open(request) as response:
+                response.read()
+                return response.status, self._queries(response.headers)
+        except urllib.error.HTTPError as error:
+            return error.code, self._queries(error.headers)
+
+    def _queries(self, headers):
+        match = SERVER_TIMING_QUERIES_RE.search(headers.get('Server-Timing', ''))
+        return int(match.group(1)) if match else None
+
+    def close(self):
+        pass
+
+
+@dataclass
+class Result:
+    name: str
+    latencies: list = field(default_factory=list)
+    queries: list = field(default_factory=list)
+    errors: int = 0
+    elapsed: float = 0.0
+
+    def percentile(self, pct):
+        if not self.latencies:
+            return 0.0
+        ordered = sorted(self.latencies)
+        return ordered[max(0, math.ceil(pct / 100 * len(ordered)) - 1)]
+
+    def summary(self):
+        return {
+            'endpoint': self.name,
+            'requests': len(self.latencies),
+            'errors': self.errors,
+            'p50_ms': round(self.percentile(50) * 1000, 2),
+            'p95_ms': round(self.percentile(95) * 1000, 2),
+            'p99_ms': round(self.percentile(99) * 1000, 2),
+            'rps': round(len(self.latencies) / self.elapsed, 1) if self.elapsed else 0.0,
+            'queries': round(sum(self.queries) / len(self.queries), 1) if self.queries else None,
+        }
+
+
+def run_endpoint(transport, endpoint, tickets, requests, concurrency, seed=None):
+    """Fire ``requests`` calls at ``endpoint`` from ``concurrency`` threads."""
+    result = Result(endpoint.name)
+    lock = threading.Lock()
+    counter = iter(range(requests))
+    rng = random.Random(seed)
+    picks = [rng.choice(tickets) for _ in range(requests)]
+
+    def worker():
+        try:
+            while True:
+                with lock:
+                    i = next(counter, None)
+                if i is None:
+                    return
+                ticket = picks[i]
+                payload = endpoint.payload(ticket, i) if endpoint.payload else None
+                started = time.perf_counter()
+                try:
+                    status, queries = transport.request(
+                        endpoint.method, endpoint.path(ticket), payload, endpoint.content_type
+                    )
+                except Exception:
+                    status, queries = 599, None
+                latency = time.perf_counter() - started
+                with lock:
+                    result.latencies.append(latency)
+                    if queries is not None:
+                        result.queries.append(queries)
+                    if status >= 400:
+                        result.errors += 1
+        finally:
+            transport.close()
+
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    result.elapsed = time.perf_counter() - started
+    return result
+
+
+def format_table(summaries):
+    columns = ['endpoint', 'requests', 'errors', 'p50_ms', 'p95_ms', 'p99_ms', 'rps', 'queries']
+    rows = [[str(s[c] if s[c] is not None else '-') for c in columns] for s in summaries]
+    widths = [max(len(c), *(len(r[i]) for r in rows)) if rows else len(c) for i, c in enumerate(columns)]
+    lines = ['  '.join(c.ljust(w) for c, w in zip(columns, widths))]
+    lines += ['  '.join(v.ljust(w) for v, w in zip(row, widths)) for row in rows]
+    return '\n'.join(lines)
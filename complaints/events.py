@@ -0,0 +1,323 @@
+"""
+Live complaint events for the Server-Sent Events streams.
+
+Writes publish small JSON events once their transaction commits (see
+``signals.py`` and ``actions.py``). The stream views subscribe to one
+complaint's channel or to a dashboard scope and forward the events, so the
+detail page and the dashboard patch themselves instead of reloading.
+
+``LocalBroker`` only reaches subscribers in the same process. With several
+server processes, point ``EVENTS_BROKER`` at a class with the same
+``publish``/``subscribe`` interface backed by a shared broker.
+
+Streams are only served by the async views under ASGI (``streams_enabled``).
+Under WSGI each open stream would hold a worker for its whole lifetime, so
+the sync views answer ``204 No Content``, which stops ``EventSource`` from
+reconnecting, and the pages poll the stats API instead.
+"""
+import asyncio
+import json
+import threading
+import time
+from collections import defaultdict, deque
+
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.db import transaction
+from django.http import HttpResponse, StreamingHttpResponse
+from django.utils import dateformat, timezone
+from django.utils.module_loading import import_string
+
+from .stats import get_scope
+
+# Sent instead of events a subscriber can no longer get; clients reload
+RESYNC = {'type': 'resync'}
+
+
+def complaint_channel(ticket_number):
+    return f'complaint:{ticket_number}'
+
+
+def dashboard_channel(scope):
+    return f'dashboard:{scope}'
+
+
+def dashboard_channels(created_by_id):
+    """Dashboard scopes that count a complaint: staff and its creator."""
+    return [dashboard_channel('global'), dashboard_channel(f'user:{created_by_id}')]
+
+
+def channels_for(user, ticket_number=None):
+    """Channels a stream for ``user`` listens on: one complaint, or their dashboard."""
+    if ticket_number:
+        return [complaint_channel(ticket_number)]
+    return [dashboard_channel(get_scope(user))]
+
+
+class Subscription:
+    """Events for one stream, buffered until the stream reads them."""
+
+    def __init__(self, broker, channels, max_pending):
+        self.broker = broker
+        self.channels = channels
+        self.max_pending = max_pending
+        self.pending = deque()
+        self.overflowed = False
+        self.lock = threading.Lock()
+        self.ready = threading.Event()
+        self.loop = None
+        self.async_ready = None
+
+    def put(self, event_id, event):
+        with self.lock:
+            if len(self.pending) >= self.max_pending:
+                # A reader this far behind reloads rather than replaying everything
+                self.pending.clear()
+                self.overflowed = True
+            else:
+                self.pending.append((event_id, event))
+        self.ready.set()
+        if self.loop is not None:
+            try:
+                self.loop.call_soon_threadsafe(self.async_ready.set)
+            except RuntimeError:
+                pass  # The stream's event loop is gone
+
+    def drain(self):
+        with self.lock:
+            if self.overflowed:
+                events = [(None, RESYNC)]
+                self.overflowed = False
+            else:
+                events = list(self.pending)
+            self.pending.clear()
+            self.ready.clear()
+            if self.async_ready is not None:
+                self.async_ready.clear()
+        return events
+
+    def get(self, timeout):
+        """Wait up to ``timeout`` seconds for events; returns ``[(id, event), ...]``."""
+        self.ready.wait(timeout)
+        return self.drain()
+
+    async def aget(self, timeout):
+        if self.loop is None:
+            self.loop = asyncio.get_running_loop()
+            self.async_ready = asyncio.Event()
+            if self.ready.is_set():
+                self.async_ready.set()
+        try:
+            await asyncio.wait_for(self.async_ready.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        return self.drain()
+
+    def close(self):
+        self.broker.unsubscribe(self)
+
+
+class LocalBroker:
+    """In-process pub/sub keeping the last ``EVENTS_REPLAY_SIZE`` events for reconnects."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.subscribers = defaultdict(set)
+        self.last_id = 0
+        self.recent = deque(maxlen=getattr(settings, 'EVENTS_REPLAY_SIZE', 1000))
+        self.max_pending = getattr(settings, 'EVENTS_MAX_PENDING', 1000)
+
+    def publish(self, channels, event):
+        with self.lock:
+            self.last_id += 1
+            event_id = self.last_id
+            self.recent.append((event_id, channels, event))
+            targets = set()
+            for channel in channels:
+                targets.update(self.subscribers.get(channel, ()))
+        for subscription in targets:
+            subscription.put(event_id, event)
+        return event_id
+
+    def subscribe(self, channels, last_event_id=None):
+        """Start buffering events on ``channels``.
+
+        With ``last_event_id`` (from a reconnecting ``EventSource``) the events
+        published since are queued first, or a resync if they're no longer kept.
+        """
+        subscription = Subscription(self, channels, self.max_pending)
+        with self.lock:
+            for channel in channels:
+                self.subscribers[channel].add(subscription)
+            if last_event_id is not None and last_event_id != self.last_id:
+                oldest = self.recent[0][0] if self.recent else self.last_id + 1
+                if last_event_id > self.last_id or last_event_id < oldest - 1:
+                    subscription.overflowed = True
+                    subscription.ready.set()
+                else:
+                    for event_id, event_channels, event in self.recent:
+                        if event_id > last_event_id and not set(event_channels).isdisjoint(channels):
+                            subscription.put(event_id, event)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self.lock:
+            for channel in subscription.channels:
+                subscribers = self.subscribers.get(channel)
+                if subscribers is not None:
+                    subscribers.discard(subscription)
+                    if not subscribers:
+                        del self.subscribers[channel]
+
+
+_broker = None
+_broker_lock = threading.Lock()
+
+
+def get_broker():
+    global _broker
+    if _broker is None:
+        with _broker_lock:
+            if _broker is None:
+                _broker = import_string(getattr(settings, 'EVENTS_BROKER', 'complaints.events.LocalBroker'))()
+    return _broker
+
+
+def publish(channels, event):
+    """Publish ``event`` once the current transaction commits."""
+    transaction.on_commit(lambda: get_broker().publish(channels, event))
+
+
+def _display_name(user):
+    if user is None:
+        return 'System'
+    return user.get_full_name() or user.username
+
+
+def _timestamp(value):
+    return dateformat.format(timezone.localtime(value), 'M d, Y H:i')
+
+
+def history_event(entry, changed_by):
+    return {
+        'id': entry.pk,
+        'changed_by': _display_name(changed_by),
+        'field_name': entry.field_name,
+        'old_value': entry.old_value,
+        'new_value': entry.new_value,
+        'changed_at': _timestamp(entry.changed_at),
+    }
+
+
+def publish_status(complaint, entry, changed_by):
+    """Status change: patches the detail page and moves the dashboard counters."""
+    publish([complaint_channel(complaint.ticket_number)] + dashboard_channels(complaint.created_by_id), {
+        'type': 'status',
+        'ticket_number': complaint.ticket_number,
+        'status': complaint.status,
+        'status_display': complaint.get_status_display(),
+        'old_status': entry.old_value,
+        'priority': complaint.priority,
+        'resolution_notes': complaint.resolution_notes,
+        'history': history_event(entry, changed_by),
+    })
+
+
+def publish_assignment(complaint, entry, changed_by):
+    publish([complaint_channel(complaint.ticket_number)], {
+        'type': 'assignment',
+        'ticket_number': complaint.ticket_number,
+        'assigned_to': _display_name(complaint.assigned_to) if complaint.assigned_to_id else 'Unassigned',
+        'history': history_event(entry, changed_by),
+    })
+
+
+def publish_comment(comment):
+    publish([complaint_channel(comment.complaint.ticket_number)], {
+        'type': 'comment',
+        'ticket_number': comment.complaint.ticket_number,
+        'staff_only': comment.is_internal,
+        'comment': {
+            'id': comment.id,
+            'comment': comment.comment,
+            'user': comment.user.username,
+            'created_at': _timestamp(comment.created_at),
+            'is_internal': comment.is_internal,
+        },
+    })
+
+
+def publish_created(complaint):
+    publish(dashboard_channels(complaint.created_by_id), {
+        'type': 'created',
+        'ticket_number': complaint.ticket_number,
+        'title': complaint.title,
+        'status': complaint.status,
+        'status_display': complaint.get_status_display(),
+        'priority': complaint.priority,
+        'priority_display': complaint.get_priority_display(),
+        'created_at': dateformat.format(timezone.localtime(complaint.created_at), 'M d, Y'),
+    })
+
+
+def publish_deleted(complaint):
+    publish(dashboard_channels(complaint.created_by_id), {
+        'type': 'deleted',
+        'ticket_number': complaint.ticket_number,
+        'status': complaint.status,
+        'priority': complaint.priority,
+    })
+
+
+def _message(event_id, event):
+    lines = [] if event_id is None else [f'id: {event_id}']
+    lines += [f"event: {event['type']}", f'data: {json.dumps(event)}']
+    return '\n'.join(lines) + '\n\n'
+
+
+def _stream_settings():
+    return (
+        getattr(settings, 'SSE_HEARTBEAT_SECONDS', 15),
+        time.monotonic() + getattr(settings, 'SSE_MAX_STREAM_SECONDS', 300),
+    )
+
+
+async def astream(subscription, is_staff):
+    """SSE body for ASGI; waiting streams cost no thread."""
+    heartbeat, deadline = _stream_settings()
+    try:
+        yield f"retry: {getattr(settings, 'SSE_RETRY_MS', 3000)}\n\n"
+        while time.monotonic() < deadline:
+            events = await subscription.aget(min(heartbeat, max(deadline - time.monotonic(), 0)))
+            if not events:
+                yield ': keepalive\n\n'
+            for event_id, event in events:
+                if is_staff or not event.get('staff_only'):
+                    yield _message(event_id, event)
+    finally:
+        subscription.close()
+
+
+def last_event_id(request):
+    try:
+        return int(request.headers.get('Last-Event-ID', ''))
+    except ValueError:
+        return None
+
+
+def streams_enabled(request):
+    """Whether ``request`` can hold an event stream: async views under ASGI only."""
+    return getattr(settings, 'ASYNC_API_VIEWS', False) and isinstance(request, ASGIRequest)
+
+
+def no_stream_response():
+    # EventSource gives up on 204 instead of reconnecting
+    return HttpResponse(status=204)
+
+
+def event_stream_response(content):
+    response = StreamingHttpResponse(content, content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    # Keeps nginx from buffering the stream
+    response['X-Accel-Buffering'] = 'no'
+    return response
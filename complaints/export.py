@@ -0,0 +1,178 @@
+"""
+Streaming complaint exports.
+
+Rows are read in fixed-size chunks over a joined ``values()`` projection and
+written out as they arrive, so an export of millions of complaints keeps
+memory flat and the first bytes go out before the last rows are read.
+Under ASGI the response needs an async iterator (``aiter_export``): Django
+would read a sync one into a list before sending anything.
+
+CSV cells starting with ``=``, ``+``, ``-`` or ``@`` get a leading ``'`` so
+spreadsheets don't run user-entered text as a formula.
+"""
+import csv
+import heapq
+import json
+from operator import itemgetter
+
+from asgiref.sync import sync_to_async
+from django.db import connections
+
+from . import sharding
+from .routers import reporting_db
+from .search import search_complaints
+
+EXPORT_COLUMNS = [
+    ('ticket_number', 'ticket_number'),
+    ('title', 'title'),
+    ('description', 'description'),
+    ('category', 'category__name'),
+    ('status', 'status'),
+    ('priority', 'priority'),
+    ('created_by', 'created_by__username'),
+    ('created_by_email', 'created_by__email'),
+    ('assigned_to', 'assigned_to__username'),
+    ('created_at', 'created_at'),
+    ('updated_at', 'updated_at'),
+    ('resolved_at', 'resolved_at'),
+    ('resolution_notes', 'resolution_notes'),
+    ('location', 'location'),
+    ('contact_email', 'contact_email'),
+    ('contact_phone', 'contact_phone'),
+]
+
+# Characters that make a spreadsheet treat a cell as a formula
+FORMULA_PREFIXES = ('=', '+', '-', '@', '\t', '\r')
+
+FORMATS = {
+    'csv': 'text/csv; charset=utf-8',
+    'jsonl': 'application/x-ndjson',
+}
+
+
+def filter_complaints(queryset, user=None, status='', priority='', archived=False):
+    """Apply the ``complaints_list`` scoping and filters to ``queryset``.
+
+    Non-staff users only see their own complaints; ``user=None`` means no
+    scoping (management commands). Archived complaints are only included
+    with ``archived``.
+    """
+    if archived:
+        queryset = queryset.with_archived()
+    if user is not None and not user.is_staff:
+        queryset = queryset.filter(created_by=user)
+    if status:
+        queryset = queryset.filter(status=status)
+    if priority:
+        queryset = queryset.filter(priority=priority)
+    return queryset
+
+
+def iter_rows(queryset, chunk_size=2000):
+    """Yield projected export rows in primary key order, ``chunk_size`` at a time.
+
+    Sharded complaints are read from every shard at once and merged by id.
+    """
+    shards = sharding.querysets(queryset)
+    if len(shards) > 1:
+        yield from heapq.merge(*(_iter_rows(shard, chunk_size) for shard in shards), key=itemgetter('id'))
+    else:
+        yield from _iter_rows(queryset, chunk_size)
+
+
+def _iter_rows(queryset, chunk_size):
+    rows = queryset.order_by('id').values('id', *(field for _, field in EXPORT_COLUMNS))
+    if connections[queryset.db].vendor != 'mysql':
+        yield from rows.iterator(chunk_size=chunk_size)
+        return
+    # mysqlclient buffers the whole result set client-side, so walk the
+    # primary key in bounded slices instead
+    last_id = 0
+    while True:
+        chunk = list(rows.filter(id__gt=last_id)[:chunk_size])
+        yield from chunk
+        if len(chunk) < chunk_size:
+            return
+        last_id = chunk[-1]['id']
+
+
+def export_queryset(queryset, search=''):
+    """Point ``queryset`` at the reporting database and narrow it by a search query.
+
+    The database is picked first: a full ticket number pins the search to
+    its shard. Export order is by id, not rank.
+    """
+    queryset = queryset.using(reporting_db())
+    return search_complaints(queryset, search, ranked=False) if search else queryset
+
+
+class _Echo:
+    """File-like object whose ``write`` hands back the line for streaming."""
+
+    def write(self, value):
+        return value
+
+
+def _format_value(value):
+    if value is None:
+        return ''
+    if hasattr(value, 'isoformat'):
+        return value.isoformat()
+    return value
+
+
+def _csv_value(value):
+    value = _format_value(value)
+    if isinstance(value, str) and value.startswith(FORMULA_PREFIXES):
+        return "'" + value
+    return value
+
+
+def iter_csv(rows):
+    writer = csv.writer(_Echo())
+    yield writer.writerow([name for name, _ in EXPORT_COLUMNS])
+    for row in rows:
+        yield writer.writerow([_csv_value(row[field]) for _, field in EXPORT_COLUMNS])
+
+
+def iter_jsonl(rows):
+    for row in rows:
+        record = {
+            name: row[field].isoformat() if hasattr(row[field], 'isoformat') else row[field]
+            for name, field in EXPORT_COLUMNS
+        }
+        yield json.dumps(record, ensure_ascii=False) + '\n'
+
+
+def _buffered(lines, size=64 * 1024):
+    """Join lines into blocks of about ``size`` characters; one write per block."""
+    block, length = [], 0
+    for line in lines:
+        block.append(line)
+        length += len(line)
+        if length >= size:
+            yield ''.join(block)
+            block, length = [], 0
+    if block:
+        yield ''.join(block)
+
+
+def iter_export(queryset, fmt, chunk_size=2000):
+    """Yield the export of ``queryset`` in ``fmt`` ('csv' or 'jsonl') as text blocks."""
+    rows = iter_rows(queryset, chunk_size)
+    return _buffered(iter_csv(rows) if fmt == 'csv' else iter_jsonl(rows))
+
+
+async def aiter_export(queryset, fmt, chunk_size=2000):
+    """``iter_export`` for ASGI responses; each block is read in the sync thread."""
+    blocks = iter_export(queryset, fmt, chunk_size)
+    read = sync_to_async(next)
+    try:
+        while True:
+            # StopIteration can't cross sync_to_async, hence the default
+            block = await read(blocks, None)
+            if block is None:
+                return
+            yield block
+    finally:
+        await sync_to_async(blocks.close)()
@@ -0,0 +1,15 @@
+from django.db import models
+
+
+class FullTextDocumentField(models.TextField):
+    """The hidden FTS5 column named after its table; only usable with ``__match``."""
+
+
+@FullTextDocumentField.register_lookup
+class FullTextMatch(models.Lookup):
+    lookup_name = 'match'
+
+    def as_sql(self, compiler, connection):
+        lhs, lhs_params = self.process_lhs(compiler, connection)
+        rhs, rhs_params = self.process_rhs(compiler, connection)
+        return f'{lhs} MATCH {rhs}', lhs_params + rhs_params
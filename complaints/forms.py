@@ -43,3 +43,15 @@ class ComplaintForm(forms.ModelForm):
             'contact_phone': forms.TextInput(attrs={'class': 'form-control'}),
             'attachment': forms.FileInput(attrs={'class': 'form-control'}),
         }
+
+
+class ComplaintImportForm(ComplaintForm):
+    """``ComplaintForm`` rules for imported rows.
+
+    Category and users are resolved by the importer from cached lookups
+    instead of one query per row.
+    """
+    category = None
+
+    class Meta(ComplaintForm.Meta):
+        fields = ['title', 'description', 'priority', 'location', 'contact_email', 'contact_phone']
@@ -0,0 +1,179 @@
+"""
+Versioned cache for rendered template fragments.
+
+Templates wrap complaint rows and detail panels in ``{% fragment %}`` (see
+``templatetags/fragments.py``). Each fragment has one slot per complaint and
+variant, holding the HTML together with the version it was rendered from:
+``updated_at`` for rows and the main panel, the latest comment or history id
+for those lists. A changed version is a miss and overwrites the slot, so
+writes that skip signals (bulk updates) can't serve stale HTML, and each
+fragment takes one slot no matter how often it changes.
+
+Slots are kept per process in LRU order within ``FRAGMENT_CACHE_MAX_BYTES``.
+Edits that leave the version alone (a comment edited or deleted, a user or
+category renamed) are caught with generation tokens in
+``FRAGMENT_CACHE_ALIAS``: one per complaint and one for every fragment. The
+signals in ``signals.py`` replace the tokens once the transaction commits and
+each slot remembers the ones it was rendered under, so every process renders
+those fragments again on its next lookup. That cache must be shared between
+processes for this to reach all of them.
+"""
+import sys
+import threading
+import uuid
+from collections import OrderedDict, defaultdict
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+
+from . import metrics
+
+fragment_requests = metrics.registry.register(metrics.Counter(
+    'complaints_fragment_cache_requests_total', 'Fragment cache lookups by fragment and result (hit/miss).',
+    ('fragment', 'result'),
+))
+
+
+class FragmentCache:
+    """LRU of ``key -> (version, html)`` bounded by approximate size in bytes.
+
+    ``key`` is ``(fragment name, complaint id, *variant)``; the complaint id
+    groups the slots that ``invalidate`` drops together.
+    """
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.groups = defaultdict(set)
+        self.size = 0
+        self.lock = threading.Lock()
+
+    def get(self, key, version):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None or entry[0] != version:
+                return None
+            self.entries.move_to_end(key)
+            return entry[1]
+
+    def set(self, key, version, html):
+        size = sys.getsizeof(html)
+        if size > self.max_bytes:
+            return
+        with self.lock:
+            self._discard(key)
+            self.entries[key] = (version, html)
+            self.groups[key[1]].add(key)
+            self.size += size
+            while self.size > self.max_bytes:
+                self._discard(next(iter(self.entries)))
+
+    def _discard(self, key):
+        entry = self.entries.pop(key, None)
+        if entry is None:
+            return
+        self.size -= sys.getsizeof(entry[1])
+        group = self.groups[key[1]]
+        group.discard(key)
+        if not group:
+            del self.groups[key[1]]
+
+    def invalidate(self, group_ids):
+        with self.lock:
+            for group_id in group_ids:
+                for key in list(self.groups.get(group_id, ())):
+                    self._discard(key)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.groups.clear()
+            self.size = 0
+
+
+cache = FragmentCache(getattr(settings, 'FRAGMENT_CACHE_MAX_BYTES', 32 * 1024 * 1024))
+
+
+GLOBAL_GENERATION_KEY = 'fragments:generation'
+
+
+def _generation_key(complaint_id):
+    return f'fragments:generation:{complaint_id}'
+
+
+def _generations():
+    return caches[getattr(settings, 'FRAGMENT_CACHE_ALIAS', 'default')]
+
+
+def generations(complaint_id):
+    """The global and per-complaint generation tokens a fragment is rendered under.
+
+    Read before rendering: a change committed in between replaces a token,
+    so the slot can only be stored as already stale.
+    """
+    keys = [GLOBAL_GENERATION_KEY, _generation_key(complaint_id)]
+    shared = _generations()
+    tokens = shared.get_many(keys)
+    if len(tokens) < len(keys):
+        # A missing token (evicted or never set) can't vouch for any slot
+        for key in keys:
+            shared.add(key, uuid.uuid4().hex, None)
+        tokens = shared.get_many(keys)
+    return tuple(tokens.get(key) for key in keys)
+
+
+def lookup(name, key, version):
+    """The cached HTML of ``key`` and the version to store a fresh render under."""
+    if not cache.max_bytes:
+        return None, version
+    version = (version, *generations(key[1]))
+    html = cache.get(key, version)
+    fragment_requests.inc(name, 'miss' if html is None else 'hit')
+    return html, version
+
+
+def store(key, version, html):
+    if cache.max_bytes and None not in version:
+        cache.set(key, version, html)
+
+
+def invalidate(complaint_ids):
+    """Drop the fragments of ``complaint_ids`` in every process once the current transaction commits."""
+    complaint_ids = list(complaint_ids)
+
+    def bump():
+        _generations().set_many({_generation_key(pk): uuid.uuid4().hex for pk in complaint_ids}, None)
+        cache.invalidate(complaint_ids)
+    transaction.on_commit(bump)
+
+
+def invalidate_all():
+    """For changes every fragment may show (user names, category names)."""
+    def bump():
+        _generations().set(GLOBAL_GENERATION_KEY, uuid.uuid4().hex, None)
+        cache.clear()
+    transaction.on_commit(bump)
+
+
+def hit_ratio():
+    hits, lookups = defaultdict(float), defaultdict(float)
+    for (name, result), count in fragment_requests.values().items():
+        lookups[name] += count
+        if result == 'hit':
+            hits[name] += count
+    return {(name,): hits[name] / total for name, total in lookups.items() if total}
+
+
+metrics.registry.register(metrics.Gauge(
+    'complaints_fragment_cache_hit_ratio', 'Share of fragment lookups served from cache since start.', ('fragment',),
+    callback=hit_ratio,
+))
+metrics.registry.register(metrics.Gauge(
+    'complaints_fragment_cache_bytes', 'Approximate size of the cached fragments.',
+    callback=lambda: {(): cache.size},
+))
+metrics.registry.register(metrics.Gauge(
+    'complaints_fragment_cache_entries', 'Fragments in the cache.',
+    callback=lambda: {(): len(cache.entries)},
+))
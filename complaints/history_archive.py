@@ -0,0 +1,258 @@
+"""
+Archival of old complaint history.
+
+Every create, status change and reassignment adds a ``ComplaintHistory``
+row, and nothing ever removes them. Entries older than
+``HISTORY_RETENTION_DAYS`` are moved out of the table into segment files
+under ``HISTORY_ARCHIVE_DIR``, so the table and its indexes only hold the
+history people actually look at.
+
+Each batch writes one new segment: a run of zlib-compressed blocks, one per
+complaint, each holding that complaint's entries as JSON lines. A
+``HistoryArchiveBlock`` row per block indexes it by complaint (on the
+complaint's shard), so a complaint's archived history costs one indexed
+query and a seek plus a small decompress per block. Segment files are
+written once and never modified.
+
+The segment is synced to disk before the batch's transaction deletes the
+rows and inserts the index rows, so a crash loses nothing; at worst it
+leaves a segment no index row points to, which ``archive_history --prune``
+deletes (as it does segments whose complaints have all been deleted). If
+another worker archived some of the same rows first, the delete comes up
+short and the batch is rolled back and its segment removed.
+
+Batches take the oldest rows first, so a complaint's archived entries are
+always older than the ones still in the table. The detail page shows the
+latest entries from the table and fetches older ones, from the table or
+the archive, through ``older_history`` when the user asks for them.
+"""
+import json
+import os
+import time
+import uuid
+import zlib
+from datetime import timedelta
+from operator import attrgetter
+from pathlib import Path
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from . import sharding
+from .jobs import periodic
+from .models import ComplaintHistory, HistoryArchiveBlock
+
+# Stored per entry, in this order; the complaint id is on the index row
+ENTRY_FIELDS = ['id', 'changed_by_id', 'field_name', 'old_value', 'new_value', 'changed_at']
+SEGMENT_SUFFIX = '.seg'
+
+
+class ArchiveConflict(Exception):
+    """Some of a batch's rows were archived or deleted by someone else first."""
+
+
+def archive_dir():
+    return Path(getattr(settings, 'HISTORY_ARCHIVE_DIR', settings.BASE_DIR / 'archive' / 'history'))
+
+
+def retention_cutoff(days=None):
+    if days is None:
+        days = getattr(settings, 'HISTORY_RETENTION_DAYS', 365)
+    return timezone.now() - timedelta(days=days)
+
+
+def _encode(rows):
+    lines = []
+    for row in rows:
+        values = [row[field] for field in ENTRY_FIELDS]
+        values[-1] = values[-1].isoformat()
+        lines.append(json.dumps(values))
+    return zlib.compress('\n'.join(lines).encode())
+
+
+def _write_segment(blocks):
+    """Write the compressed ``blocks`` to a new segment file; returns its name and their offsets."""
+    directory = archive_dir()
+    directory.mkdir(parents=True, exist_ok=True)
+    name = f"{timezone.now():%Y%m%dT%H%M%S}-{uuid.uuid4().hex[:12]}{SEGMENT_SUFFIX}"
+    temporary = directory / (name + '.tmp')
+    offsets = []
+    with open(temporary, 'wb') as segment:
+        for data in blocks:
+            offsets.append(segment.tell())
+            segment.write(data)
+        segment.flush()
+        os.fsync(segment.fileno())
+    os.replace(temporary, directory / name)
+    return name, offsets
+
+
+def archive_batch(alias, cutoff, batch_size):
+    """Archive the oldest ``batch_size`` entries before ``cutoff`` on ``alias``; returns how many."""
+    rows = list(
+        ComplaintHistory.objects.using(alias)
+        .filter(changed_at__lt=cutoff)
+        .order_by('changed_at', 'id')
+        .values('complaint_id', *ENTRY_FIELDS)[:batch_size]
+    )
+    if not rows:
+        return 0
+    by_complaint = {}
+    for row in rows:
+        by_complaint.setdefault(row['complaint_id'], []).append(row)
+    complaint_ids = sorted(by_complaint)
+    blocks = [_encode(by_complaint[complaint_id]) for complaint_id in complaint_ids]
+    name, offsets = _write_segment(blocks)
+    try:
+        with transaction.atomic(using=alias):
+            deleted, _ = ComplaintHistory.objects.using(alias).filter(
+                id__in=[row['id'] for row in rows]
+            ).delete()
+            if deleted != len(rows):
+                raise ArchiveConflict(f'{len(rows) - deleted} of {len(rows)} rows already gone')
+            HistoryArchiveBlock.objects.using(alias).bulk_create([
+                HistoryArchiveBlock(
+                    complaint_id=complaint_id,
+                    segment=name,
+                    offset=offset,
+                    length=len(data),
+                    entry_count=len(by_complaint[complaint_id]),
+                    first_changed_at=by_complaint[complaint_id][0]['changed_at'],
+                    last_changed_at=by_complaint[complaint_id][-1]['changed_at'],
+                )
+                for complaint_id, offset, data in zip(complaint_ids, offsets, blocks)
+            ])
+    except BaseException:
+        (archive_dir() / name).unlink(missing_ok=True)
+        raise
+    return len(rows)
+
+
+def archive_history(cutoff=None, batch_size=None, max_batches=None):
+    """Archive history older than ``cutoff`` on every database holding it; returns how many.
+
+    ``max_batches`` limits the batches per database, for callers that
+    should only take a bounded slice of time.
+    """
+    if cutoff is None:
+        cutoff = retention_cutoff()
+    if batch_size is None:
+        batch_size = getattr(settings, 'HISTORY_ARCHIVE_BATCH_SIZE', 5000)
+    total = 0
+    for alias in sharding.complaint_databases(archived=True):
+        batches = 0
+        while max_batches is None or batches < max_batches:
+            try:
+                archived = archive_batch(alias, cutoff, batch_size)
+            except ArchiveConflict:
+                # Someone else is archiving this database; leave it to them
+                break
+            total += archived
+            batches += 1
+            if archived < batch_size:
+                break
+    return total
+
+
+@periodic
+def archive_old_history():
+    """Archive one batch of expired history per database; backlogs shrink a batch per round."""
+    if not getattr(settings, 'HISTORY_RETENTION_DAYS', 365):
+        return 0
+    return archive_history(max_batches=1)
+
+
+def remove_orphan_segments(min_age=3600):
+    """Delete segment files no index row points to; returns how many.
+
+    Files younger than ``min_age`` seconds are left alone, since a running
+    batch writes its segment before committing the index rows.
+    """
+    directory = archive_dir()
+    if not directory.is_dir():
+        return 0
+    referenced = set()
+    for alias in sharding.complaint_databases(archived=True):
+        referenced.update(
+            HistoryArchiveBlock.objects.using(alias).order_by().values_list('segment', flat=True).distinct()
+        )
+    cutoff = time.time() - min_age
+    removed = 0
+    for path in directory.iterdir():
+        if path.name in referenced or not path.name.endswith((SEGMENT_SUFFIX, SEGMENT_SUFFIX + '.tmp')):
+            continue
+        if path.stat().st_mtime < cutoff:
+            path.unlink(missing_ok=True)
+            removed += 1
+    return removed
+
+
+def _read_blocks(blocks):
+    """Yield the entries of ``blocks``, oldest first within each block.
+
+    Consecutive blocks in the same segment share one open file.
+    """
+    name = segment = None
+    try:
+        for block in blocks:
+            if block.segment != name:
+                if segment is not None:
+                    segment.close()
+                name, segment = block.segment, open(archive_dir() / block.segment, 'rb')
+            segment.seek(block.offset)
+            for line in zlib.decompress(segment.read(block.length)).decode().splitlines():
+                values = dict(zip(ENTRY_FIELDS, json.loads(line)))
+                values['changed_at'] = parse_datetime(values['changed_at'])
+                yield ComplaintHistory(complaint_id=block.complaint_id, **values)
+    finally:
+        if segment is not None:
+            segment.close()
+
+
+def archived_history(complaint):
+    """Unsaved ``ComplaintHistory`` instances for ``complaint``'s archived entries, newest first."""
+    entries = list(_read_blocks(complaint.archived_history.order_by('segment', 'offset')))
+    entries.sort(key=attrgetter('changed_at', 'id'), reverse=True)
+    return entries
+
+
+def iter_archived(alias, field_name=None):
+    """Yield every archived entry on ``alias``, each complaint's oldest first (rebuilds)."""
+    # Batches go oldest first, and within one the blocks were inserted in file order
+    blocks = HistoryArchiveBlock.objects.using(alias).order_by('id')
+    for entry in _read_blocks(blocks.iterator()):
+        if field_name is None or entry.field_name == field_name:
+            yield entry
+
+
+def older_history(complaint, before_id=None, limit=50):
+    """Up to ``limit`` history entries of ``complaint`` older than entry ``before_id``.
+
+    Entries come newest first, from the table and then from the archive;
+    returns ``(entries, has_more)``. Archived entries are unsaved instances.
+    """
+    anchor = archived = None
+    if before_id is not None:
+        anchor = complaint.history.filter(id=before_id).values_list('changed_at', 'id').first()
+        if anchor is None:
+            archived = archived_history(complaint)
+            anchor = next(((e.changed_at, e.id) for e in archived if e.id == before_id), None)
+            if anchor is None:
+                return [], False
+    recent = complaint.history.order_by('-changed_at', '-id')
+    if anchor is not None:
+        recent = recent.filter(Q(changed_at__lt=anchor[0]) | Q(changed_at=anchor[0], id__lt=anchor[1]))
+    entries = list(recent[:limit + 1])
+    if len(entries) <= limit:
+        if archived is None:
+            archived = archived_history(complaint)
+        # An entry archived between the two reads shows up in both
+        seen = {entry.id for entry in entries}
+        entries += [
+            entry for entry in archived
+            if entry.id not in seen and (anchor is None or (entry.changed_at, entry.id) < anchor)
+        ]
+    return entries[:limit], len(entries) > limit
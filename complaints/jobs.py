@@ -0,0 +1,266 @@
+"""
+Database-backed job queue with a transactional outbox.
+
+Side effects that don't need to finish before the response (rollups,
+thumbnails, ...) are registered with ``@job`` and queued with ``enqueue``.
+The job row is inserted on the caller's connection, so it commits or rolls
+back together with the change that caused it. ``manage.py run_worker``
+claims due jobs, runs each handler in a transaction together with marking
+the job done, and retries failures with exponential backoff.
+
+Claiming uses a conditional UPDATE instead of ``SELECT ... FOR UPDATE SKIP
+LOCKED`` so the same code works on SQLite and MySQL.
+"""
+import logging
+import os
+import random
+import socket
+import time
+import uuid
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, F, Min
+from django.utils import timezone
+
+from . import metrics
+from .models import Job
+
+logger = logging.getLogger(__name__)
+
+PENDING = 'pending'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+
+# name -> (handler, max concurrent runs across all workers or None)
+registry = {}
+
+# Maintenance functions every worker runs once per housekeeping interval
+housekeeping = []
+
+
+def job(name, concurrency=None):
+    """Register ``func`` as the handler of jobs called ``name``; payload keys become kwargs."""
+    def decorator(func):
+        registry[name] = (func, concurrency)
+        func.job_name = name
+        return func
+    return decorator
+
+
+def periodic(func):
+    """Run ``func`` from the workers' housekeeping alongside the queue's own cleanup."""
+    housekeeping.append(func)
+    return func
+
+
+def enqueue(name, payload=None, delay=0, max_attempts=None, using=None):
+    """Queue a job in the current transaction.
+
+    With ``JOBS_EAGER`` the handler runs in-process once the transaction
+    commits instead; handy for development without a worker.
+    """
+    if name not in registry:
+        raise ValueError(f'Unknown job {name!r}')
+    payload = payload or {}
+    if getattr(settings, 'JOBS_EAGER', False):
+        handler = registry[name][0]
+        transaction.on_commit(lambda: handler(**payload), using=using)
+        return None
+    return Job.objects.using(using).create(
+        name=name,
+        payload=payload,
+        run_after=timezone.now() + timedelta(seconds=delay),
+        max_attempts=max_attempts or getattr(settings, 'JOB_MAX_ATTEMPTS', 5),
+    )
+
+
+def backoff(attempts):
+    """Seconds to wait before retry number ``attempts``: doubling, capped, with jitter."""
+    base = getattr(settings, 'JOB_RETRY_BACKOFF', 5)
+    delay = min(base * 2 ** (attempts - 1), getattr(settings, 'JOB_RETRY_BACKOFF_MAX', 3600))
+    return delay * random.uniform(0.5, 1.5)
+
+
+def claim(worker_id, limit=1, names=None):
+    """Lock up to ``limit`` due jobs for ``worker_id`` and return them."""
+    now = timezone.now()
+    due = Job.objects.filter(status=PENDING, run_after__lte=now)
+    if names:
+        due = due.filter(name__in=names)
+    candidates = list(due.order_by('run_after', 'id').values_list('id', 'name')[:limit * 5])
+    if not candidates:
+        return []
+
+    limited = {name for _, name in candidates if registry.get(name, (None, None))[1]}
+    running = {}
+    if limited:
+        running = dict(
+            Job.objects.filter(status=RUNNING, name__in=limited)
+            .values_list('name').annotate(count=Count('id')).order_by()
+        )
+    chosen = []
+    for job_id, name in candidates:
+        if name not in registry:
+            continue
+        concurrency = registry[name][1]
+        if concurrency is not None:
+            if running.get(name, 0) >= concurrency:
+                continue
+            running[name] = running.get(name, 0) + 1
+        chosen.append(job_id)
+        if len(chosen) >= limit:
+            break
+    if not chosen:
+        return []
+
+    # Only rows still pending switch over; other workers keep the rest
+    Job.objects.filter(id__in=chosen, status=PENDING).update(
+        status=RUNNING, locked_by=worker_id, locked_at=now,
+    )
+    return list(Job.objects.filter(id__in=chosen, status=RUNNING, locked_by=worker_id))
+
+
+class LostClaim(Exception):
+    """The job was requeued as stale and may be running on another worker."""
+
+
+def run(job_row):
+    """Run one claimed job and record the outcome; returns True on success."""
+    handler = registry[job_row.name][0]
+    # Only while this worker still holds the claim
+    claimed = Job.objects.filter(pk=job_row.pk, status=RUNNING, locked_by=job_row.locked_by)
+    try:
+        with transaction.atomic():
+            handler(**job_row.payload)
+            if not claimed.update(
+                status=DONE, attempts=job_row.attempts + 1, finished_at=timezone.now(), last_error='',
+            ):
+                # Roll the handler's writes back; whoever holds the job now runs it
+                raise LostClaim
+        return True
+    except LostClaim:
+        logger.warning('Job %s #%s was requeued while running; discarded this run', job_row.name, job_row.pk)
+        return False
+    except Exception as e:
+        attempts = job_row.attempts + 1
+        error = f'{type(e).__name__}: {e}'
+        if attempts >= job_row.max_attempts:
+            logger.exception('Job %s #%s failed for good after %d attempts', job_row.name, job_row.pk, attempts)
+            claimed.update(
+                status=FAILED, attempts=attempts, last_error=error, finished_at=timezone.now(),
+            )
+        else:
+            logger.warning('Job %s #%s failed (attempt %d): %s', job_row.name, job_row.pk, attempts, error)
+            claimed.update(
+                status=PENDING, attempts=attempts, last_error=error, locked_by='',
+                run_after=timezone.now() + timedelta(seconds=backoff(attempts)),
+            )
+        return False
+
+
+def requeue_stale():
+    """Put jobs back whose worker died while running them; returns how many.
+
+    The lost run counts as an attempt, so a job that keeps killing its
+    worker (out of memory, a crashing extension) ends up failed.
+    """
+    now = timezone.now()
+    cutoff = now - timedelta(seconds=getattr(settings, 'JOB_LOCK_TIMEOUT', 300))
+    stale = Job.objects.filter(status=RUNNING, locked_at__lt=cutoff)
+    error = 'Worker stopped responding while running the job'
+    exhausted = stale.filter(attempts__gte=F('max_attempts') - 1).update(
+        status=FAILED, attempts=F('attempts') + 1, last_error=error, locked_by='', finished_at=now,
+    )
+    requeued = stale.update(status=PENDING, attempts=F('attempts') + 1, last_error=error, locked_by='')
+    return exhausted + requeued
+
+
+def purge_finished():
+    """Delete done jobs past ``JOB_RETENTION_HOURS``; failed ones stay for inspection."""
+    cutoff = timezone.now() - timedelta(hours=getattr(settings, 'JOB_RETENTION_HOURS', 24))
+    deleted, _ = Job.objects.filter(status=DONE, finished_at__lt=cutoff).delete()
+    return deleted
+
+
+class Worker:
+    """Claims and runs jobs until ``stop()`` is called."""
+
+    housekeeping_interval = 60
+
+    def __init__(self, names=None, batch_size=5, poll_interval=None):
+        self.names = names
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval or getattr(settings, 'JOB_POLL_INTERVAL', 1.0)
+        self.worker_id = f'{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}'
+        self.stopping = False
+        self.processed = 0
+        self.failed = 0
+
+    def stop(self, *args):
+        self.stopping = True
+
+    def run(self, once=False):
+        """Process jobs; with ``once`` return as soon as nothing is due."""
+        last_housekeeping = 0
+        while not self.stopping:
+            if time.monotonic() - last_housekeeping > self.housekeeping_interval:
+                requeue_stale()
+                purge_finished()
+                for func in housekeeping:
+                    try:
+                        func()
+                    except Exception:
+                        logger.exception('Housekeeping %s failed', func.__name__)
+                last_housekeeping = time.monotonic()
+
+            jobs = claim(self.worker_id, self.batch_size, self.names)
+            if not jobs:
+                if once:
+                    return
+                time.sleep(self.poll_interval)
+                continue
+            for i, job_row in enumerate(jobs):
+                if self.stopping:
+                    # Hand back what this worker claimed but won't get to
+                    Job.objects.filter(
+                        id__in=[j.pk for j in jobs[i:]], status=RUNNING, locked_by=self.worker_id,
+                    ).update(
+                        status=PENDING, locked_by='',
+                    )
+                    break
+                if run(job_row):
+                    self.processed += 1
+                else:
+                    self.failed += 1
+
+
+def queue_depth():
+    depth = {
+        (name, status): count
+        for name, status, count in Job.objects.filter(status__in=[PENDING, RUNNING, FAILED])
+        .values_list('name', 'status').annotate(count=Count('id')).order_by()
+    }
+    # Report every registered job so idle queues show up as zero
+    for name in registry:
+        for status in (PENDING, RUNNING, FAILED):
+            depth.setdefault((name, status), 0)
+    return depth
+
+
+def oldest_pending_age():
+    oldest = Job.objects.filter(status=PENDING).values_list('name').annotate(oldest=Min('run_after')).order_by()
+    now = timezone.now()
+    return {(name,): max((now - run_after).total_seconds(), 0.0) for name, run_after in oldest}
+
+
+metrics.registry.register(metrics.Gauge(
+    'complaints_job_queue_depth', 'Jobs in the queue by name and status.', ('name', 'status'),
+    callback=queue_depth,
+))
+metrics.registry.register(metrics.Gauge(
+    'complaints_job_oldest_pending_seconds', 'Seconds the oldest due pending job has been waiting.', ('name',),
+    callback=oldest_pending_age,
+))
@@ -0,0 +1,38 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from complaints import tiering
+
+
+class Command(BaseCommand):
+    help = (
+        "Move resolved and closed complaints not updated for COLD_TIER_AFTER_DAYS to the "
+        "COMPLAINT_COLD_DATABASES cold tier (workers also do this a batch at a time)"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--days', type=int, default=None,
+            help='Move complaints not updated for this many days (default: COLD_TIER_AFTER_DAYS)',
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=None,
+            help='Complaints moved per transaction (default: COLD_TIER_BATCH_SIZE)',
+        )
+
+    def handle(self, *args, **options):
+        if not tiering.is_enabled():
+            raise CommandError('No cold tier configured; set COMPLAINT_COLD_DATABASES')
+        days = options['days'] if options['days'] is not None else settings.COLD_TIER_AFTER_DAYS
+        if days <= 0:
+            raise CommandError('The cold tier is disabled; pass --days or set COLD_TIER_AFTER_DAYS')
+        if options['batch_size'] is not None and options['batch_size'] < 1:
+            raise CommandError('--batch-size must be at least 1')
+        started = time.monotonic()
+        moved = tiering.freeze(cutoff=tiering.cutoff_for(days), batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Moved {moved} complaints not updated for {days} days to the cold tier '
+            f'in {time.monotonic() - started:.1f}s'
+        ))
@@ -0,0 +1,40 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from complaints.history_archive import archive_history, remove_orphan_segments, retention_cutoff
+
+
+class Command(BaseCommand):
+    help = (
+        "Move complaint history older than HISTORY_RETENTION_DAYS into compressed "
+        "archive segments (workers also do this a batch at a time)"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--days', type=int, default=None,
+            help='Archive entries older than this many days (default: HISTORY_RETENTION_DAYS)',
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=None,
+            help='Entries per segment file and transaction (default: HISTORY_ARCHIVE_BATCH_SIZE)',
+        )
+        parser.add_argument(
+            '--prune', action='store_true',
+            help='Also delete segment files no longer referenced (crashed batches, deleted complaints)',
+        )
+
+    def handle(self, *args, **options):
+        days = options['days'] if options['days'] is not None else settings.HISTORY_RETENTION_DAYS
+        if days <= 0:
+            raise CommandError('History retention is disabled; pass --days or set HISTORY_RETENTION_DAYS')
+        started = time.monotonic()
+        archived = archive_history(cutoff=retention_cutoff(days), batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Archived {archived} history entries older than {days} days in {time.monotonic() - started:.1f}s'
+        ))
+        if options['prune']:
+            removed = remove_orphan_segments()
+            self.stdout.write(f'Removed {removed} unreferenced segment file(s)')
@@ -0,0 +1,123 @@
+import json
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from complaints import sharding
+from complaints.benchmark import HTTPTransport, InProcessTransport, default_endpoints, format_table, run_endpoint
+from complaints.models import Complaint
+
+
+class Command(BaseCommand):
+    help = 'Benchmark every complaints URL with concurrent clients and report latency, throughput and queries'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--url', help='Base URL of a running server; default runs in-process')
+        parser.add_argument('--username', help='User to run as (default: first active staff user)')
+        parser.add_argument('--password', help='Password for --username (required with --url)')
+        parser.add_argument(
+            '--compare-url',
+            help='Base URL of a second deployment (e.g. ASGI next to WSGI at --url) to run the same load against',
+        )
+        parser.add_argument('--requests', type=int, default=200, help='Requests per endpoint (default: 200)')
+        parser.add_argument('--concurrency', type=int, default=8, help='Concurrent clients (default: 8)')
+        parser.add_argument('--endpoints', help='Comma-separated endpoint names to run (default: all)')
+        parser.add_argument(
+            '--write', action='store_true',
+            help='Also run the endpoints that write (status changes, assignments, comments); they modify the database',
+        )
+        parser.add_argument('--seed', type=int, default=0, help='Seed for picking tickets (default: 0)')
+        parser.add_argument('--output', help='Write the results as JSON to this file')
+        parser.add_argument('--baseline', help='JSON file from an earlier --output run to compare against')
+
+    def handle(self, *args, **options):
+        if options['username']:
+            user = User.objects.filter(username=options['username']).first()
+            if user is None:
+                raise CommandError(f"User {options['username']!r} does not exist")
+        else:
+            user = User.objects.filter(is_staff=True, is_active=True).order_by('id').first()
+            if user is None:
+                raise CommandError('No staff user found; create one or pass --username')
+
+        complaints = Complaint.objects.all() if user.is_staff else Complaint.objects.filter(created_by=user)
+        newest = complaints.order_by('-id').values_list('ticket_number', flat=True)
+        tickets = [ticket for shard in sharding.querysets(newest) for ticket in shard[:1000]]
+        if not tickets:
+            raise CommandError('No complaints to benchmark against; run generate_complaints first')
+
+        if options['url']:
+            if not options['password']:
+                raise CommandError('--password is required with --url')
+            transport = HTTPTransport(options['url'], user.username, options['password'])
+        else:
+            transport = InProcessTransport(user)
+        other = None
+        if options['compare_url']:
+            if not options['url']:
+                raise CommandError('--compare-url needs --url for the deployment to compare against')
+            other = HTTPTransport(options['compare_url'], user.username, options['password'])
+
+        endpoints = default_endpoints(assignee_id=user.pk)
+        if options['endpoints']:
+            wanted = {name.strip() for name in options['endpoints'].split(',')}
+            unknown = wanted - {endpoint.name for endpoint in endpoints}
+            if unknown:
+                raise CommandError(f"Unknown endpoints: {', '.join(sorted(unknown))}")
+            endpoints = [endpoint for endpoint in endpoints if endpoint.name in wanted]
+        if not options['write']:
+            writes = [endpoint.name for endpoint in endpoints if endpoint.method != 'GET']
+            if writes and options['endpoints']:
+                raise CommandError(f"{', '.join(writes)} change the database; pass --write to run them")
+            endpoints = [endpoint for endpoint in endpoints if endpoint.method == 'GET']
+
+        summaries, other_summaries = [], []
+        for endpoint in endpoints:
+            self.stdout.write(f'Running {endpoint.name}...', ending='\r')
+            self.stdout.flush()
+            result = run_endpoint(
+                transport, endpoint, tickets, options['requests'], options['concurrency'], options['seed']
+            )
+            summaries.append(result.summary())
+            if other is not None:
+                result = run_endpoint(
+                    other, endpoint, tickets, options['requests'], options['concurrency'], options['seed']
+                )
+                other_summaries.append(result.summary())
+
+        if other is not None:
+            self.stdout.write(f"{options['url']}\n{format_table(summaries)}\n")
+            self.stdout.write(f"{options['compare_url']}\n{format_table(other_summaries)}")
+            self.compare(other_summaries, summaries, f"\nChange from {options['url']} to {options['compare_url']}")
+        else:
+            self.stdout.write(format_table(summaries))
+
+        if options['baseline']:
+            with open(options['baseline']) as baseline_file:
+                baseline = json.load(baseline_file)['results']
+            self.compare(summaries, baseline, '\nChange against baseline')
+        if options['output']:
+            report = {
+                'mode': 'http' if options['url'] else 'in-process',
+                'concurrency': options['concurrency'],
+                'requests': options['requests'],
+                'results': summaries,
+            }
+            if other is not None:
+                report.update(compare_url=options['compare_url'], compare_results=other_summaries)
+            with open(options['output'], 'w') as output:
+                json.dump(report, output, indent=2)
+            self.stdout.write(f"Results written to {options['output']}")
+
+    def compare(self, summaries, baseline, title):
+        baseline = {row['endpoint']: row for row in baseline}
+        self.stdout.write(f'{title} (p95 / rps / queries):')
+        for summary in summaries:
+            before = baseline.get(summary['endpoint'])
+            if before is None:
+                continue
+            changes = []
+            for key in ('p95_ms', 'rps', 'queries'):
+                if before[key] and summary[key] is not None:
+                    changes.append(f"{key} {(summary[key] - before[key]) / before[key] * 100:+.0f}%")
+            self.stdout.write(f"  {summary['endpoint']}: {', '.join(changes)}")
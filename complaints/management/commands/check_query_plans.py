@@ -0,0 +1,132 @@
+import json
+import re
+from datetime import timedelta
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from complaints import sharding
+from complaints.models import Complaint, ComplaintCategory, ComplaintComment, ComplaintHistory
+from complaints.pagination import encode_cursor
+from complaints.stats import invalidate_stats
+
+# "SCAN <table>" without an index is a full table scan. Index scans
+# ("SCAN t USING INDEX ..."), FTS lookups and scans of subquery results
+# are accepted.
+FULL_SCAN_RE = re.compile(r'^SCAN (\w+)$')
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = (
+        "Run every complaints view against SQLite, EXPLAIN each SELECT it issues "
+        "and fail if any of them scans a whole table"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--verbose-plans', action='store_true',
+            help='Print the plan of every query, not only the failing ones',
+        )
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'sqlite':
+            raise CommandError('Query plan checks only run against SQLite')
+        if sharding.is_sharded():
+            raise CommandError('Query plan checks only see the default database; unset COMPLAINT_SHARDS')
+
+        self.verbose_plans = options['verbose_plans']
+        self.failures = []
+        self.checked = 0
+        self.tables = set(connection.introspection.table_names())
+        # Everything runs in one transaction that is rolled back at the end
+        try:
+            with transaction.atomic():
+                self.check_views()
+                raise Rollback
+        except Rollback:
+            pass
+
+        if self.failures:
+            for view, sql, plan in self.failures:
+                self.stderr.write(f'\n[{view}] full scan:\n  {sql}\n  ' + '\n  '.join(plan))
+            raise CommandError(f'{len(self.failures)} of {self.checked} queries fall back to a full table scan')
+        self.stdout.write(self.style.SUCCESS(f'{self.checked} queries checked, no full table scans'))
+
+    def check_views(self):
+        staff = User.objects.create_user('plan-check-staff', password='x', is_staff=True)
+        user = User.objects.create_user('plan-check-user', password='x')
+        category = ComplaintCategory.objects.create(name='Plan check')
+        complaint = Complaint.objects.create(
+            title='Plan check printer', description='Plan check', created_by=user, category=category
+        )
+        ComplaintComment.objects.create(complaint=complaint, user=user, comment='Plan check')
+        ComplaintHistory.objects.create(complaint=complaint, changed_by=user, field_name='created')
+        ticket = complaint.ticket_number
+        since = timezone.now() - timedelta(hours=1)
+
+        get_requests = [
+            ('dashboard', reverse('dashboard'), {}),
+            ('complaints_list', reverse('complaints_list'), {}),
+            ('complaints_list?status', reverse('complaints_list'), {'status': 'pending'}),
+            ('complaints_list?priority', reverse('complaints_list'), {'priority': 'urgent'}),
+            ('complaints_list?search', reverse('complaints_list'), {'search': 'printer'}),
+            ('complaints_list?ticket', reverse('complaints_list'), {'search': ticket}),
+            ('complaint_detail', reverse('complaint_detail', args=[ticket]), {}),
+            ('api_complaints', reverse('api_complaints'), {}),
+            ('api_complaints?status', reverse('api_complaints'), {'status': 'pending'}),
+            ('api_complaints?since', reverse('api_complaints'), {'since': encode_cursor([since, 0], 'next')}),
+            ('api_stats', reverse('api_stats'), {}),
+            ('api_stats_trends', reverse('api_stats_trends'), {}),
+            # An unfiltered export reads the whole table on purpose
+            ('export_complaints?status', reverse('export_complaints'), {'status': 'resolved'}),
+        ]
+        post_requests = [
+            ('add_comment', reverse('add_comment', args=[ticket]), {'comment': 'Plan check'}),
+            ('update_status', reverse('update_status', args=[ticket]), {'status': 'in_progress'}),
+            ('assign_complaint', reverse('assign_complaint', args=[ticket]), {'user_id': staff.pk}),
+            ('bulk_update_status', reverse('bulk_update_status'), {'tickets': [ticket], 'status': 'resolved'}),
+            ('bulk_assign', reverse('bulk_assign'), {'tickets': [ticket], 'user_id': None}),
+        ]
+
+        for account in (user, staff):
+            client = Client()
+            client.force_login(account)
+            for name, url, params in get_requests:
+                invalidate_stats([user.pk])
+                self.check_request(f'{name} as {account.username}', lambda: client.get(url, params))
+            if account.is_staff:
+                for name, url, payload in post_requests:
+                    self.check_request(name, lambda: client.post(
+                        url, json.dumps(payload), content_type='application/json'
+                    ))
+
+    def check_request(self, view, request):
+        with CaptureQueriesContext(connection) as queries:
+            response = request()
+            if response.streaming:
+                b''.join(response.streaming_content)
+        if response.status_code >= 400:
+            raise CommandError(f'{view} returned HTTP {response.status_code}')
+
+        for query in queries.captured_queries:
+            sql = query['sql']
+            if not sql.lstrip().upper().startswith('SELECT'):
+                continue
+            with connection.cursor() as cursor:
+                cursor.execute(f'EXPLAIN QUERY PLAN {sql}')
+                plan = [row[-1] for row in cursor.fetchall()]
+            self.checked += 1
+            if self.verbose_plans:
+                self.stdout.write(f'[{view}] {sql}\n  ' + '\n  '.join(plan))
+            scanned = {match.group(1) for match in map(FULL_SCAN_RE.match, plan) if match}
+            if scanned & self.tables:
+                self.failures.append((view, sql, plan))
@@ -0,0 +1,48 @@
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from complaints.export import FORMATS, export_queryset, filter_complaints, iter_export
+from complaints.models import Complaint
+
+
+class Command(BaseCommand):
+    help = 'Stream complaints with category, creator, assignee and resolution data as CSV or JSONL'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--format', choices=sorted(FORMATS), default='csv', help='Output format (default: csv)')
+        parser.add_argument('--output', help='File to write (default: stdout)')
+        parser.add_argument('--username', help='Export what this user sees in the complaints list (default: everything)')
+        parser.add_argument('--status', default='', help='Only complaints with this status')
+        parser.add_argument('--priority', default='', help='Only complaints with this priority')
+        parser.add_argument('--search', default='', help='Only complaints matching this search query')
+        parser.add_argument('--archived', action='store_true', help='Include complaints moved to the cold tier')
+        parser.add_argument('--chunk-size', type=int, default=2000, help='Rows read per query (default: 2000)')
+
+    def handle(self, *args, **options):
+        if options['chunk_size'] < 1:
+            raise CommandError('--chunk-size must be at least 1')
+        user = None
+        if options['username']:
+            user = User.objects.filter(username=options['username']).first()
+            if user is None:
+                raise CommandError(f"User {options['username']!r} does not exist")
+
+        complaints = filter_complaints(
+            Complaint.objects.all(), user, options['status'], options['priority'], options['archived'],
+        )
+        complaints = export_queryset(complaints, options['search'])
+
+        started = time.monotonic()
+        blocks = iter_export(complaints, options['format'], options['chunk_size'])
+        if not options['output']:
+            for block in blocks:
+                self.stdout.write(block, ending='')
+            return
+        with open(options['output'], 'w', newline='', encoding='utf-8') as output:
+            for block in blocks:
+                output.write(block)
+        self.stdout.write(self.style.SUCCESS(
+            f"Exported to {options['output']} in {time.monotonic() - started:.1f}s"
+        ))
@@ -0,0 +1,185 @@
+import random
+import time
+from datetime import timedelta
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from complaints import sharding
+from complaints.bulk import batched, create_complaints, create_related
+from complaints.models import Complaint, ComplaintCategory, ComplaintComment, ComplaintHistory
+from complaints.rollups import rebuild_rollups
+from complaints.stats import invalidate_stats
+from complaints.tickets import assign_ticket_numbers
+
+DEFAULT_CATEGORIES = [
+    ('Technical Issue', 'Hardware, software, or technical problems'),
+    ('Service Complaint', 'Issues with service delivery or quality'),
+    ('Billing Issue', 'Problems related to billing or payments'),
+    ('Facility Issue', 'Problems with facilities or infrastructure'),
+    ('Staff Behavior', 'Complaints about staff conduct or behavior'),
+    ('Product Quality', 'Issues with product quality or defects'),
+    ('Delivery Issue', 'Problems with delivery or shipping'),
+    ('Other', 'Other types of complaints'),
+]
+
+# Share of complaints per final status / priority
+STATUS_WEIGHTS = {'pending': 35, 'in_progress': 25, 'resolved': 20, 'closed': 15, 'rejected': 5}
+PRIORITY_WEIGHTS = {'low': 30, 'medium': 45, 'high': 18, 'urgent': 7}
+
+# Statuses a complaint passes through to reach its final one
+STATUS_PATHS = {
+    'pending': [],
+    'in_progress': ['in_progress'],
+    'resolved': ['in_progress', 'resolved'],
+    'closed': ['in_progress', 'resolved', 'closed'],
+    'rejected': ['rejected'],
+}
+
+SUBJECTS = ['Printer', 'Invoice', 'Delivery', 'Air conditioning', 'Login', 'Refund', 'Parking', 'Elevator',
+            'Website', 'Water supply', 'Internet', 'Payment', 'Order', 'Cleaning', 'Noise', 'Lighting']
+PROBLEMS = ['not working', 'delayed', 'charged twice', 'broken', 'very slow', 'missing', 'keeps failing',
+            'incorrect', 'damaged', 'unavailable', 'too loud', 'not responding']
+FIRST_NAMES = ['Alex', 'Sam', 'Priya', 'Chen', 'Maria', 'John', 'Aisha', 'Luis', 'Emma', 'Ravi', 'Yuki', 'Omar']
+LAST_NAMES = ['Patel', 'Smith', 'Garcia', 'Kim', 'Nguyen', 'Brown', 'Khan', 'Silva', 'Müller', 'Rossi']
+COMMENTS = ['Any update on this?', 'Looking into it.', 'Issue reproduced.', 'Waiting for the vendor.',
+            'Fixed on our side, please confirm.', 'Still happening today.', 'Escalated to the team lead.']
+
+
+class Command(BaseCommand):
+    help = 'Generate synthetic users, complaints, comments and history for load testing'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=2000, help='Regular users to create (default: 2000)')
+        parser.add_argument('--staff', type=int, default=50, help='Staff users to create (default: 50)')
+        parser.add_argument('--complaints', type=int, default=100000, help='Complaints to create (default: 100000)')
+        parser.add_argument('--max-comments', type=int, default=4, help='Maximum comments per complaint (default: 4)')
+        parser.add_argument('--days', type=int, default=365, help='Spread creation dates over this many days (default: 365)')
+        parser.add_argument('--batch-size', type=int, default=2000, help='Complaints per transaction (default: 2000)')
+        parser.add_argument('--seed', type=int, help='Random seed for reproducible data')
+        parser.add_argument('--password', default='loadtest123', help='Password for the generated users')
+        parser.add_argument('--skip-rollups', action='store_true', help='Do not rebuild trend rollups afterwards')
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size must be at least 1')
+        self.random = random.Random(options['seed'])
+        started = time.monotonic()
+
+        categories = self.ensure_categories()
+        users = self.create_users(options['users'], 'loaduser', False, options['password'])
+        staff = self.create_users(options['staff'], 'loadstaff', True, options['password'])
+        if not users:
+            users = list(User.objects.filter(is_staff=False).values_list('id', flat=True))
+        if not users:
+            raise CommandError('No regular users to own the complaints; use --users')
+        staff = staff or list(User.objects.filter(is_staff=True).values_list('id', flat=True))
+        # bulk_create skips the signals that copy users to the shards
+        sharding.sync_reference_tables()
+
+        total = options['complaints']
+        created = 0
+        for batch in batched(range(total), options['batch_size']):
+            self.create_batch(len(batch), users, staff, categories, options)
+            created += len(batch)
+            elapsed = time.monotonic() - started
+            self.stdout.write(f'{created}/{total} complaints ({created / elapsed:.0f} rows/s)', ending='\r')
+            self.stdout.flush()
+        self.stdout.write('')
+
+        invalidate_stats()
+        if not options['skip_rollups']:
+            self.stdout.write('Rebuilding trend rollups...')
+            rebuild_rollups()
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Generated {len(users)} users, {len(staff)} staff and {created} complaints '
+            f'in {time.monotonic() - started:.1f}s'
+        ))
+
+    def ensure_categories(self):
+        for name, description in DEFAULT_CATEGORIES:
+            ComplaintCategory.objects.get_or_create(name=name, defaults={'description': description})
+        return list(ComplaintCategory.objects.values_list('id', flat=True))
+
+    def create_users(self, count, prefix, is_staff, password):
+        if count <= 0:
+            return []
+        # Hash once; PBKDF2 per user would dominate the run time
+        password_hash = make_password(password)
+        run = timezone.now().strftime('%Y%m%d%H%M%S')
+        users = []
+        for i in range(count):
+            first, last = self.random.choice(FIRST_NAMES), self.random.choice(LAST_NAMES)
+            username = f'{prefix}{run}_{i}'
+            users.append(User(
+                username=username, first_name=first, last_name=last, email=f'{username}@example.com',
+                password=password_hash, is_staff=is_staff,
+            ))
+        User.objects.bulk_create(users, batch_size=1000)
+        return list(User.objects.filter(username__startswith=f'{prefix}{run}_').values_list('id', flat=True))
+
+    def pick(self, weights):
+        return self.random.choices(list(weights), weights=list(weights.values()))[0]
+
+    def create_batch(self, size, users, staff, categories, options):
+        now = timezone.now()
+        plans = []
+        complaints = []
+        for _ in range(size):
+            created_at = now - timedelta(seconds=self.random.randint(0, options['days'] * 86400))
+            status = self.pick(STATUS_WEIGHTS)
+            transitions = []
+            moment = created_at
+            for step in STATUS_PATHS[status]:
+                moment = min(moment + timedelta(hours=self.random.uniform(1, 120)), now)
+                transitions.append((step, moment))
+            assigned_to = self.random.choice(staff) if staff and status != 'pending' else None
+            complaint = Complaint(
+                title=f'{self.random.choice(SUBJECTS)} {self.random.choice(PROBLEMS)}',
+                description=' '.join(self.random.choice(SUBJECTS) + ' ' + self.random.choice(PROBLEMS)
+                                     for _ in range(self.random.randint(2, 8))),
+                category_id=self.random.choice(categories) if self.random.random() < 0.9 else None,
+                status=status,
+                priority=self.pick(PRIORITY_WEIGHTS),
+                created_by_id=self.random.choice(users),
+                assigned_to_id=assigned_to,
+                created_at=created_at,
+                updated_at=moment,
+                resolved_at=next((at for step, at in transitions if step == 'resolved'), None)
+                if status == 'resolved' else None,
+            )
+            complaints.append(complaint)
+            plans.append((complaint, transitions))
+
+        with sharding.atomic_all():
+            assign_ticket_numbers(complaints)
+            create_complaints(complaints)
+
+            history = []
+            comments = []
+            for complaint, transitions in plans:
+                history.append(ComplaintHistory(
+                    complaint_id=complaint.pk, changed_by_id=complaint.created_by_id,
+                    field_name='created', new_value='Complaint created', changed_at=complaint.created_at,
+                ))
+                previous = 'pending'
+                for step, at in transitions:
+                    history.append(ComplaintHistory(
+                        complaint_id=complaint.pk, changed_by_id=complaint.assigned_to_id,
+                        field_name='status', old_value=previous, new_value=step, changed_at=at,
+                    ))
+                    previous = step
+                for _ in range(self.random.randint(0, options['max_comments'])):
+                    is_staff_comment = complaint.assigned_to_id and self.random.random() < 0.5
+                    comments.append(ComplaintComment(
+                        complaint_id=complaint.pk,
+                        user_id=complaint.assigned_to_id if is_staff_comment else complaint.created_by_id,
+                        comment=self.random.choice(COMMENTS),
+                        is_internal=bool(is_staff_comment) and self.random.random() < 0.3,
+                        created_at=min(complaint.created_at + timedelta(minutes=self.random.randint(5, 7200)), now),
+                    ))
+            create_related(ComplaintHistory, history)
+            create_related(ComplaintComment, comments)
@@ -0,0 +1,251 @@
+import csv
+import json
+import os
+import sys
+import time
+
+from django.contrib.auth.models import User
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from complaints import sharding
+from complaints.bulk import batched, create_complaints, create_related
+from complaints.forms import ComplaintImportForm
+from complaints.models import Complaint, ComplaintCategory, ComplaintHistory
+from complaints.rollups import RollupBatch
+from complaints.stats import invalidate_stats
+from complaints.tickets import assign_ticket_numbers
+
+STATUSES = {value for value, _ in Complaint.STATUS_CHOICES}
+
+
+class RowError(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = 'Import complaints from a CSV or JSONL file in batched transactions'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="CSV or JSONL file to import ('-' reads JSONL from stdin)")
+        parser.add_argument('--format', choices=['csv', 'jsonl'], help='Input format (default: from the file extension)')
+        parser.add_argument('--batch-size', type=int, default=1000, help='Rows per transaction (default: 1000)')
+        parser.add_argument('--created-by', help='Username to file rows without a created_by column under')
+        parser.add_argument('--checkpoint', help='Checkpoint file (default: <path>.checkpoint)')
+        parser.add_argument('--resume', action='store_true', help='Skip the rows recorded in the checkpoint')
+        parser.add_argument('--errors', help='Write rejected rows as JSONL to this file')
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size must be at least 1')
+        path = options['path']
+        fmt = options['format'] or ('csv' if path.lower().endswith('.csv') else 'jsonl')
+        checkpoint_path = options['checkpoint'] or (None if path == '-' else f'{path}.checkpoint')
+        if options['resume'] and not checkpoint_path:
+            raise CommandError('--resume needs --checkpoint when reading from stdin')
+
+        self.categories = {name.lower(): pk for pk, name in ComplaintCategory.objects.values_list('id', 'name')}
+        self.users = {}
+        # One form's bound fields, reused for every row; building a form per
+        # row (deep-copying its fields) costs more than the inserts
+        self.form_fields = ComplaintImportForm().fields
+        self.default_user_id = None
+        if options['created_by']:
+            self.default_user_id = self.resolve_users([options['created_by']]).get(options['created_by'])
+            if self.default_user_id is None:
+                raise CommandError(f"User {options['created_by']!r} does not exist")
+
+        progress = {'path': os.path.abspath(path) if path != '-' else '-', 'rows': 0, 'imported': 0, 'rejected': 0}
+        if options['resume'] and os.path.exists(checkpoint_path):
+            with open(checkpoint_path) as checkpoint:
+                saved = json.load(checkpoint)
+            if saved.get('path') != progress['path']:
+                raise CommandError(f"Checkpoint {checkpoint_path} belongs to {saved.get('path')}")
+            progress.update(saved)
+            self.stdout.write(f"Resuming after row {progress['rows']}")
+        skip = progress['rows']
+
+        errors = open(options['errors'], 'a' if options['resume'] else 'w') if options['errors'] else None
+        started = time.monotonic()
+        imported_before = progress['imported']
+        try:
+            with self.open_input(path) as source:
+                rows = self.read_rows(source, fmt)
+                for batch in batched(((n, row) for n, row in rows if n > skip), options['batch_size']):
+                    complaints, rejected = self.build_batch(batch)
+                    for number, row, messages in rejected:
+                        self.stderr.write(f"Row {number}: {'; '.join(messages)}")
+                        if errors:
+                            errors.write(json.dumps({'row': number, 'errors': messages, 'data': row}) + '\n')
+                    if complaints:
+                        self.save_batch(complaints)
+                    progress['rows'] = batch[-1][0]
+                    progress['imported'] += len(complaints)
+                    progress['rejected'] += len(rejected)
+                    if checkpoint_path:
+                        self.write_checkpoint(checkpoint_path, progress)
+                    rate = (progress['imported'] - imported_before) / (time.monotonic() - started)
+                    self.stdout.write(
+                        f"{progress['rows']} rows read, {progress['imported']} imported, "
+                        f"{progress['rejected']} rejected ({rate:.0f} rows/s)",
+                        ending='\r',
+                    )
+                    self.stdout.flush()
+        finally:
+            if errors:
+                errors.close()
+        self.stdout.write('')
+
+        if checkpoint_path and os.path.exists(checkpoint_path):
+            os.remove(checkpoint_path)
+        self.stdout.write(self.style.SUCCESS(
+            f"Imported {progress['imported']} complaints, rejected {progress['rejected']} rows "
+            f"in {time.monotonic() - started:.1f}s"
+        ))
+
+    def open_input(self, path):
+        if path == '-':
+            return open(sys.stdin.fileno(), encoding='utf-8', closefd=False)
+        try:
+            return open(path, newline='', encoding='utf-8-sig')
+        except OSError as e:
+            raise CommandError(f'Cannot read {path}: {e}')
+
+    def read_rows(self, source, fmt):
+        """Yield ``(row_number, dict)``; row numbers count data rows from 1."""
+        if fmt == 'csv':
+            yield from enumerate(csv.DictReader(source), start=1)
+            return
+        for number, line in enumerate(source, start=1):
+            if not line.strip():
+                yield number, {}
+                continue
+            try:
+                row = json.loads(line)
+            except ValueError as e:
+                row = {'__invalid__': f'Invalid JSON: {e}'}
+            yield number, row if isinstance(row, dict) else {'__invalid__': 'Expected a JSON object'}
+
+    def write_checkpoint(self, path, progress):
+        # Written after the batch commits; a crash in between re-imports at most one batch
+        temporary = f'{path}.tmp'
+        with open(temporary, 'w') as checkpoint:
+            json.dump(progress, checkpoint)
+        os.replace(temporary, path)
+
+    def resolve_users(self, usernames):
+        """Look up usernames missing from the cache in one query."""
+        missing = {name for name in usernames if name and name not in self.users}
+        if missing:
+            found = dict(User.objects.filter(username__in=missing).values_list('username', 'id'))
+            for name in missing:
+                self.users[name] = found.get(name)
+        return self.users
+
+    def build_batch(self, batch):
+        self.resolve_users(
+            [str(row.get(key) or '').strip() for _, row in batch for key in ('created_by', 'assigned_to')]
+        )
+        complaints, rejected = [], []
+        for number, row in batch:
+            try:
+                complaints.append(self.build_complaint(row))
+            except RowError as e:
+                rejected.append((number, row, e.args[0]))
+        return complaints, rejected
+
+    def build_complaint(self, row):
+        if not row:
+            raise RowError(['Empty row'])
+        if '__invalid__' in row:
+            raise RowError([row['__invalid__']])
+
+        data = {key: str(value).strip() for key, value in row.items() if key and value is not None}
+        data['priority'] = data.get('priority') or 'medium'
+        cleaned, messages = {}, []
+        for name, field in self.form_fields.items():
+            try:
+                cleaned[name] = field.clean(field.widget.value_from_datadict(data, {}, name))
+            except ValidationError as e:
+                messages.extend(f'{name}: {error}' for error in e.messages)
+
+        category_id = None
+        if data.get('category'):
+            category_id = self.categories.get(data['category'].lower())
+            if category_id is None:
+                messages.append(f"category: Unknown category {data['category']!r}")
+
+        created_by_id = self.default_user_id
+        if data.get('created_by'):
+            created_by_id = self.users.get(data['created_by'])
+            if created_by_id is None:
+                messages.append(f"created_by: Unknown user {data['created_by']!r}")
+        elif created_by_id is None:
+            messages.append('created_by: This field is required (or pass --created-by).')
+
+        assigned_to_id = None
+        if data.get('assigned_to'):
+            assigned_to_id = self.users.get(data['assigned_to'])
+            if assigned_to_id is None:
+                messages.append(f"assigned_to: Unknown user {data['assigned_to']!r}")
+
+        status = data.get('status') or 'pending'
+        if status not in STATUSES:
+            messages.append(f'status: Invalid status {status!r}')
+
+        now = timezone.now()
+        created_at = self.parse_moment(data, 'created_at', messages) or now
+        resolved_at = self.parse_moment(data, 'resolved_at', messages)
+        if status == 'resolved':
+            resolved_at = resolved_at or now
+        else:
+            resolved_at = None
+
+        if messages:
+            raise RowError(messages)
+
+        return Complaint(
+            category_id=category_id,
+            created_by_id=created_by_id,
+            assigned_to_id=assigned_to_id,
+            status=status,
+            created_at=created_at,
+            # Delta-sync clients find rows by updated_at, so imports count as changed now
+            updated_at=now,
+            resolved_at=resolved_at,
+            resolution_notes=data.get('resolution_notes', ''),
+            **cleaned,
+        )
+
+    def parse_moment(self, data, key, messages):
+        if not data.get(key):
+            return None
+        try:
+            moment = parse_datetime(data[key])
+        except ValueError:
+            moment = None
+        if moment is None:
+            messages.append(f'{key}: Invalid date/time {data[key]!r}')
+            return None
+        if timezone.is_naive(moment):
+            moment = timezone.make_aware(moment)
+        return moment
+
+    def save_batch(self, complaints):
+        rollups = RollupBatch()
+        with sharding.atomic_all():
+            assign_ticket_numbers(complaints)
+            create_complaints(complaints)
+            create_related(ComplaintHistory, [
+                ComplaintHistory(
+                    complaint_id=complaint.pk, changed_by_id=complaint.created_by_id,
+                    field_name='created', new_value='Complaint created', changed_at=complaint.created_at,
+                )
+                for complaint in complaints
+            ], batch_size=1000)
+            for complaint in complaints:
+                rollups.add_created(complaint.created_at, complaint.status, complaint.priority, complaint.category_id)
+            rollups.apply()
+        invalidate_stats(complaint.created_by_id for complaint in complaints)
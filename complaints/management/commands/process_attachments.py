@@ -0,0 +1,59 @@
+import time
+from collections import Counter
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count
+
+from complaints import sharding
+from complaints.attachments import delete_files, generate_thumbnail, is_image
+from complaints.models import AttachmentBlob, Complaint
+
+
+class Command(BaseCommand):
+    help = 'Render missing attachment thumbnails and optionally recount attachment references'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--recount', action='store_true',
+            help='Recompute reference counts from complaints and delete files nothing points at',
+        )
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        if options['recount']:
+            self.recount()
+
+        rendered = failed = 0
+        pending = AttachmentBlob.objects.filter(thumbnail='').values_list('sha256', 'name')
+        for digest, name in pending.iterator():
+            if not is_image(name):
+                continue
+            if generate_thumbnail(digest):
+                rendered += 1
+            else:
+                failed += 1
+        self.stdout.write(self.style.SUCCESS(
+            f'Rendered {rendered} thumbnails ({failed} failed) in {time.monotonic() - started:.1f}s'
+        ))
+
+    def recount(self):
+        attached = (
+            Complaint.objects.with_archived().exclude(attachment='').exclude(attachment__isnull=True)
+            .order_by().values_list('attachment').annotate(count=Count('id'))
+        )
+        # Files are shared across shards and tiers, so their counts add up
+        references = Counter()
+        for counts in sharding.fan_out(dict, sharding.querysets(attached)):
+            references.update(counts)
+        changed = 0
+        with transaction.atomic():
+            for blob in AttachmentBlob.objects.select_for_update().only('id', 'name', 'ref_count'):
+                count = references.get(blob.name, 0)
+                if count != blob.ref_count:
+                    AttachmentBlob.objects.filter(pk=blob.pk).update(ref_count=count)
+                    changed += 1
+            orphans = list(AttachmentBlob.objects.filter(ref_count=0).values_list('id', 'name', 'thumbnail'))
+            AttachmentBlob.objects.filter(id__in=[orphan[0] for orphan in orphans]).delete()
+            transaction.on_commit(lambda: delete_files(orphans))
+        self.stdout.write(f'Fixed {changed} reference counts, removed {len(orphans)} unreferenced files')
@@ -0,0 +1,24 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from complaints.search import get_backend
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the complaint full-text search index'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--database', default='default',
+            help='Database alias to reindex (default: "default")',
+        )
+
+    def handle(self, *args, **options):
+        backend = get_backend(options['database'])
+        started = time.monotonic()
+        backend.reindex()
+        self.stdout.write(self.style.SUCCESS(
+            f'Reindexed complaints with {backend.__class__.__name__} '
+            f'in {time.monotonic() - started:.1f}s'
+        ))
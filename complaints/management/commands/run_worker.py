@@ -0,0 +1,80 @@
+import multiprocessing
+import signal
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from complaints.jobs import Worker, registry
+
+
+def _work(names, batch_size, poll_interval):
+    # Forked children must not share the parent's database connections
+    for connection in connections.all(initialized_only=True):
+        connection.close()
+    worker = Worker(names=names, batch_size=batch_size, poll_interval=poll_interval)
+    signal.signal(signal.SIGTERM, worker.stop)
+    signal.signal(signal.SIGINT, worker.stop)
+    worker.run()
+
+
+class Command(BaseCommand):
+    help = 'Run background job workers that consume the database job queue'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--processes', type=int, default=2, help='Worker processes (default: 2)')
+        parser.add_argument('--jobs', help='Comma-separated job names to run (default: all)')
+        parser.add_argument('--batch-size', type=int, default=5, help='Jobs claimed per poll (default: 5)')
+        parser.add_argument('--poll-interval', type=float, help='Seconds to sleep when idle (default: JOB_POLL_INTERVAL)')
+        parser.add_argument('--once', action='store_true', help='Run due jobs in this process, then exit')
+
+    def handle(self, *args, **options):
+        names = None
+        if options['jobs']:
+            names = [name.strip() for name in options['jobs'].split(',')]
+            unknown = set(names) - set(registry)
+            if unknown:
+                raise CommandError(f"Unknown jobs: {', '.join(sorted(unknown))}")
+
+        if options['once']:
+            worker = Worker(names=names, batch_size=options['batch_size'], poll_interval=options['poll_interval'])
+            worker.run(once=True)
+            self.stdout.write(self.style.SUCCESS(f'Ran {worker.processed} jobs, {worker.failed} failed'))
+            return
+
+        if options['processes'] < 1:
+            raise CommandError('--processes must be at least 1')
+        args = (names, options['batch_size'], options['poll_interval'])
+        context = multiprocessing.get_context('fork')
+        processes = []
+        stopping = False
+
+        def stop(*_):
+            nonlocal stopping
+            stopping = True
+            for process in processes:
+                if process.is_alive():
+                    process.terminate()
+
+        signal.signal(signal.SIGTERM, stop)
+        signal.signal(signal.SIGINT, stop)
+        connections.close_all()
+
+        self.stdout.write(f"Starting {options['processes']} workers for: {', '.join(names or sorted(registry))}")
+        for _ in range(options['processes']):
+            process = context.Process(target=_work, args=args, daemon=True)
+            process.start()
+            processes.append(process)
+
+        # Replace workers that die so the pool stays at full size
+        while not stopping:
+            time.sleep(1)
+            for i, process in enumerate(processes):
+                if not process.is_alive() and not stopping:
+                    self.stderr.write(f'Worker {process.pid} exited with {process.exitcode}; restarting')
+                    processes[i] = context.Process(target=_work, args=args, daemon=True)
+                    processes[i].start()
+
+        for process in processes:
+            process.join(timeout=30)
+        self.stdout.write('Workers stopped')
@@ -0,0 +1,131 @@
+import os
+import random
+import sqlite3
+import tempfile
+import threading
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, OperationalError, connection, connections, transaction
+from django.utils import timezone
+
+from complaints.benchmark import Result, format_table
+from complaints.models import Complaint, ComplaintComment
+from complaints.transactions import retry_on_lock
+
+ALIAS = 'sqlite_concurrency'
+
+# Django's stock SQLite settings, as before the tuned profile
+STOCK = {'ENGINE': 'django.db.backends.sqlite3', 'OPTIONS': {}, 'CONN_MAX_AGE': 0}
+
+
+class Command(BaseCommand):
+    help = (
+        "Run concurrent readers (list page query) and writers (status change plus "
+        "comment) against a copy of the SQLite database, once with the configured "
+        "profile and once with Django's stock settings, and report what each sustains"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--readers', type=int, default=8, help='Reader threads (default 8)')
+        parser.add_argument('--writers', type=int, default=4, help='Writer threads (default 4)')
+        parser.add_argument('--seconds', type=float, default=10, help='Duration per profile (default 10)')
+        parser.add_argument('--profile', choices=['tuned', 'stock', 'both'], default='both')
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'sqlite':
+            raise CommandError('The SQLite concurrency benchmark only runs against SQLite')
+        if not Complaint.objects.exists():
+            raise CommandError('No complaints to work on; run generate_complaints first')
+
+        profiles = ['tuned', 'stock'] if options['profile'] == 'both' else [options['profile']]
+        summaries = []
+        with tempfile.TemporaryDirectory() as directory:
+            for profile in profiles:
+                path = os.path.join(directory, f'{profile}.sqlite3')
+                self.copy_database(path)
+                self.stdout.write(
+                    f"{profile}: {options['readers']} readers, {options['writers']} writers, "
+                    f"{options['seconds']:g}s"
+                )
+                summaries += self.run_profile(profile, path, options)
+        self.stdout.write(format_table(summaries))
+
+    def copy_database(self, path):
+        # The backup API gives a consistent copy even while the app writes
+        source = sqlite3.connect(str(settings.DATABASES['default']['NAME']))
+        target = sqlite3.connect(path)
+        with target:
+            source.backup(target)
+        # Journal mode is stored in the file; each profile sets its own
+        target.execute('PRAGMA journal_mode = DELETE')
+        source.close()
+        target.close()
+
+    def configure(self, profile, path):
+        base = dict(settings.DATABASES['default'])
+        if profile == 'stock':
+            base.update(STOCK)
+        base['NAME'] = path
+        databases = connections.configure_settings({DEFAULT_DB_ALIAS: connections.settings[DEFAULT_DB_ALIAS], ALIAS: base})
+        connections.settings[ALIAS] = databases[ALIAS]
+
+    def run_profile(self, profile, path, options):
+        self.configure(profile, path)
+        ids = list(Complaint.objects.using(ALIAS).values_list('id', flat=True)[:10000])
+        user_id = Complaint.objects.using(ALIAS).values_list('created_by_id', flat=True).first()
+        statuses = [value for value, _ in Complaint.STATUS_CHOICES]
+        reads, writes = Result(f'{profile} reads'), Result(f'{profile} writes')
+        lock = threading.Lock()
+        deadline = time.perf_counter() + options['seconds']
+
+        def read(rng):
+            list(
+                Complaint.objects.using(ALIAS).filter(status=rng.choice(statuses))
+                .order_by('-created_at').values_list('id', 'ticket_number', 'title', 'created_at')[:20]
+            )
+
+        @retry_on_lock(using=ALIAS)
+        def write(rng):
+            # QuerySet.update() and bulk_create() keep the app's signals out of it
+            complaint_id = rng.choice(ids)
+            with transaction.atomic(using=ALIAS):
+                status = Complaint.objects.using(ALIAS).filter(id=complaint_id).values_list('status', flat=True).get()
+                Complaint.objects.using(ALIAS).filter(id=complaint_id).update(
+                    status=rng.choice([s for s in statuses if s != status]), updated_at=timezone.now(),
+                )
+                ComplaintComment.objects.using(ALIAS).bulk_create([
+                    ComplaintComment(complaint_id=complaint_id, user_id=user_id, comment='Concurrency benchmark'),
+                ])
+
+        def worker(operation, result, seed):
+            rng = random.Random(seed)
+            try:
+                while time.perf_counter() < deadline:
+                    started = time.perf_counter()
+                    try:
+                        operation(rng)
+                        failed = False
+                    except OperationalError:
+                        failed = True
+                    latency = time.perf_counter() - started
+                    with lock:
+                        result.latencies.append(latency)
+                        result.errors += failed
+            finally:
+                connections[ALIAS].close()
+
+        threads = [threading.Thread(target=worker, args=(read, reads, i)) for i in range(options['readers'])]
+        threads += [
+            threading.Thread(target=worker, args=(write, writes, 1000 + i)) for i in range(options['writers'])
+        ]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        reads.elapsed = writes.elapsed = time.perf_counter() - started
+        connections[ALIAS].close()
+        del connections[ALIAS]
+        return [reads.summary(), writes.summary()]
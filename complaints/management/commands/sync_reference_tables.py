@@ -0,0 +1,23 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from complaints import sharding
+
+
+class Command(BaseCommand):
+    help = (
+        "Copy users and categories from the default database to every COMPLAINT_SHARDS "
+        "shard and COMPLAINT_COLD_DATABASES database, e.g. after adding them or loading "
+        "users with bulk tools"
+    )
+
+    def handle(self, *args, **options):
+        aliases = sharding.reference_aliases()
+        if not aliases:
+            raise CommandError('No shards or cold databases configured; set COMPLAINT_SHARDS or COMPLAINT_COLD_DATABASES')
+        started = time.monotonic()
+        copied = sharding.sync_reference_tables()
+        self.stdout.write(self.style.SUCCESS(
+            f'Copied {copied} rows to {len(aliases)} database(s) in {time.monotonic() - started:.1f}s'
+        ))
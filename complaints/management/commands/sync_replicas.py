@@ -0,0 +1,48 @@
+import sqlite3
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections
+
+from complaints.routers import replica_aliases
+
+
+class Command(BaseCommand):
+    help = (
+        "Copy a SQLite primary into its DATABASE_REPLICAS files, standing in for "
+        "replication when trying read/write splitting locally"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--interval', type=float, default=0,
+            help='Keep copying every this many seconds (the simulated replication lag) instead of once',
+        )
+
+    def handle(self, *args, **options):
+        if connections[DEFAULT_DB_ALIAS].vendor != 'sqlite':
+            raise CommandError('Only SQLite primaries can be copied; other databases replicate themselves')
+        aliases = replica_aliases()
+        if not aliases:
+            raise CommandError('No replicas configured; set DATABASE_REPLICAS')
+
+        while True:
+            started = time.monotonic()
+            for alias in aliases:
+                self.copy(settings.DATABASES[alias]['NAME'])
+            self.stdout.write(f'Copied to {len(aliases)} replica(s) in {time.monotonic() - started:.2f}s')
+            if not options['interval']:
+                return
+            time.sleep(options['interval'])
+
+    def copy(self, path):
+        # The backup API copies a consistent snapshot while the app keeps writing
+        source = sqlite3.connect(str(settings.DATABASES[DEFAULT_DB_ALIAS]['NAME']))
+        target = sqlite3.connect(str(path), timeout=30)
+        try:
+            with target:
+                source.backup(target)
+        finally:
+            source.close()
+            target.close()
@@ -0,0 +1,197 @@
+import logging
+import threading
+import time
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+
+from . import metrics
+from .routers import replica_aliases, replica_reads
+
+slow_request_logger = logging.getLogger('complaints.slow_requests')
+
+# The tracker of the request being handled. A context variable rather than a
+# per-connection wrapper, because async views run their queries on executor
+# threads, each with its own connection; the context follows them there.
+current_tracker = ContextVar('current_tracker', default=None)
+
+
+class QueryTracker:
+    """Counts and times the queries of one request."""
+
+    def __init__(self, keep_sql):
+        self.count = 0
+        self.duration = 0.0
+        self.keep_sql = keep_sql
+        self.statements = []
+        # Async views can run queries on several executor threads at once
+        self.lock = threading.Lock()
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = time.perf_counter() - started
+            with self.lock:
+                self.count += 1
+                self.duration += elapsed
+                if self.keep_sql and len(self.statements) < 200:
+                    self.statements.append((elapsed, sql))
+
+
+def track_queries(execute, sql, params, many, context):
+    tracker = current_tracker.get()
+    if tracker is None:
+        return execute(sql, params, many, context)
+    return tracker(execute, sql, params, many, context)
+
+
+def install_query_tracking(connection):
+    # First in the list, so execute_wrapper() blocks opened earlier pop their own wrapper
+    if track_queries not in connection.execute_wrappers:
+        connection.execute_wrappers.insert(0, track_queries)
+
+
+def install_all_query_tracking():
+    # Connections opened before this module was imported missed the signal
+    for alias in connections:
+        install_query_tracking(connections[alias])
+
+
+def _connection_created(sender, connection, **kwargs):
+    install_query_tracking(connection)
+
+
+connection_created.connect(_connection_created)
+
+
+class RequestMetricsMiddleware:
+    """Record per-view wall time, query count and DB time.
+
+    Adds a ``Server-Timing`` header, feeds the histograms served at
+    ``/metrics`` and logs the SQL of requests slower than
+    ``SLOW_REQUEST_THRESHOLD_MS``. Works under both WSGI and ASGI.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.threshold = getattr(settings, 'SLOW_REQUEST_THRESHOLD_MS', 500) / 1000
+        self.keep_sql = self.threshold > 0
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        install_all_query_tracking()
+        tracker = QueryTracker(self.keep_sql)
+        token = current_tracker.set(tracker)
+        started = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            current_tracker.reset(token)
+        self.record(request, response, tracker, time.perf_counter() - started)
+        return response
+
+    async def __acall__(self, request):
+        # On the thread the request's sync code and ORM calls run on
+        await sync_to_async(install_all_query_tracking)()
+        tracker = QueryTracker(self.keep_sql)
+        token = current_tracker.set(tracker)
+        started = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            current_tracker.reset(token)
+        self.record(request, response, tracker, time.perf_counter() - started)
+        return response
+
+    def record(self, request, response, tracker, elapsed):
+        match = getattr(request, 'resolver_match', None)
+        labels = (match.view_name if match else 'unresolved', request.method)
+
+        metrics.request_duration.observe(elapsed, *labels)
+        metrics.request_db_duration.observe(tracker.duration, *labels)
+        metrics.request_db_queries.observe(tracker.count, *labels)
+        metrics.requests_total.inc(*labels, str(response.status_code))
+
+        response['Server-Timing'] = (
+            f'total;dur={elapsed * 1000:.1f}, '
+            f'db;dur={tracker.duration * 1000:.1f};desc="{tracker.count} queries"'
+        )
+
+        if self.keep_sql and elapsed >= self.threshold:
+            metrics.slow_requests_total.inc(*labels)
+            statements = '\n'.join(
+                f'  [{duration * 1000:.1f}ms] {sql}'
+                for duration, sql in sorted(tracker.statements, reverse=True)
+            )
+            slow_request_logger.warning(
+                'Slow request %s %s (%s): %.0fms, %d queries, %.0fms in DB\n%s',
+                request.method, request.path, labels[0], elapsed * 1000,
+                tracker.count, tracker.duration * 1000, statements,
+            )
+
+
+# Unix time until which the client's reads stay on the primary
+PRIMARY_PIN_COOKIE = 'db_primary_until'
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS', 'TRACE')
+
+
+class ReplicaRoutingMiddleware:
+    """Let read-only requests read from replicas (see ``routers.py``).
+
+    Requests that may write read from the primary, and a successful one
+    pins the client to the primary for ``REPLICA_PIN_SECONDS`` so it reads
+    its own writes. Does nothing without replicas.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.enabled = bool(replica_aliases())
+        self.pin_seconds = getattr(settings, 'REPLICA_PIN_SECONDS', 5)
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        if not self.enabled:
+            return self.get_response(request)
+        with replica_reads(self.use_replicas(request)):
+            response = self.get_response(request)
+        return self.pin(request, response)
+
+    async def __acall__(self, request):
+        if not self.enabled:
+            return await self.get_response(request)
+        with replica_reads(self.use_replicas(request)):
+            response = await self.get_response(request)
+        return self.pin(request, response)
+
+    def use_replicas(self, request):
+        if request.method not in SAFE_METHODS:
+            return False
+        try:
+            return float(request.COOKIES.get(PRIMARY_PIN_COOKIE, 0)) < time.time()
+        except ValueError:
+            return True
+
+    def pin(self, request, response):
+        if request.method not in SAFE_METHODS and response.status_code < 400:
+            response.set_cookie(
+                PRIMARY_PIN_COOKIE, f'{time.time() + self.pin_seconds:.0f}',
+                max_age=self.pin_seconds, httponly=True, samesite='Lax',
+            )
+        return response
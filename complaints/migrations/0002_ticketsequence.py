@@ -0,0 +1,38 @@
+# Generated by Django 4.2.7 on 2026-10-18 10:44
+
+from django.db import migrations, models
+from django.db.models import Max
+
+
+def seed_ticket_sequence(apps, schema_editor):
+    Complaint = apps.get_model('complaints', 'Complaint')
+    TicketSequence = apps.get_model('complaints', 'TicketSequence')
+
+    # Start after every number already issued, whichever scheme produced it
+    last = Complaint.objects.aggregate(last=Max('id'))['last'] or 0
+    for ticket_number in Complaint.objects.values_list('ticket_number', flat=True).iterator():
+        suffix = ticket_number.rsplit('-', 1)[-1]
+        if suffix.isdigit():
+            last = max(last, int(suffix))
+    TicketSequence.objects.update_or_create(
+        name='complaint_ticket', defaults={'next_value': last + 1}
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('complaints', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TicketSequence',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=50, unique=True)),
+                ('next_value', models.PositiveBigIntegerField(default=1)),
+            ],
+        ),
+        migrations.RunPython(seed_ticket_sequence, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 4.2.7 on 2026-10-18 10:45
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('complaints', '0002_ticketsequence'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ComplaintRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('granularity', models.CharField(choices=[('hour', 'Hour'), ('day', 'Day')], max_length=10)),
+                ('bucket', models.DateTimeField()),
+                ('dimension', models.CharField(choices=[('status', 'Status'), ('priority', 'Priority'), ('category', 'Category')], max_length=20)),
+                ('value', models.CharField(max_length=50)),
+                ('created_count', models.PositiveIntegerField(default=0, help_text='Complaints created in this bucket')),
+                ('entered_count', models.PositiveIntegerField(default=0, help_text='Complaints that moved into this value')),
+                ('exited_count', models.PositiveIntegerField(default=0, help_text='Complaints that moved out of this value')),
+            ],
+            options={
+                'ordering': ['granularity', 'bucket'],
+                'indexes': [models.Index(fields=['granularity', 'dimension', 'bucket'], name='complaints__granula_1c499e_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='complaintrollup',
+            constraint=models.UniqueConstraint(fields=('granularity', 'dimension', 'value', 'bucket'), name='unique_complaint_rollup_bucket'),
+        ),
+    ]
@@ -0,0 +1,73 @@
+# Generated by Django 4.2.7 on 2026-10-18 11:02
+
+from django.db import OperationalError, migrations
+
+# The index as it stood when this migration was written; later changes to
+# complaints.search get their own migrations.
+SQLITE_FTS_SQL = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS complaints_complaint_fts USING fts5("
+    "title, description, content='complaints_complaint', content_rowid='id')",
+    "CREATE TRIGGER IF NOT EXISTS complaints_complaint_fts_ai AFTER INSERT ON complaints_complaint BEGIN "
+    "INSERT INTO complaints_complaint_fts(rowid, title, description) "
+    "VALUES (new.id, new.title, new.description); END",
+    "CREATE TRIGGER IF NOT EXISTS complaints_complaint_fts_ad AFTER DELETE ON complaints_complaint BEGIN "
+    "INSERT INTO complaints_complaint_fts(complaints_complaint_fts, rowid, title, description) "
+    "VALUES ('delete', old.id, old.title, old.description); END",
+    "CREATE TRIGGER IF NOT EXISTS complaints_complaint_fts_au AFTER UPDATE OF title, description "
+    "ON complaints_complaint BEGIN "
+    "INSERT INTO complaints_complaint_fts(complaints_complaint_fts, rowid, title, description) "
+    "VALUES ('delete', old.id, old.title, old.description); "
+    "INSERT INTO complaints_complaint_fts(rowid, title, description) "
+    "VALUES (new.id, new.title, new.description); END",
+    "INSERT INTO complaints_complaint_fts(complaints_complaint_fts) VALUES ('rebuild')",
+]
+
+SQLITE_FTS_DROP_SQL = [
+    "DROP TRIGGER IF EXISTS complaints_complaint_fts_ai",
+    "DROP TRIGGER IF EXISTS complaints_complaint_fts_ad",
+    "DROP TRIGGER IF EXISTS complaints_complaint_fts_au",
+    "DROP TABLE IF EXISTS complaints_complaint_fts",
+]
+
+MYSQL_FULLTEXT_SQL = [
+    "ALTER TABLE complaints_complaint ADD FULLTEXT INDEX complaints_complaint_fulltext (title, description)",
+]
+
+MYSQL_FULLTEXT_DROP_SQL = [
+    "ALTER TABLE complaints_complaint DROP INDEX complaints_complaint_fulltext",
+]
+
+
+def install_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'sqlite':
+        try:
+            for statement in SQLITE_FTS_SQL:
+                schema_editor.execute(statement)
+        except OperationalError:
+            # SQLite compiled without FTS5: search falls back to LIKE
+            pass
+    elif vendor == 'mysql':
+        for statement in MYSQL_FULLTEXT_SQL:
+            schema_editor.execute(statement)
+
+
+def uninstall_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'sqlite':
+        for statement in SQLITE_FTS_DROP_SQL:
+            schema_editor.execute(statement)
+    elif vendor == 'mysql':
+        for statement in MYSQL_FULLTEXT_DROP_SQL:
+            schema_editor.execute(statement)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('complaints', '0003_complaintrollup'),
+    ]
+
+    operations = [
+        migrations.RunPython(install_search_index, uninstall_search_index),
+    ]
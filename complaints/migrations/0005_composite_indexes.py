@@ -0,0 +1,53 @@
+# Generated by Django 4.2.7 on 2026-10-18 10:50
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('complaints', '0004_search_index'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='complaint',
+            name='complaints__status_7c8de0_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='complaint',
+            name='complaints__priorit_f4170d_idx',
+        ),
+        migrations.AddIndex(
+            model_name='complaint',
+            index=models.Index(fields=['status', 'created_at'], name='complaint_status_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='complaint',
+            index=models.Index(fields=['priority', 'created_at'], name='complaint_prio_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='complaint',
+            index=models.Index(fields=['status', 'priority'], name='complaint_status_prio_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='complaint',
+            index=models.Index(fields=['created_by', 'created_at'], name='complaint_creator_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='complaint',
+            index=models.Index(fields=['created_by', 'status', 'priority'], name='complaint_creator_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='complaint',
+            index=models.Index(fields=['assigned_to', 'status', 'created_at'], name='complaint_assignee_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='complaintcomment',
+            index=models.Index(fields=['complaint', 'created_at'], name='comment_complaint_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='complainthistory',
+            index=models.Index(fields=['complaint', '-changed_at'], name='history_complaint_changed_idx'),
+        ),
+    ]
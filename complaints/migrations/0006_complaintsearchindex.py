@@ -0,0 +1,27 @@
+# Generated by Django 4.2.7 on 2026-10-18 10:59
+
+import complaints.fields
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('complaints', '0005_composite_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ComplaintSearchIndex',
+            fields=[
+                ('complaint', models.OneToOneField(db_column='rowid', db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, primary_key=True, related_name='search_index', serialize=False, to='complaints.complaint')),
+                ('document', complaints.fields.FullTextDocumentField(db_column='complaints_complaint_fts')),
+                ('rank', models.FloatField()),
+            ],
+            options={
+                'db_table': 'complaints_complaint_fts',
+                'managed': False,
+            },
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 4.2.7 on 2026-10-18 11:08
+
+import complaints.storage
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('complaints', '0006_complaintsearchindex'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AttachmentBlob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('sha256', models.CharField(max_length=64, unique=True)),
+                ('name', models.CharField(max_length=255, unique=True)),
+                ('size', models.PositiveBigIntegerField()),
+                ('ref_count', models.PositiveIntegerField(default=0, help_text='Complaints pointing at this file')),
+                ('thumbnail', models.CharField(blank=True, help_text='Empty until rendered', max_length=255)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.AlterField(
+            model_name='complaint',
+            name='attachment',
+            field=models.FileField(blank=True, null=True, storage=complaints.storage.attachment_storage, upload_to='complaint_attachments/'),
+        ),
+    ]
@@ -0,0 +1,40 @@
+# Generated by Django 4.2.7 on 2026-10-18 11:21
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('complaints', '0008_job'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ComplaintTombstone',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('complaint_id', models.BigIntegerField()),
+                ('ticket_number', models.CharField(max_length=20)),
+                ('creator_id', models.IntegerField()),
+                ('deleted_at', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='complaint',
+            index=models.Index(fields=['updated_at', 'id'], name='complaint_updated_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='complaint',
+            index=models.Index(fields=['created_by', 'updated_at'], name='complaint_creator_updated_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='complainttombstone',
+            index=models.Index(fields=['deleted_at', 'complaint_id'], name='tombstone_deleted_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='complainttombstone',
+            index=models.Index(fields=['creator_id', 'deleted_at'], name='tombstone_creator_deleted_idx'),
+        ),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 4.2.7 on 2026-10-18 11:51
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('complaints', '0009_complainttombstone'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='HistoryArchiveBlock',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('segment', models.CharField(max_length=100)),
+                ('offset', models.PositiveBigIntegerField()),
+                ('length', models.PositiveIntegerField(help_text='Compressed size in bytes')),
+                ('entry_count', models.PositiveIntegerField()),
+                ('first_changed_at', models.DateTimeField()),
+                ('last_changed_at', models.DateTimeField()),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='complainthistory',
+            index=models.Index(fields=['changed_at', 'id'], name='history_changed_idx'),
+        ),
+        migrations.AddField(
+            model_name='historyarchiveblock',
+            name='complaint',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='archived_history', to='complaints.complaint'),
+        ),
+        migrations.AddIndex(
+            model_name='historyarchiveblock',
+            index=models.Index(fields=['complaint', 'first_changed_at'], name='archive_complaint_changed_idx'),
+        ),
+    ]
@@ -2,6 +2,9 @@ from django.db import models
 from django.contrib.auth.models import User
 from django.utils import timezone
 
+from .fields import FullTextDocumentField
+from .storage import attachment_storage
+
 
 class ComplaintCategory(models.Model):
     name = models.CharField(max_length=100, unique=True)
@@ -16,6 +19,50 @@ class ComplaintCategory(models.Model):
         ordering = ['name']
 
 
+class TicketSequence(models.Model):
+    """Counter row used to hand out ticket numbers without scanning complaints."""
+    name = models.CharField(max_length=50, unique=True)
+    next_value = models.PositiveBigIntegerField(default=1)
+
+    def __str__(self):
+        return f"{self.name} (next: {self.next_value})"
+
+
+class ShardedModel(models.Model):
+    """Row stored on the shard of its complaint when complaints are sharded (see ``sharding.py``)."""
+
+    class Meta:
+        abstract = True
+
+    def save(self, *args, **kwargs):
+        from .sharding import is_sharded, shard_for_id
+        if is_sharded():
+            # Also overrides the hint-less alias passed by ``objects.create()``
+            kwargs['using'] = shard_for_id(self.complaint_id)
+        super().save(*args, **kwargs)
+
+
+class ComplaintQuerySet(models.QuerySet):
+    include_archived = False
+
+    def _clone(self):
+        clone = super()._clone()
+        clone.include_archived = self.include_archived
+        return clone
+
+    def with_archived(self):
+        """Also read the cold tier (see ``tiering.py``) wherever the query fans out."""
+        clone = self._chain()
+        clone.include_archived = True
+        return clone
+
+    def for_ticket(self, ticket_number):
+        """Complaints on the shard holding ``ticket_number``, filtered to it."""
+        from .sharding import is_sharded, shard_for_ticket
+        queryset = self.using(shard_for_ticket(ticket_number)) if is_sharded() else self
+        return queryset.filter(ticket_number=ticket_number)
+
+
 class Complaint(models.Model):
     STATUS_CHOICES = [
         ('pending', 'Pending'),
@@ -55,17 +102,34 @@ class Complaint(models.Model):
     contact_phone = models.CharField(max_length=20, blank=True)
     
     # File Attachments
-    attachment = models.FileField(upload_to='complaint_attachments/', blank=True, null=True)
+    attachment = models.FileField(
+        upload_to='complaint_attachments/', storage=attachment_storage, blank=True, null=True
+    )
     
     # Resolution Information
     resolution_notes = models.TextField(blank=True)
     
+    objects = ComplaintQuerySet.as_manager()
+    
     class Meta:
         ordering = ['-created_at']
         indexes = [
-            models.Index(fields=['status']),
-            models.Index(fields=['priority']),
+            # Newest-first listing; id comes along as the tie-breaker
             models.Index(fields=['created_at']),
+            models.Index(fields=['status', 'created_at'], name='complaint_status_created_idx'),
+            models.Index(fields=['priority', 'created_at'], name='complaint_prio_created_idx'),
+            # Staff-wide counters (including urgent-open) read only this index
+            models.Index(fields=['status', 'priority'], name='complaint_status_prio_idx'),
+            # A user's own complaints: listing and per-user counters
+            models.Index(fields=['created_by', 'created_at'], name='complaint_creator_created_idx'),
+            models.Index(fields=['created_by', 'status', 'priority'], name='complaint_creator_status_idx'),
+            # Assignee workloads
+            models.Index(fields=['assigned_to', 'status', 'created_at'], name='complaint_assignee_status_idx'),
+            # Delta sync: rows changed since a cursor, staff-wide and per user
+            models.Index(fields=['updated_at', 'id'], name='complaint_updated_idx'),
+            # Finished complaints due for the cold tier, oldest first
+            models.Index(fields=['status', 'updated_at', 'id'], name='complaint_status_updated_idx'),
+            models.Index(fields=['created_by', 'updated_at'], name='complaint_creator_updated_idx'),
         ]
 
     def __str__(self):
@@ -73,13 +137,17 @@ class Complaint(models.Model):
 
     def save(self, *args, **kwargs):
         if not self.ticket_number:
-            # Generate ticket number
-            last_complaint = Complaint.objects.order_by('-id').first()
-            if last_complaint:
-                last_id = last_complaint.id
-            else:
-                last_id = 0
-            self.ticket_number = f"COMP-{str(last_id + 1).zfill(6)}"
+            # Generate ticket number from the shared sequence
+            from .tickets import next_ticket_number
+            self.ticket_number = next_ticket_number()
+        
+        from .sharding import assign_ids, is_sharded, shard_for_id
+        if is_sharded():
+            if self._state.adding:
+                assign_ids([self])
+                kwargs.setdefault('force_insert', True)
+            # The id picks the shard the row is written to
+            kwargs['using'] = shard_for_id(self.pk)
         
         # Set resolved_at when status changes to resolved
         if self.status == 'resolved' and not self.resolved_at:
@@ -90,7 +158,34 @@ class Complaint(models.Model):
         super().save(*args, **kwargs)
 
 
-class ComplaintComment(models.Model):
+class AttachmentBlob(models.Model):
+    """One stored attachment file, shared by every complaint that uploaded the same content."""
+    sha256 = models.CharField(max_length=64, unique=True)
+    name = models.CharField(max_length=255, unique=True)
+    size = models.PositiveBigIntegerField()
+    ref_count = models.PositiveIntegerField(default=0, help_text="Complaints pointing at this file")
+    thumbnail = models.CharField(max_length=255, blank=True, help_text="Empty until rendered")
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.name} ({self.ref_count} refs)"
+
+
+class ComplaintSearchIndex(models.Model):
+    """Read-only mapping of the SQLite FTS5 table created by ``search.py``."""
+    complaint = models.OneToOneField(
+        Complaint, on_delete=models.DO_NOTHING, primary_key=True, db_column='rowid',
+        db_constraint=False, related_name='search_index',
+    )
+    document = FullTextDocumentField(db_column='complaints_complaint_fts')
+    rank = models.FloatField()
+
+    class Meta:
+        managed = False
+        db_table = 'complaints_complaint_fts'
+
+
+class ComplaintComment(ShardedModel):
     complaint = models.ForeignKey(Complaint, on_delete=models.CASCADE, related_name='comments')
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     comment = models.TextField()
@@ -99,12 +194,15 @@ class ComplaintComment(models.Model):
 
     class Meta:
         ordering = ['created_at']
+        indexes = [
+            models.Index(fields=['complaint', 'created_at'], name='comment_complaint_created_idx'),
+        ]
 
     def __str__(self):
         return f"Comment on {self.complaint.ticket_number} by {self.user.username}"
 
 
-class ComplaintHistory(models.Model):
+class ComplaintHistory(ShardedModel):
     complaint = models.ForeignKey(Complaint, on_delete=models.CASCADE, related_name='history')
     changed_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True)
     field_name = models.CharField(max_length=50)
@@ -115,6 +213,119 @@ class ComplaintHistory(models.Model):
     class Meta:
         ordering = ['-changed_at']
         verbose_name_plural = "Complaint Histories"
+        indexes = [
+            models.Index(fields=['complaint', '-changed_at'], name='history_complaint_changed_idx'),
+            # The admin changelist and the archiver's oldest-first scan
+            models.Index(fields=['changed_at', 'id'], name='history_changed_idx'),
+        ]
 
     def __str__(self):
         return f"{self.complaint.ticket_number} - {self.field_name} changed"
+
+
+class HistoryArchiveBlock(ShardedModel):
+    """Where one complaint's archived history entries sit in a segment file (see ``history_archive.py``)."""
+    complaint = models.ForeignKey(Complaint, on_delete=models.CASCADE, related_name='archived_history')
+    segment = models.CharField(max_length=100)
+    offset = models.PositiveBigIntegerField()
+    length = models.PositiveIntegerField(help_text="Compressed size in bytes")
+    entry_count = models.PositiveIntegerField()
+    first_changed_at = models.DateTimeField()
+    last_changed_at = models.DateTimeField()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['complaint', 'first_changed_at'], name='archive_complaint_changed_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.entry_count} entries of complaint {self.complaint_id} in {self.segment}"
+
+
+class ComplaintTombstone(models.Model):
+    """Left behind by a deleted complaint so delta-sync clients can drop it (see ``sync.py``)."""
+    complaint_id = models.BigIntegerField()
+    ticket_number = models.CharField(max_length=20)
+    # Plain ids: tombstones must outlive the complaint and its creator
+    creator_id = models.IntegerField()
+    deleted_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['deleted_at', 'complaint_id'], name='tombstone_deleted_idx'),
+            models.Index(fields=['creator_id', 'deleted_at'], name='tombstone_creator_deleted_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.ticket_number} deleted {self.deleted_at:%Y-%m-%d %H:%M}"
+
+
+class ComplaintRollup(models.Model):
+    """Pre-aggregated complaint counts per time bucket, maintained incrementally."""
+    GRANULARITY_CHOICES = [
+        ('hour', 'Hour'),
+        ('day', 'Day'),
+    ]
+
+    DIMENSION_CHOICES = [
+        ('status', 'Status'),
+        ('priority', 'Priority'),
+        ('category', 'Category'),
+    ]
+
+    granularity = models.CharField(max_length=10, choices=GRANULARITY_CHOICES)
+    bucket = models.DateTimeField()
+    dimension = models.CharField(max_length=20, choices=DIMENSION_CHOICES)
+    value = models.CharField(max_length=50)
+    created_count = models.PositiveIntegerField(default=0, help_text="Complaints created in this bucket")
+    entered_count = models.PositiveIntegerField(default=0, help_text="Complaints that moved into this value")
+    exited_count = models.PositiveIntegerField(default=0, help_text="Complaints that moved out of this value")
+
+    class Meta:
+        ordering = ['granularity', 'bucket']
+        constraints = [
+            models.UniqueConstraint(
+                fields=['granularity', 'dimension', 'value', 'bucket'],
+                name='unique_complaint_rollup_bucket',
+            ),
+        ]
+        indexes = [
+            models.Index(fields=['granularity', 'dimension', 'bucket']),
+        ]
+
+    def __str__(self):
+        return f"{self.granularity} {self.bucket:%Y-%m-%d %H:%M} {self.dimension}={self.value}"
+
+
+class Job(models.Model):
+    """Background job in the database-backed queue (see ``jobs.py``)."""
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('running', 'Running'),
+        ('done', 'Done'),
+        ('failed', 'Failed'),
+    ]
+
+    name = models.CharField(max_length=100)
+    payload = models.JSONField(default=dict)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='pending')
+    attempts = models.PositiveIntegerField(default=0)
+    max_attempts = models.PositiveIntegerField(default=5)
+    run_after = models.DateTimeField(default=timezone.now)
+    locked_by = models.CharField(max_length=100, blank=True)
+    locked_at = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['run_after', 'id']
+        indexes = [
+            # Workers claim the oldest due pending jobs
+            models.Index(fields=['status', 'run_after'], name='job_status_run_after_idx'),
+            # Per-name concurrency limits and queue depth by name
+            models.Index(fields=['status', 'name'], name='job_status_name_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.name} #{self.pk} ({self.status})"
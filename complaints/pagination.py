@@ -0,0 +1,201 @@
+"""
+Keyset (cursor) pagination.
+
+Pages are fetched with ``WHERE (created_at, id) < (last seen)`` instead of
+``OFFSET``, so every page costs the same indexed range scan no matter how
+deep it is, and no ``COUNT(*)`` is needed to render it. Cursors are opaque
+URL-safe tokens holding the ordering values of the row at the page edge.
+
+With sharded complaints each shard serves the page from its own index and
+the pages are merge-sorted; the page edge is in the same order everywhere.
+"""
+import base64
+import datetime
+import json
+import operator
+from functools import reduce
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+
+from . import sharding
+
+DEFAULT_ORDERING = ('-created_at', '-id')
+
+
+class CursorEncoder(DjangoJSONEncoder):
+    def default(self, o):
+        # DjangoJSONEncoder drops microseconds, which would skip or repeat rows
+        if isinstance(o, datetime.datetime):
+            return o.isoformat()
+        return super().default(o)
+
+
+def encode_cursor(values, direction):
+    payload = json.dumps({'v': values, 'd': direction}, cls=CursorEncoder, separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+
+def decode_cursor(token, fields=None):
+    """Return ``(values, direction)``, or ``(None, None)`` for a missing or bad token.
+
+    With ``fields`` (the model fields of the ordering) the values must match
+    them in number and type; they come back converted by ``to_python``.
+    """
+    if not token:
+        return None, None
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(token + '=' * (-len(token) % 4)))
+        values, direction = payload['v'], payload['d']
+        if direction not in ('next', 'prev') or not isinstance(values, list):
+            return None, None
+        if fields is None:
+            values = [(parse_datetime(v) or v) if isinstance(v, str) else v for v in values]
+        elif len(values) != len(fields) or None in values:
+            return None, None
+        else:
+            values = [field.to_python(value) for field, value in zip(fields, values)]
+    except (ValueError, TypeError, KeyError, AttributeError, ValidationError):
+        # Tampered tokens start over at the first page
+        return None, None
+    return values, direction
+
+
+class KeysetPage:
+    def __init__(self, object_list, next_cursor, prev_cursor):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.prev_cursor = prev_cursor
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    @property
+    def has_previous(self):
+        return self.prev_cursor is not None
+
+    def has_other_pages(self):
+        return self.has_next or self.has_previous
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+
+class KeysetPaginator:
+    """Paginate ``queryset`` by its ordering, which must end in a unique field.
+
+    The queryset's own ``order_by`` is used when it has one (search results
+    are ordered by relevance), with ``-id`` appended as a tie-breaker.
+    """
+
+    def __init__(self, queryset, per_page, ordering=None):
+        ordering = list(ordering or queryset.query.order_by or DEFAULT_ORDERING)
+        if not any(name.lstrip('-') in ('id', 'pk') for name in ordering):
+            ordering.append('-id')
+        self.queryset = queryset
+        self.per_page = per_page
+        self.fields = [(name.lstrip('-'), name.startswith('-')) for name in ordering]
+
+    def _model_fields(self):
+        """The field behind each ordering name, to check cursor values against."""
+        fields = []
+        for name, _descending in self.fields:
+            annotation = self.queryset.query.annotations.get(name)
+            if annotation is not None:
+                fields.append(annotation.output_field)
+            elif name == 'pk':
+                fields.append(self.queryset.model._meta.pk)
+            else:
+                fields.append(self.queryset.model._meta.get_field(name))
+        return fields
+
+    def _key(self, row):
+        if isinstance(row, dict):
+            return [row[name] for name, _descending in self.fields]
+        return [getattr(row, name) for name, _descending in self.fields]
+
+    def _after(self, values, backwards):
+        """Q matching rows strictly after ``values`` in the (possibly reversed) ordering."""
+        terms = []
+        for i, (name, descending) in enumerate(self.fields):
+            lookup = 'lt' if descending != backwards else 'gt'
+            term = Q(**{f'{name}__{lookup}': values[i]})
+            for j, (earlier, _descending) in enumerate(self.fields[:i]):
+                term &= Q(**{earlier: values[j]})
+            terms.append(term)
+        return reduce(operator.or_, terms)
+
+    def _ordering(self, backwards):
+        return [
+            ('-' if descending != backwards else '') + name
+            for name, descending in self.fields
+        ]
+
+    def _page_query(self, cursor):
+        """Return ``(queryset, cursor values, backwards)`` for the page at ``cursor``."""
+        values, direction = decode_cursor(cursor, self._model_fields())
+        backwards = direction == 'prev'
+
+        queryset = self.queryset.order_by(*self._ordering(backwards))
+        if values is not None:
+            queryset = queryset.filter(self._after(values, backwards))
+        return queryset[:self.per_page + 1], values, backwards
+
+    def get_page(self, cursor=None):
+        queryset, values, backwards = self._page_query(cursor)
+        shards = sharding.querysets(queryset)
+        if len(shards) == 1:
+            rows = list(queryset)
+        else:
+            rows = sharding.merge(
+                sharding.fan_out(list, shards),
+                sharding.ordering_fields(self._ordering(backwards)),
+                self.per_page + 1,
+            )
+        return self._build_page(rows, values, backwards)
+
+    async def aget_page(self, cursor=None):
+        if len(sharding.querysets(self.queryset)) > 1:
+            return await sync_to_async(self.get_page)(cursor)
+        queryset, values, backwards = self._page_query(cursor)
+        return self._build_page([row async for row in queryset], values, backwards)
+
+    def _build_page(self, rows, values, backwards):
+        has_more = len(rows) > self.per_page
+        rows = rows[:self.per_page]
+        if backwards:
+            rows.reverse()
+
+        if not rows:
+            return KeysetPage(rows, None, None)
+        has_next = has_more if not backwards else True
+        has_previous = has_more if backwards else values is not None
+        return KeysetPage(
+            rows,
+            encode_cursor(self._key(rows[-1]), 'next') if has_next else None,
+            encode_cursor(self._key(rows[0]), 'prev') if has_previous else None,
+        )
+
+
+def approximate_count(queryset, cap=None):
+    """Return ``(count, exact)`` without paying for a full ``COUNT(*)``.
+
+    Counting stops after ``cap`` rows; past that ``exact`` is False and the
+    page header shows "``cap``+".
+    """
+    if cap is None:
+        cap = getattr(settings, 'COMPLAINT_LIST_COUNT_CAP', 1000)
+    count = sum(sharding.fan_out(
+        lambda shard: shard.order_by()[:cap + 1].count(), sharding.querysets(queryset)
+    ))
+    if count > cap:
+        return cap, False
+    return count, True
@@ -0,0 +1,313 @@
+"""
+Time-bucketed complaint rollups.
+
+``ComplaintRollup`` keeps hourly and daily counters per status, priority and
+category. They are bumped as complaints are created and change status (see
+``signals.py``; the updates run as background jobs), so trend charts only ever read a few hundred small rows
+instead of scanning ``Complaint`` and ``ComplaintHistory``.
+
+Without ``manage.py run_worker`` (or ``JOBS_EAGER``) those jobs never run and
+the trends go stale. ``get_trends`` reports how many updates are waiting and
+logs a warning, and ``manage.py check --database default`` flags it, once the
+oldest has waited ``ROLLUP_STALE_SECONDS``.
+
+Per bucket and value we track how many complaints were created, and how many
+moved into and out of that value. Summing ``entered - exited`` over all
+earlier buckets gives how many complaints held the value at that point, which
+is how the open backlog is derived.
+"""
+import logging
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+from django.conf import settings
+from django.core import checks
+from django.db import DatabaseError, IntegrityError, transaction
+from django.db.models import Count, F, Min, Sum
+from django.utils import timezone
+
+from . import sharding
+from .history_archive import iter_archived
+from .jobs import PENDING, enqueue, job
+from .models import Complaint, ComplaintCategory, ComplaintHistory, ComplaintRollup, Job
+
+logger = logging.getLogger(__name__)
+
+GRANULARITIES = ['hour', 'day']
+DIMENSIONS = ['status', 'priority', 'category']
+OPEN_STATUSES = ['pending', 'in_progress']
+
+NO_CATEGORY = 'none'
+
+
+def truncate(moment, granularity):
+    moment = moment.replace(minute=0, second=0, microsecond=0)
+    if granularity == 'day':
+        moment = moment.replace(hour=0)
+    return moment
+
+
+def category_value(category_id):
+    return str(category_id) if category_id else NO_CATEGORY
+
+
+class RollupBatch:
+    """Accumulates counter deltas in memory before writing them out."""
+
+    def __init__(self):
+        self.deltas = defaultdict(lambda: [0, 0, 0])
+
+    def add(self, moment, dimension, value, created=0, entered=0, exited=0):
+        for granularity in GRANULARITIES:
+            key = (granularity, truncate(moment, granularity), dimension, value)
+            delta = self.deltas[key]
+            delta[0] += created
+            delta[1] += entered
+            delta[2] += exited
+
+    def add_created(self, moment, status, priority, category_id):
+        self.add(moment, 'status', status, created=1, entered=1)
+        self.add(moment, 'priority', priority, created=1, entered=1)
+        self.add(moment, 'category', category_value(category_id), created=1, entered=1)
+
+    def add_transition(self, moment, dimension, old_value, new_value):
+        if old_value == new_value:
+            return
+        if old_value:
+            self.add(moment, dimension, old_value, exited=1)
+        if new_value:
+            self.add(moment, dimension, new_value, entered=1)
+
+    def apply(self):
+        """Add the accumulated deltas to the stored counters."""
+        with transaction.atomic():
+            for (granularity, bucket, dimension, value), (created, entered, exited) in self.deltas.items():
+                lookup = dict(granularity=granularity, bucket=bucket, dimension=dimension, value=value)
+                increments = dict(
+                    created_count=F('created_count') + created,
+                    entered_count=F('entered_count') + entered,
+                    exited_count=F('exited_count') + exited,
+                )
+                if ComplaintRollup.objects.filter(**lookup).update(**increments):
+                    continue
+                try:
+                    with transaction.atomic():
+                        ComplaintRollup.objects.create(
+                            created_count=created, entered_count=entered, exited_count=exited, **lookup
+                        )
+                except IntegrityError:
+                    # Created concurrently; fall back to incrementing it
+                    ComplaintRollup.objects.filter(**lookup).update(**increments)
+        self.deltas.clear()
+
+    def enqueue(self):
+        """Queue the accumulated deltas for a worker, in the current transaction."""
+        if self.deltas:
+            enqueue('rollups.apply', {'deltas': [
+                [granularity, bucket.isoformat(), dimension, value, *counts]
+                for (granularity, bucket, dimension, value), counts in self.deltas.items()
+            ]})
+        self.deltas.clear()
+
+    def create(self, batch_size=1000):
+        """Insert the deltas as new rows; used by the backfill on empty tables."""
+        ComplaintRollup.objects.bulk_create(
+            (
+                ComplaintRollup(
+                    granularity=granularity, bucket=bucket, dimension=dimension, value=value,
+                    created_count=created, entered_count=entered, exited_count=exited,
+                )
+                for (granularity, bucket, dimension, value), (created, entered, exited) in self.deltas.items()
+            ),
+            batch_size=batch_size,
+        )
+        self.deltas.clear()
+
+
+@job('rollups.apply')
+def apply_deltas(deltas):
+    """Job handler for ``RollupBatch.enqueue``."""
+    batch = RollupBatch()
+    for granularity, bucket, dimension, value, created, entered, exited in deltas:
+        batch.deltas[(granularity, datetime.fromisoformat(bucket), dimension, value)] = [created, entered, exited]
+    batch.apply()
+
+
+def pending_updates():
+    """Rollup updates waiting for a worker, and how long the oldest has been due (seconds)."""
+    now = timezone.now()
+    pending = Job.objects.filter(status=PENDING, name=apply_deltas.job_name, run_after__lte=now).aggregate(
+        count=Count('id'), oldest=Min('run_after'),
+    )
+    age = (now - pending['oldest']).total_seconds() if pending['oldest'] else 0
+    return pending['count'], age
+
+
+def _stale_message(count, age):
+    return f'{count} rollup updates are waiting for a job worker, the oldest for {int(age)}s; trends are stale'
+
+
+@checks.register(checks.Tags.database)
+def check_pending_updates(app_configs=None, databases=None, **kwargs):
+    if not databases or 'default' not in databases:
+        return []
+    try:
+        count, age = pending_updates()
+    except DatabaseError:
+        # Not migrated yet
+        return []
+    if not count or age < getattr(settings, 'ROLLUP_STALE_SECONDS', 300):
+        return []
+    return [checks.Warning(
+        _stale_message(count, age),
+        hint='Run manage.py run_worker, or set JOBS_EAGER in development.',
+        id='complaints.W001',
+    )]
+
+
+def record_created(complaint):
+    batch = RollupBatch()
+    batch.add_created(complaint.created_at, complaint.status, complaint.priority, complaint.category_id)
+    batch.enqueue()
+
+
+def record_transition(dimension, old_value, new_value, moment):
+    batch = RollupBatch()
+    batch.add_transition(moment, dimension, old_value, new_value)
+    batch.enqueue()
+
+
+def rebuild_rollups(batch_size=2000):
+    """Recompute every rollup from ``Complaint`` and status ``ComplaintHistory``, archived or not.
+
+    Returns the number of complaints and history rows replayed.
+    """
+    # The status a complaint was created with is the old value of its first
+    # recorded status change; without one, it still has its initial status.
+    initial_status = {}
+    status_changes = (
+        ComplaintHistory.objects.filter(field_name='status')
+        .order_by('changed_at', 'id')
+        .values_list('complaint_id', 'old_value', 'new_value', 'changed_at')
+    )
+    batch = RollupBatch()
+    history_count = 0
+    # A complaint's history is on one database (its shard or cold tier), so
+    # per-database order is enough; its archived entries are all older than
+    # the ones left in the table
+    for alias in sharding.complaint_databases(archived=True):
+        shard = status_changes.using(alias)
+        for entry in iter_archived(alias, 'status'):
+            initial_status.setdefault(entry.complaint_id, entry.old_value)
+            batch.add_transition(entry.changed_at, 'status', entry.old_value, entry.new_value)
+            history_count += 1
+        for complaint_id, old_value, new_value, changed_at in shard.iterator(chunk_size=batch_size):
+            initial_status.setdefault(complaint_id, old_value)
+            batch.add_transition(changed_at, 'status', old_value, new_value)
+            history_count += 1
+
+    complaints = Complaint.objects.with_archived().order_by().values_list(
+        'id', 'created_at', 'status', 'priority', 'category_id'
+    )
+    complaint_count = 0
+    for shard in sharding.querysets(complaints):
+        for complaint_id, created_at, status, priority, category_id in shard.iterator(chunk_size=batch_size):
+            batch.add_created(created_at, initial_status.get(complaint_id, status), priority, category_id)
+            complaint_count += 1
+
+    with transaction.atomic():
+        ComplaintRollup.objects.all().delete()
+        batch.create(batch_size=batch_size)
+    return complaint_count, history_count
+
+
+def _bucket_range(start, end, granularity):
+    step = timedelta(hours=1) if granularity == 'hour' else timedelta(days=1)
+    buckets = []
+    current = truncate(start, granularity)
+    while current <= end:
+        buckets.append(current)
+        current += step
+    return buckets
+
+
+def _week_start(moment):
+    return truncate(moment - timedelta(days=moment.weekday()), 'day')
+
+
+def get_trends(start, end, granularity='day'):
+    """Return created/entered/exited series per dimension plus the open backlog.
+
+    ``granularity`` is ``hour``, ``day`` or ``week``; weeks are summed from the
+    daily rollups and start on Monday.
+    """
+    stored = 'hour' if granularity == 'hour' else 'day'
+    buckets = _bucket_range(start, end, stored)
+    if granularity == 'week':
+        buckets = sorted({_week_start(bucket) for bucket in buckets})
+        regroup = _week_start
+    else:
+        regroup = lambda bucket: bucket  # noqa: E731
+    position = {bucket: i for i, bucket in enumerate(buckets)}
+
+    def empty_series():
+        return {key: [0] * len(buckets) for key in ('created', 'entered', 'exited')}
+
+    series = {dimension: defaultdict(empty_series) for dimension in DIMENSIONS}
+    backlog_delta = [0] * len(buckets)
+
+    rows = ComplaintRollup.objects.filter(
+        granularity=stored, bucket__gte=buckets[0] if buckets else start, bucket__lte=end
+    ).values_list('bucket', 'dimension', 'value', 'created_count', 'entered_count', 'exited_count')
+    for bucket, dimension, value, created, entered, exited in rows:
+        i = position.get(regroup(bucket))
+        if i is None:
+            continue
+        values = series[dimension][value]
+        values['created'][i] += created
+        values['entered'][i] += entered
+        values['exited'][i] += exited
+        if dimension == 'status' and value in OPEN_STATUSES:
+            backlog_delta[i] += entered - exited
+
+    # Backlog carried in from before the window
+    running = ComplaintRollup.objects.filter(
+        granularity='day', dimension='status', value__in=OPEN_STATUSES,
+        bucket__lt=truncate(buckets[0], 'day') if buckets else start,
+    ).aggregate(
+        entered=Sum('entered_count'), exited=Sum('exited_count')
+    )
+    running = (running['entered'] or 0) - (running['exited'] or 0)
+    if stored == 'hour' and buckets:
+        # Hours of the first day that fall before the window
+        earlier = ComplaintRollup.objects.filter(
+            granularity='hour', dimension='status', value__in=OPEN_STATUSES,
+            bucket__gte=truncate(buckets[0], 'day'), bucket__lt=buckets[0],
+        ).aggregate(entered=Sum('entered_count'), exited=Sum('exited_count'))
+        running += (earlier['entered'] or 0) - (earlier['exited'] or 0)
+    backlog = []
+    for delta in backlog_delta:
+        running += delta
+        backlog.append(running)
+
+    pending_count, pending_age = pending_updates()
+    if pending_count and pending_age >= getattr(settings, 'ROLLUP_STALE_SECONDS', 300):
+        logger.warning('%s; is manage.py run_worker running?', _stale_message(pending_count, pending_age))
+
+    category_names = dict(ComplaintCategory.objects.values_list('id', 'name'))
+    category_series = {}
+    for value, values in series['category'].items():
+        if value == NO_CATEGORY:
+            label = 'Uncategorized'
+        else:
+            label = category_names.get(int(value), f'Category {value}')
+        category_series[label] = values
+    series['category'] = category_series
+
+    return {
+        'granularity': granularity,
+        'buckets': [bucket.isoformat() for bucket in buckets],
+        'series': {dimension: dict(values) for dimension, values in series.items()},
+        'backlog': backlog,
+        'pending_updates': pending_count,
+    }
@@ -0,0 +1,126 @@
+"""
+Read/write splitting across the primary database and its replicas.
+
+``DATABASE_REPLICAS`` adds ``replica_1``, ``replica_2``, ... next to
+``default`` (see ``settings.py``). ``ReplicaRouter`` sends every write to
+``default`` and reads to a random replica only while ``replica_reads()`` is
+on: ``ReplicaRoutingMiddleware`` turns it on for GET and HEAD requests, so
+the list, dashboard, search and JSON API pages read from replicas while
+views that write, background jobs and management commands keep reading
+from the primary. Reads inside a transaction on the primary stay there too,
+and so do sessions and users: a logout or a deactivated account must take
+effect at once, not when the replicas catch up.
+
+After a user writes, the middleware pins their next
+``REPLICA_PIN_SECONDS`` of requests to the primary with a cookie. A
+replica that hasn't caught up yet can't hide the user's own change, e.g.
+on the detail page they're redirected to after filing a complaint.
+``REPLICA_PIN_SECONDS`` should therefore exceed the replicas' usual lag.
+
+``ShardRouter`` goes first when complaints are sharded or tiered (see
+``sharding.py`` and ``tiering.py``).
+"""
+import random
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+from . import sharding
+
+REPLICA_PREFIX = 'replica_'
+PRIMARY_ONLY_APPS = {'auth', 'sessions'}
+
+# Whether reads in the current request or block may go to a replica
+_replica_reads = ContextVar('replica_reads', default=False)
+
+
+def replica_aliases():
+    return [alias for alias in settings.DATABASES if alias.startswith(REPLICA_PREFIX)]
+
+
+@contextmanager
+def replica_reads(enabled=True):
+    """Let reads in this block go to replicas (or, with ``enabled=False``, keep them on the primary)."""
+    token = _replica_reads.set(enabled)
+    try:
+        yield
+    finally:
+        _replica_reads.reset(token)
+
+
+def reporting_db():
+    """Alias for reporting reads that can lag (exports): a replica if there is one."""
+    replicas = replica_aliases()
+    return random.choice(replicas) if replicas else DEFAULT_DB_ALIAS
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        if (
+            not _replica_reads.get()
+            or model._meta.app_label in PRIMARY_ONLY_APPS
+            or connections[DEFAULT_DB_ALIAS].in_atomic_block
+        ):
+            return DEFAULT_DB_ALIAS
+        replicas = replica_aliases()
+        return random.choice(replicas) if replicas else DEFAULT_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Same data everywhere, so objects read from any of them may be related
+        pool = {DEFAULT_DB_ALIAS, *replica_aliases()}
+        if obj1._state.db in pool and obj2._state.db in pool:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Replicas get their schema from the primary
+        if db.startswith(REPLICA_PREFIX):
+            return False
+        return None
+
+
+class ShardRouter:
+    """Send complaints, comments and history to the shard named by the instance hint.
+
+    Rows related to a complaint loaded from the cold tier are read from
+    there too. Without a hint the decision is left to the next router;
+    cross-shard queries pick their shards explicitly with ``using()``.
+    """
+
+    def _shard_for(self, model, hints):
+        if not sharding.is_sharded_model(model):
+            return None
+        instance = hints.get('instance')
+        if instance is None:
+            return None
+        db = instance._state.db or ''
+        if db.startswith(sharding.SHARD_PREFIX) or sharding.is_cold(db):
+            return db
+        if not sharding.is_sharded():
+            return None
+        complaint_id = getattr(instance, 'complaint_id', None) or (
+            instance.pk if instance._meta.label_lower == 'complaints.complaint' else None
+        )
+        if complaint_id is None:
+            return None
+        return sharding.shard_for_id(complaint_id)
+
+    def db_for_read(self, model, **hints):
+        return self._shard_for(model, hints)
+
+    def db_for_write(self, model, **hints):
+        return self._shard_for(model, hints)
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Users and categories are copied to every shard and cold database
+        if any(
+            (obj._state.db or '').startswith(sharding.SHARD_PREFIX) or sharding.is_cold(obj._state.db)
+            for obj in (obj1, obj2)
+        ):
+            return True
+        return None
@@ -0,0 +1,271 @@
+"""
+Full-text search over complaint titles and descriptions.
+
+The backend is picked from the database vendor (or ``COMPLAINT_SEARCH_BACKEND``):
+
+* SQLite uses an FTS5 external-content table kept in sync by triggers,
+  joined through the unmanaged ``ComplaintSearchIndex`` model.
+* MySQL uses a FULLTEXT index, which InnoDB maintains itself.
+* Anything else (or SQLite built without FTS5) falls back to ``icontains``.
+
+A full ticket number is answered from the unique ``ticket_number`` index
+instead of the text index; a bare or partial one (``42``, ``COMP-0004``)
+is matched against ticket numbers, titles and descriptions with
+``icontains`` as before, since the text index doesn't cover ticket numbers.
+"""
+import logging
+import re
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import OperationalError, connections
+from django.db.models import F, FloatField, Q
+from django.db.models.expressions import RawSQL
+from django.utils.module_loading import import_string
+
+from .tickets import TICKET_PREFIX, format_ticket_number
+
+logger = logging.getLogger(__name__)
+
+COMPLAINT_TABLE = 'complaints_complaint'
+FTS_TABLE = 'complaints_complaint_fts'
+FULLTEXT_INDEX = 'complaints_complaint_fulltext'
+
+TICKET_RE = re.compile(rf'^{re.escape(TICKET_PREFIX)}(\d{{6,}})$', re.IGNORECASE)
+TICKET_FRAGMENT_RE = re.compile(rf'^(?:{re.escape(TICKET_PREFIX)})?\d+$', re.IGNORECASE)
+WORD_RE = re.compile(r'\w+', re.UNICODE)
+
+SQLITE_FTS_SQL = [
+    f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5("
+    f"title, description, content='{COMPLAINT_TABLE}', content_rowid='id')",
+    f"CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ai AFTER INSERT ON {COMPLAINT_TABLE} BEGIN "
+    f"INSERT INTO {FTS_TABLE}(rowid, title, description) VALUES (new.id, new.title, new.description); END",
+    f"CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ad AFTER DELETE ON {COMPLAINT_TABLE} BEGIN "
+    f"INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, title, description) "
+    f"VALUES ('delete', old.id, old.title, old.description); END",
+    f"CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_au AFTER UPDATE OF title, description ON {COMPLAINT_TABLE} BEGIN "
+    f"INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, title, description) "
+    f"VALUES ('delete', old.id, old.title, old.description); "
+    f"INSERT INTO {FTS_TABLE}(rowid, title, description) VALUES (new.id, new.title, new.description); END",
+]
+
+SQLITE_FTS_DROP_SQL = [
+    f"DROP TRIGGER IF EXISTS {FTS_TABLE}_ai",
+    f"DROP TRIGGER IF EXISTS {FTS_TABLE}_ad",
+    f"DROP TRIGGER IF EXISTS {FTS_TABLE}_au",
+    f"DROP TABLE IF EXISTS {FTS_TABLE}",
+]
+
+
+def parse_ticket_number(query):
+    """Return the canonical ticket number if ``query`` is a full one."""
+    match = TICKET_RE.match(query.strip())
+    if match:
+        return format_ticket_number(int(match.group(1)))
+    return None
+
+
+class SearchBackend:
+    """Plain ``icontains`` search; also the base class for indexed backends."""
+
+    def __init__(self, using='default'):
+        self.using = using
+
+    @property
+    def connection(self):
+        return connections[self.using]
+
+    def is_available(self):
+        return True
+
+    def install(self):
+        """Create whatever the backend needs in the database."""
+
+    def uninstall(self):
+        """Drop whatever ``install`` created."""
+
+    def reindex(self):
+        """Rebuild the index from the complaints table."""
+
+    def search(self, queryset, query, ranked=True):
+        """Filter ``queryset`` to matches of ``query``, best matches first.
+
+        With ``ranked=False`` only the filter is applied, which is cheaper
+        when the rows are just being counted.
+        """
+        query = query.strip()
+        if not query:
+            return queryset
+        ticket_number = parse_ticket_number(query)
+        if ticket_number:
+            return queryset.for_ticket(ticket_number)
+        if TICKET_FRAGMENT_RE.match(query) or not self.is_available():
+            return SearchBackend.match(self, queryset, query, ranked)
+        return self.match(queryset, query, ranked)
+
+    def match(self, queryset, query, ranked=True):
+        return queryset.filter(
+            Q(ticket_number__icontains=query) |
+            Q(title__icontains=query) |
+            Q(description__icontains=query)
+        )
+
+
+class SQLiteFTSBackend(SearchBackend):
+    """FTS5 external-content table, kept in sync by triggers on the complaints table."""
+
+    def __init__(self, using='default'):
+        super().__init__(using)
+        self._available = None
+
+    def is_available(self):
+        if self._available is None:
+            with self.connection.cursor() as cursor:
+                self._available = FTS_TABLE in self.connection.introspection.table_names(cursor)
+        return self._available
+
+    def install(self):
+        """Create the FTS table and triggers; rebuild if any were missing.
+
+        Django rebuilds SQLite tables on some schema changes, which drops the
+        triggers along with the old table, so this is re-run after migrate.
+        """
+        with self.connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT count(*) FROM sqlite_master WHERE name LIKE %s",
+                [f'{FTS_TABLE}%'],
+            )
+            before = cursor.fetchone()[0]
+            try:
+                for statement in SQLITE_FTS_SQL:
+                    cursor.execute(statement)
+            except OperationalError as e:
+                # SQLite compiled without FTS5: keep using the LIKE fallback
+                logger.warning('Full-text index not installed on %r, using LIKE search: %s', self.using, e)
+                self._available = False
+                return
+            cursor.execute(
+                "SELECT count(*) FROM sqlite_master WHERE name LIKE %s",
+                [f'{FTS_TABLE}%'],
+            )
+            if cursor.fetchone()[0] != before:
+                cursor.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')")
+        self._available = True
+
+    def uninstall(self):
+        with self.connection.cursor() as cursor:
+            for statement in SQLITE_FTS_DROP_SQL:
+                cursor.execute(statement)
+        self._available = False
+
+    def reindex(self):
+        self.install()
+        with self.connection.cursor() as cursor:
+            cursor.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')")
+            cursor.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('optimize')")
+
+    @staticmethod
+    def build_query(query):
+        # Quote every word so user input can't use FTS5 syntax; prefix-match each
+        words = WORD_RE.findall(query)
+        return ' AND '.join('"{}"*'.format(word.replace('"', '""')) for word in words)
+
+    def match(self, queryset, query, ranked=True):
+        expression = self.build_query(query)
+        if not expression:
+            return queryset.none()
+        if not ranked:
+            # Evaluated once as a list; a join would let SQLite re-run the
+            # MATCH for every row found through another index
+            return queryset.filter(
+                id__in=RawSQL(f"SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s", [expression])
+            )
+        # Joining the FTS table lets SQLite run the MATCH once and read bm25()
+        # from the rank column (lower is better)
+        return queryset.filter(
+            search_index__document__match=expression
+        ).annotate(
+            search_rank=F('search_index__rank')
+        ).order_by('search_rank', '-created_at')
+
+
+class MySQLFullTextBackend(SearchBackend):
+    """InnoDB FULLTEXT index on title and description."""
+
+    def _index_exists(self, cursor):
+        cursor.execute(
+            f"SHOW INDEX FROM {COMPLAINT_TABLE} WHERE Key_name = %s", [FULLTEXT_INDEX]
+        )
+        return cursor.fetchone() is not None
+
+    def install(self):
+        with self.connection.cursor() as cursor:
+            if not self._index_exists(cursor):
+                cursor.execute(
+                    f"ALTER TABLE {COMPLAINT_TABLE} ADD FULLTEXT INDEX {FULLTEXT_INDEX} (title, description)"
+                )
+
+    def uninstall(self):
+        with self.connection.cursor() as cursor:
+            if self._index_exists(cursor):
+                cursor.execute(f"ALTER TABLE {COMPLAINT_TABLE} DROP INDEX {FULLTEXT_INDEX}")
+
+    def reindex(self):
+        self.install()
+        with self.connection.cursor() as cursor:
+            cursor.execute(f"OPTIMIZE TABLE {COMPLAINT_TABLE}")
+            cursor.fetchall()
+
+    @staticmethod
+    def build_query(query):
+        # Boolean mode: every word required, prefix-matched
+        return ' '.join(f'+{word}*' for word in WORD_RE.findall(query))
+
+    def match(self, queryset, query, ranked=True):
+        expression = self.build_query(query)
+        if not expression:
+            return queryset.none()
+        matches = queryset.annotate(
+            search_rank=RawSQL(
+                "MATCH (title, description) AGAINST (%s IN BOOLEAN MODE)",
+                [expression],
+                output_field=FloatField(),
+            )
+        ).filter(search_rank__gt=0)
+        if not ranked:
+            return matches
+        return matches.order_by('-search_rank', '-created_at')
+
+
+VENDOR_BACKENDS = {
+    'sqlite': SQLiteFTSBackend,
+    'mysql': MySQLFullTextBackend,
+}
+
+_backends = {}
+
+
+def get_backend(using='default'):
+    if using not in _backends:
+        path = getattr(settings, 'COMPLAINT_SEARCH_BACKEND', None)
+        if path:
+            backend_class = import_string(path)
+        else:
+            backend_class = VENDOR_BACKENDS.get(connections[using].vendor, SearchBackend)
+        _backends[using] = backend_class(using)
+    return _backends[using]
+
+
+def search_complaints(queryset, query, ranked=True):
+    """Apply a search box query to a complaint queryset."""
+    return get_backend(queryset.db).search(queryset, query, ranked)
+
+
+async def asearch_complaints(queryset, query, ranked=True):
+    """``search_complaints`` for async views; the backend may look up its index first."""
+    return await sync_to_async(search_complaints)(queryset, query, ranked)
+
+
+def install_search_index(using='default', **kwargs):
+    """``post_migrate`` hook: make sure the index and its triggers exist."""
+    get_backend(using).install()
@@ -0,0 +1,119 @@
+"""
+Cache-first session engine with write-behind persistence.
+
+``SESSION_ENGINE = 'complaints.sessions'`` keeps sessions in
+``SESSION_CACHE_ALIAS`` like Django's ``cached_db`` engine, but writes them
+to the ``django_session`` table in batches every
+``SESSION_WRITE_BEHIND_SECONDS`` instead of on every save, so logins don't
+each cost an INSERT. Reads go to the cache and fall back to the pending
+writes, then to the table.
+
+Deleting a session (logout, ``flush()``) is written through at once and
+cancels any pending write for it, so a later flush can't bring it back.
+A crash loses at most the writes of the last interval; the sessions are
+still in the cache, which is why this engine wants a shared cache (see
+``CACHES``) when there are several server processes.
+"""
+import atexit
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.contrib.sessions.backends.base import CreateError
+from django.contrib.sessions.backends.cached_db import SessionStore as CachedDBStore
+from django.db import connections, router
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+
+class WriteBehind:
+    """Session rows waiting to be written, keyed by session key."""
+
+    def __init__(self, interval):
+        self.interval = interval
+        self.pending = {}
+        self.lock = threading.Lock()
+        # Held while writing, so a delete can't be overtaken by a flush
+        self.flush_lock = threading.Lock()
+        self.thread = None
+
+    def add(self, obj):
+        with self.lock:
+            self.pending[obj.session_key] = obj
+            if self.thread is None:
+                self.thread = threading.Thread(target=self.run, name='session-write-behind', daemon=True)
+                self.thread.start()
+
+    def get(self, session_key):
+        with self.lock:
+            return self.pending.get(session_key)
+
+    def discard(self, session_key):
+        with self.lock:
+            self.pending.pop(session_key, None)
+
+    def flush(self):
+        with self.flush_lock:
+            with self.lock:
+                objs, self.pending = list(self.pending.values()), {}
+            if not objs:
+                return 0
+            model = type(objs[0])
+            using = router.db_for_write(model)
+            features = connections[using].features
+            # MySQL upserts on any unique key and rejects an explicit target
+            unique_fields = ['session_key'] if features.supports_update_conflicts_with_target else None
+            model.objects.using(using).bulk_create(
+                objs, update_conflicts=True, unique_fields=unique_fields,
+                update_fields=['session_data', 'expire_date'],
+            )
+            return len(objs)
+
+    def run(self):
+        while True:
+            time.sleep(self.interval)
+            try:
+                self.flush()
+            except Exception:
+                logger.exception('Writing sessions failed')
+            finally:
+                connections.close_all()
+
+
+write_behind = WriteBehind(getattr(settings, 'SESSION_WRITE_BEHIND_SECONDS', 5))
+atexit.register(write_behind.flush)
+
+
+class SessionStore(CachedDBStore):
+    cache_key_prefix = 'complaints.sessions'
+
+    def _get_session_from_db(self):
+        obj = write_behind.get(self.session_key)
+        if obj is not None:
+            return obj if obj.expire_date > timezone.now() else None
+        return super()._get_session_from_db()
+
+    def exists(self, session_key):
+        return write_behind.get(session_key) is not None or super().exists(session_key)
+
+    def save(self, must_create=False):
+        if self.session_key is None:
+            return self.create()
+        data = self._get_session(no_load=must_create)
+        # create() has checked the key is unused; claiming it in the cache
+        # stands in for the table's unique constraint against a racing save
+        if must_create and not self._cache.add(self.cache_key, data, self.get_expiry_age()):
+            raise CreateError
+        self._cache.set(self.cache_key, data, self.get_expiry_age())
+        write_behind.add(self.create_model_instance(data))
+
+    def delete(self, session_key=None):
+        if session_key is None:
+            if self.session_key is None:
+                return
+            session_key = self.session_key
+        with write_behind.flush_lock:
+            write_behind.discard(session_key)
+            super().delete(session_key)
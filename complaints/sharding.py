@@ -0,0 +1,342 @@
+"""
+Hash sharding of complaints across several databases.
+
+``COMPLAINT_SHARDS`` adds ``shard_0``, ``shard_1``, ... next to ``default``
+(see ``settings.py``). Each complaint lives on the shard picked by a CRC32
+of its ticket number, together with its comments, history and (on SQLite)
+its full-text index rows. Everything else -- users, categories, sessions,
+jobs, rollups, tombstones, ticket sequences -- stays on ``default``.
+
+Primary keys stay unique across shards: complaint ids come from a sequence
+on ``default`` and are spread as ``sequence * shards + shard index``, so the
+shard of any complaint id is ``id % shards`` and a comment or history row
+can be routed by its ``complaint_id`` alone. Comment and history ids are
+only unique within their shard; nothing looks them up outside a complaint.
+
+Routing (``routers.ShardRouter``):
+
+* ``Complaint.objects.for_ticket()`` and the related managers of a loaded
+  complaint read from its shard, so the detail, status, assign and comment
+  views don't need to know about shards at all.
+* Saving a complaint, comment or history row writes to its shard.
+* Lists, search, counts, stats, delta sync and exports run the same query
+  on every shard in parallel (``fan_out``) and merge the already sorted
+  results (``merge``), so a page still reads at most one page per shard.
+
+Every shard carries the full schema, and users and categories are copied
+to all of them on save (``replicate``) so that foreign keys and the joins
+in list queries keep working. Run ``sync_reference_tables`` after adding a
+shard or loading users some other way.
+
+Old resolved and closed complaints can also be moved out of the shards (or
+``default``) into a cold tier, one ``cold_N`` database per shard (see
+``tiering.py``). Queries only read the cold tier for querysets made with
+``Complaint.objects.with_archived()``; ``querysets`` adds it for them.
+
+Limitations: the number of shards can't change once complaints exist (there
+is no rebalancing), queries without a ticket number or shard hint (the
+admin, ad hoc shell queries) see only ``default``, replicas cover
+``default`` only, and the jobs queued by a complaint write commit on
+``default`` right after the shard rather than atomically with it.
+"""
+import copy
+import heapq
+import threading
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack, contextmanager
+from contextvars import copy_context
+from functools import cmp_to_key
+from itertools import islice
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, close_old_connections, connections, transaction
+
+from .tickets import TicketNumberAllocator, assign_ticket_numbers
+
+SHARD_PREFIX = 'shard_'
+COLD_PREFIX = 'cold_'
+SHARDED_MODELS = {
+    'complaints.complaint',
+    'complaints.complaintcomment',
+    'complaints.complainthistory',
+    'complaints.complaintsearchindex',
+    'complaints.historyarchiveblock',
+}
+REFERENCE_MODELS = ['auth.user', 'complaints.complaintcategory']
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def shard_aliases():
+    aliases = [alias for alias in settings.DATABASES if alias.startswith(SHARD_PREFIX)]
+    return sorted(aliases, key=lambda alias: int(alias[len(SHARD_PREFIX):]))
+
+
+def is_sharded():
+    return bool(shard_aliases())
+
+
+def cold_aliases():
+    aliases = [alias for alias in settings.DATABASES if alias.startswith(COLD_PREFIX)]
+    return sorted(aliases, key=lambda alias: int(alias[len(COLD_PREFIX):]))
+
+
+def is_cold(alias):
+    return (alias or '').startswith(COLD_PREFIX)
+
+
+def complaint_databases(archived=False):
+    """Aliases of the databases holding complaints: the shards, or just ``default``.
+
+    With ``archived`` the cold tier's databases are included too.
+    """
+    aliases = shard_aliases() or [DEFAULT_DB_ALIAS]
+    return aliases + cold_aliases() if archived else aliases
+
+
+def cold_for(alias):
+    """The cold tier database paired with the shard (or ``default``) ``alias``."""
+    return cold_aliases()[complaint_databases().index(alias)]
+
+
+def hot_for(alias):
+    """The shard (or ``default``) whose cold tier is ``alias``."""
+    return complaint_databases()[cold_aliases().index(alias)]
+
+
+def reference_aliases():
+    """Databases that get copies of users and categories: the shards and the cold tier."""
+    return shard_aliases() + cold_aliases()
+
+
+def is_sharded_model(model):
+    return model._meta.label_lower in SHARDED_MODELS
+
+
+def shard_index(ticket_number):
+    return zlib.crc32(ticket_number.encode()) % len(shard_aliases())
+
+
+def shard_for_ticket(ticket_number):
+    """Alias of the shard holding ``ticket_number`` (``default`` when unsharded)."""
+    aliases = shard_aliases()
+    if not aliases:
+        return DEFAULT_DB_ALIAS
+    return aliases[shard_index(ticket_number)]
+
+
+def shard_for_id(complaint_id):
+    """Alias of the shard holding the complaint with primary key ``complaint_id``."""
+    aliases = shard_aliases()
+    if not aliases:
+        return DEFAULT_DB_ALIAS
+    return aliases[complaint_id % len(aliases)]
+
+
+# Complaint ids, spread over the shards by ``assign_ids``
+id_allocator = TicketNumberAllocator(name='complaint_id')
+
+
+def assign_ids(complaints):
+    """Give unsaved complaints a ticket number and a primary key on their shard."""
+    assign_ticket_numbers(complaints)
+    missing = [c for c in complaints if c.pk is None]
+    count = len(shard_aliases())
+    for complaint, value in zip(missing, id_allocator.take_values(len(missing))):
+        complaint.pk = value * count + shard_index(complaint.ticket_number)
+    return complaints
+
+
+@contextmanager
+def atomic_for(complaint):
+    """``transaction.atomic()`` on ``default`` and on ``complaint``'s shard.
+
+    The shard commits first; ``on_commit`` callbacks registered on
+    ``default`` (stats invalidation, events) run after both have.
+    """
+    with transaction.atomic():
+        if not is_sharded():
+            yield
+            return
+        if complaint.pk is None:
+            assign_ids([complaint])
+        with transaction.atomic(using=shard_for_id(complaint.pk)):
+            yield
+
+
+@contextmanager
+def atomic_all():
+    """``transaction.atomic()`` on ``default`` and every shard."""
+    with ExitStack() as stack:
+        stack.enter_context(transaction.atomic())
+        for alias in shard_aliases():
+            stack.enter_context(transaction.atomic(using=alias))
+        yield
+
+
+def querysets(queryset):
+    """One copy of ``queryset`` per shard, or just ``queryset`` when unsharded.
+
+    A queryset already pinned to a shard (``for_ticket()``) or cold database
+    stays on it. ``with_archived()`` complaint querysets also get a copy per
+    cold database (just the pinned shard's, if pinned).
+    """
+    if not is_sharded_model(queryset.model) or is_cold(queryset._db):
+        return [queryset]
+    pinned = (queryset._db or '').startswith(SHARD_PREFIX)
+    if pinned or not is_sharded():
+        hot = [queryset]
+    else:
+        hot = [queryset.using(alias) for alias in shard_aliases()]
+    if not getattr(queryset, 'include_archived', False) or not cold_aliases():
+        return hot
+    cold = [cold_for(queryset._db)] if pinned else cold_aliases()
+    return hot + [queryset.using(alias) for alias in cold]
+
+
+def group_by_shard(items, key):
+    """``{alias: [items]}`` with each item's shard given by ``key(item)`` (a complaint id)."""
+    groups = {}
+    for item in items:
+        groups.setdefault(shard_for_id(key(item)), []).append(item)
+    return groups
+
+
+def _get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=getattr(settings, 'SHARD_QUERY_THREADS', 8),
+                thread_name_prefix='shard-query',
+            )
+    return _executor
+
+
+def _run(func, item):
+    # Pool threads have no request cycle to expire their connections
+    close_old_connections()
+    return func(item)
+
+
+def fan_out(func, items):
+    """Return ``[func(item) for item in items]``, running the calls in parallel.
+
+    Inside a transaction the calls run on the current thread instead, so
+    they see its uncommitted writes.
+    """
+    items = list(items)
+    if len(items) < 2 or any(connections[alias].in_atomic_block for alias in complaint_databases(archived=True)):
+        return [func(item) for item in items]
+    executor = _get_executor()
+    futures = [executor.submit(copy_context().run, _run, func, item) for item in items]
+    return [future.result() for future in futures]
+
+
+def _value(row, name):
+    return row[name] if isinstance(row, dict) else getattr(row, name)
+
+
+def sort_key(fields):
+    """Sort key for rows ordered by ``fields``, a list of ``(name, descending)``."""
+    def compare(a, b):
+        for name, descending in fields:
+            x, y = _value(a, name), _value(b, name)
+            if x != y:
+                result = -1 if x < y else 1
+                return -result if descending else result
+        return 0
+    return cmp_to_key(compare)
+
+
+def merge(lists, fields, limit=None):
+    """Merge per-shard results that are each sorted by ``fields`` into one list."""
+    merged = heapq.merge(*lists, key=sort_key(fields))
+    return list(islice(merged, limit) if limit is not None else merged)
+
+
+def ordering_fields(ordering):
+    return [(name.lstrip('-'), name.startswith('-')) for name in ordering]
+
+
+def head(queryset, limit):
+    """The first ``limit`` rows of an ordered ``queryset`` across all shards."""
+    shards = querysets(queryset)
+    if len(shards) == 1:
+        return list(queryset[:limit])
+    results = fan_out(lambda qs: list(qs[:limit]), shards)
+    ordering = list(queryset.query.order_by or queryset.model._meta.ordering)
+    if not any(name.lstrip('-') in ('id', 'pk') for name in ordering):
+        ordering.append('-id')
+    return merge(results, ordering_fields(ordering), limit)
+
+
+def count(queryset):
+    return sum(fan_out(lambda qs: qs.count(), querysets(queryset)))
+
+
+def aggregate(queryset, **aggregates):
+    """Sum ``aggregate()`` over the shards; only additive aggregates (``Count``, ``Sum``)."""
+    results = fan_out(lambda qs: qs.aggregate(**aggregates), querysets(queryset))
+    return {key: sum(result[key] or 0 for result in results) for key in aggregates}
+
+
+def bulk_create(model, objs, **kwargs):
+    """``bulk_create`` complaints, comments or history rows on their shards.
+
+    Complaints must already have ids (``assign_ids``); the objects are
+    returned in their original order.
+    """
+    if not is_sharded():
+        return model.objects.bulk_create(objs, **kwargs)
+    key = (lambda obj: obj.pk) if model._meta.label_lower == 'complaints.complaint' else (
+        lambda obj: obj.complaint_id
+    )
+    for alias, group in group_by_shard(objs, key).items():
+        model.objects.using(alias).bulk_create(group, **kwargs)
+    return objs
+
+
+def _upsert(model, alias, objs, batch_size=None):
+    fields = [f.name for f in model._meta.concrete_fields if not f.primary_key]
+    options = {}
+    if connections[alias].features.supports_update_conflicts_with_target:
+        options['unique_fields'] = [model._meta.pk.name]
+    # bulk_create marks the objects as belonging to ``alias``
+    model._base_manager.using(alias).bulk_create(
+        [copy.copy(obj) for obj in objs], batch_size=batch_size,
+        update_conflicts=True, update_fields=fields, **options,
+    )
+
+
+def replicate(instance):
+    """Copy a user or category row to every shard and cold database (insert or update)."""
+    for alias in reference_aliases():
+        _upsert(type(instance), alias, [instance])
+
+
+def unreplicate(instance):
+    """Delete a user or category from every shard and cold database, cascading to rows there."""
+    model = type(instance)
+    for alias in reference_aliases():
+        model._base_manager.using(alias).filter(pk=instance.pk).delete()
+
+
+def sync_reference_tables(batch_size=1000):
+    """Make users and categories on every shard and cold database match ``default``; returns rows copied."""
+    from django.apps import apps
+
+    copied = 0
+    for label in REFERENCE_MODELS:
+        model = apps.get_model(label)
+        objs = list(model._base_manager.using(DEFAULT_DB_ALIAS).order_by('pk'))
+        ids = {obj.pk for obj in objs}
+        for alias in reference_aliases():
+            _upsert(model, alias, objs, batch_size)
+            stale = set(model._base_manager.using(alias).values_list('pk', flat=True)) - ids
+            if stale:
+                model._base_manager.using(alias).filter(pk__in=stale).delete()
+            copied += len(objs)
+    return copied
@@ -0,0 +1,133 @@
+from django.contrib.auth.models import User
+from django.db import DEFAULT_DB_ALIAS, transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from . import events, fragments, sharding
+from .attachments import release
+from .auth import invalidate_user
+from .models import Complaint, ComplaintCategory, ComplaintComment, ComplaintHistory
+from .rollups import RollupBatch, category_value, record_created, record_transition
+from .stats import invalidate_stats
+from .sync import record_deletion
+
+
+@receiver(post_save, sender=Complaint)
+@receiver(post_delete, sender=Complaint)
+def complaint_changed(sender, instance, **kwargs):
+    # Wait for commit so a concurrent reader cannot re-cache the old counts
+    created_by_id = instance.created_by_id
+    transaction.on_commit(lambda: invalidate_stats([created_by_id]))
+
+
+@receiver(post_save, sender=Complaint)
+def complaint_created_rollup(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        record_created(instance)
+
+
+@receiver(post_delete, sender=Complaint)
+def complaint_deleted_rollup(sender, instance, **kwargs):
+    # Deleted complaints leave their current buckets so the backlog stays right
+    batch = RollupBatch()
+    now = timezone.now()
+    batch.add_transition(now, 'status', instance.status, None)
+    batch.add_transition(now, 'priority', instance.priority, None)
+    batch.add_transition(now, 'category', category_value(instance.category_id), None)
+    batch.enqueue()
+
+
+@receiver(post_delete, sender=Complaint)
+def complaint_deleted_tombstone(sender, instance, **kwargs):
+    record_deletion(instance)
+
+
+@receiver(post_delete, sender=Complaint)
+def complaint_deleted_attachment(sender, instance, **kwargs):
+    if instance.attachment:
+        release(instance.attachment.name)
+
+
+@receiver(post_save, sender=ComplaintHistory)
+def history_created_rollup(sender, instance, created, raw=False, **kwargs):
+    if created and not raw and instance.field_name == 'status':
+        record_transition('status', instance.old_value, instance.new_value, instance.changed_at)
+
+
+@receiver(post_save, sender=Complaint)
+def complaint_created_event(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        events.publish_created(instance)
+
+
+@receiver(post_delete, sender=Complaint)
+def complaint_deleted_event(sender, instance, **kwargs):
+    events.publish_deleted(instance)
+
+
+@receiver(post_save, sender=ComplaintHistory)
+def history_created_event(sender, instance, created, raw=False, **kwargs):
+    if not created or raw:
+        return
+    if instance.field_name == 'status':
+        events.publish_status(instance.complaint, instance, instance.changed_by)
+    elif instance.field_name == 'assigned_to':
+        events.publish_assignment(instance.complaint, instance, instance.changed_by)
+
+
+@receiver(post_save, sender=ComplaintComment)
+def comment_created_event(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        events.publish_comment(instance)
+
+
+@receiver(post_save, sender=Complaint)
+@receiver(post_delete, sender=Complaint)
+def complaint_fragments(sender, instance, **kwargs):
+    fragments.invalidate([instance.pk])
+
+
+@receiver(post_save, sender=ComplaintComment)
+@receiver(post_delete, sender=ComplaintComment)
+@receiver(post_save, sender=ComplaintHistory)
+@receiver(post_delete, sender=ComplaintHistory)
+def complaint_child_fragments(sender, instance, **kwargs):
+    fragments.invalidate([instance.complaint_id])
+
+
+@receiver(post_save, sender=User)
+def user_renamed_fragments(sender, instance, update_fields=None, **kwargs):
+    # Logins only touch last_login; names show up in most fragments
+    if update_fields is None or {'username', 'first_name', 'last_name'} & set(update_fields):
+        fragments.invalidate_all()
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def user_changed_auth_cache(sender, instance, **kwargs):
+    # Password, is_active and is_staff changes must reach every process's user cache
+    invalidate_user(instance.pk)
+
+
+@receiver(post_save, sender=ComplaintCategory)
+@receiver(post_delete, sender=ComplaintCategory)
+def category_fragments(sender, instance, **kwargs):
+    fragments.invalidate_all()
+
+
+@receiver(post_save, sender=User)
+@receiver(post_save, sender=ComplaintCategory)
+def reference_saved_shards(sender, instance, using, update_fields=None, **kwargs):
+    # Logins only touch last_login, which nothing on the shards reads
+    if using != DEFAULT_DB_ALIAS or (update_fields is not None and set(update_fields) <= {'last_login'}):
+        return
+    sharding.replicate(instance)
+
+
+@receiver(post_delete, sender=User)
+@receiver(post_delete, sender=ComplaintCategory)
+def reference_deleted_shards(sender, instance, using, **kwargs):
+    # Cascades to the user's complaints on every shard
+    if using == DEFAULT_DB_ALIAS:
+        sharding.unreplicate(instance)
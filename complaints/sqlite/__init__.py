@@ -0,0 +1,10 @@
+"""
+Tuned SQLite backend: ``ENGINE = 'complaints.sqlite'``.
+
+Applies ``OPTIONS['pragmas']`` (WAL, ``synchronous``, ``busy_timeout``,
+mmap and page cache size) to every new connection, and opens transactions
+with ``BEGIN <OPTIONS['transaction_mode']>``. ``IMMEDIATE`` takes the write
+lock when the transaction starts, where waiting for it honours
+``busy_timeout``; a deferred transaction that reads and then writes fails
+with "database is locked" at once if another writer got in between.
+"""
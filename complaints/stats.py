@@ -0,0 +1,98 @@
+"""
+Dashboard statistics.
+
+Every counter shown on the dashboard and returned by ``api_stats`` is
+computed in one conditional-aggregation query and cached per scope: staff
+share a single global entry, regular users get one entry each. Entries are
+dropped whenever a complaint in that scope is written (see ``signals.py``).
+Misses are computed on the primary: counts from a lagging replica would be
+cached right after the invalidation meant to replace them. With sharded
+complaints the query runs on every shard and the counts are added up.
+"""
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count, Q
+
+from . import sharding
+from .models import Complaint
+from .routers import replica_reads
+
+OPEN_STATUSES = ['pending', 'in_progress']
+
+CACHE_PREFIX = 'complaints:stats'
+
+
+def get_scope(user):
+    return 'global' if user.is_staff else f'user:{user.pk}'
+
+
+def _cache_key(scope):
+    return f'{CACHE_PREFIX}:{scope}'
+
+
+def _stats_query(user):
+    # Counters cover archived complaints too, so moving them between tiers
+    # leaves the cached numbers valid
+    complaints = Complaint.objects.with_archived()
+    if user is not None and not user.is_staff:
+        complaints = complaints.filter(created_by=user)
+
+    aggregates = {'total': Count('id')}
+    for status, _label in Complaint.STATUS_CHOICES:
+        aggregates[status] = Count('id', filter=Q(status=status))
+    aggregates['urgent'] = Count('id', filter=Q(priority='urgent', status__in=OPEN_STATUSES))
+    return complaints, aggregates
+
+
+def compute_stats(user=None):
+    """Run the single aggregate query for ``user``'s scope (all complaints if None)."""
+    complaints, aggregates = _stats_query(user)
+    with replica_reads(False):
+        if len(sharding.querysets(complaints)) > 1:
+            return sharding.aggregate(complaints, **aggregates)
+        return complaints.aggregate(**aggregates)
+
+
+async def acompute_stats(user=None):
+    complaints, aggregates = _stats_query(user)
+    if len(sharding.querysets(complaints)) > 1:
+        return await sync_to_async(compute_stats)(user)
+    with replica_reads(False):
+        return await complaints.aaggregate(**aggregates)
+
+
+def get_stats(user):
+    """Return cached counters for ``user``'s scope, computing them on a miss."""
+    key = _cache_key(get_scope(user))
+    stats = cache.get(key)
+    if stats is None:
+        stats = compute_stats(user)
+        cache.set(key, stats, getattr(settings, 'COMPLAINT_STATS_CACHE_TIMEOUT', 300))
+    return stats
+
+
+async def aget_stats(user):
+    """``get_stats`` for async views."""
+    key = _cache_key(get_scope(user))
+    stats = await cache.aget(key)
+    if stats is None:
+        stats = await acompute_stats(user)
+        await cache.aset(key, stats, getattr(settings, 'COMPLAINT_STATS_CACHE_TIMEOUT', 300))
+    return stats
+
+
+def status_distribution(stats):
+    """Per-status counts in the shape of ``values('status').annotate(count=...)``."""
+    return [
+        {'status': status, 'count': stats[status]}
+        for status, _label in Complaint.STATUS_CHOICES
+        if stats[status]
+    ]
+
+
+def invalidate_stats(user_ids=()):
+    """Drop the global entry and the entries of the given complaint creators."""
+    keys = [_cache_key('global')]
+    keys += [_cache_key(f'user:{user_id}') for user_id in set(user_ids) if user_id]
+    cache.delete_many(keys)
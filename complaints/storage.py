@@ -0,0 +1,55 @@
+"""
+Content-addressed storage for complaint attachments.
+
+Files are named after the SHA-256 of their content, so an upload whose
+content is already stored reuses the existing file instead of writing a
+second copy. Each save is recorded as one reference on the matching
+``AttachmentBlob`` (see ``attachments.py``); the file is removed when the
+last complaint pointing at it goes away.
+"""
+import hashlib
+import os
+
+from django.core.files.storage import FileSystemStorage
+
+# Keeps the stored name within FileField's default max_length of 100
+MAX_EXTENSION_LENGTH = 10
+
+
+def file_digest(content):
+    """SHA-256 of ``content``, computed chunk by chunk unless the upload handler already did."""
+    digest = getattr(content, 'sha256', None)
+    if digest:
+        return digest
+    hasher = hashlib.sha256()
+    for chunk in content.chunks():
+        hasher.update(chunk)
+    content.seek(0)
+    return hasher.hexdigest()
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    """Stores ``<upload_to>/<aa>/<sha256><ext>`` and deduplicates identical content."""
+
+    def content_name(self, name, digest):
+        extension = os.path.splitext(name)[1].lower()
+        if len(extension) > MAX_EXTENSION_LENGTH:
+            extension = ''
+        return os.path.join(os.path.dirname(name), digest[:2], digest + extension)
+
+    def _save(self, name, content):
+        from .attachments import acquire
+
+        digest = file_digest(content)
+        target = self.content_name(name, digest)
+        if not self.exists(target):
+            # May come back renamed if the same content is being saved concurrently
+            target = super()._save(target, content)
+        stored = acquire(digest, target, content.size)
+        if stored != target:
+            self.delete(target)
+        return stored
+
+
+def attachment_storage():
+    return ContentAddressedStorage()
@@ -0,0 +1,197 @@
+"""
+Delta sync and conditional GET for the polled JSON API.
+
+``api_complaints?since=<cursor>`` returns only the complaints changed or
+created after the cursor, plus tombstones for the ones deleted, in
+``(updated_at, id)`` order. Changed rows and tombstones are merged in one
+``UNION`` of two index range scans, so a poll with nothing new costs a
+single indexed query. An empty ``since`` starts from the beginning. With
+sharded complaints each shard and the tombstones are read separately and
+merged in the same order.
+
+Changes younger than ``DELTA_SYNC_LAG_SECONDS`` are held back: a
+transaction that commits late can stamp ``updated_at`` earlier than rows
+another client has already synced past.
+
+A caught-up client's cursor moves up to that horizon once its position is
+about a day old, so a scope that rarely changes doesn't run into the
+tombstone retention and expire; between those moves an unchanged poll
+repeats the same cursor and ETag.
+
+``conditional_json`` gives both polled endpoints strong ETags so an
+unchanged response is answered with an empty ``304``.
+"""
+import heapq
+from datetime import datetime, timedelta, timezone as dt_timezone
+from itertools import islice
+from operator import itemgetter
+
+from asgiref.sync import sync_to_async
+
+from django.conf import settings
+from django.db.models import Q, Value
+from django.http import JsonResponse
+from django.utils import timezone
+from django.utils.cache import get_conditional_response, set_response_etag
+
+from . import sharding
+from .jobs import periodic
+from .models import Complaint, ComplaintTombstone
+from .pagination import decode_cursor, encode_cursor
+from .serializers import LIST_FIELDS, project, to_api_dict
+
+EPOCH = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+
+
+class CursorError(ValueError):
+    """The ``since`` cursor is malformed (400) or older than the tombstones kept (410)."""
+
+    def __init__(self, message, status):
+        super().__init__(message)
+        self.status = status
+
+
+def parse_since(token):
+    """Return the ``(changed_at, id)`` position a ``since`` token points at."""
+    if not token:
+        return EPOCH, 0
+    values, _ = decode_cursor(token)
+    if (
+        not values or len(values) != 2 or not isinstance(values[0], datetime)
+        or timezone.is_naive(values[0]) or not isinstance(values[1], int)
+    ):
+        raise CursorError('Invalid sync cursor', 400)
+    if values[0] < timezone.now() - _retention():
+        raise CursorError('Sync cursor expired; sync again from the start', 410)
+    return values[0], values[1]
+
+
+def _after(field, id_field, changed_at, pk):
+    # A range on the leading index column, minus the ties already seen
+    return Q(**{f'{field}__gte': changed_at}) & ~Q(**{field: changed_at, f'{id_field}__lte': pk})
+
+
+def _retention():
+    return timedelta(days=getattr(settings, 'TOMBSTONE_RETENTION_DAYS', 30))
+
+
+def _horizon():
+    """Newest change time served now; younger changes wait for the next poll."""
+    return timezone.now() - timedelta(seconds=getattr(settings, 'DELTA_SYNC_LAG_SECONDS', 2))
+
+
+def _change_sources(user, since, upper):
+    changed_at, pk = since
+    complaints = Complaint.objects.filter(_after('updated_at', 'id', changed_at, pk), updated_at__lte=upper)
+    tombstones = ComplaintTombstone.objects.filter(
+        _after('deleted_at', 'complaint_id', changed_at, pk), deleted_at__lte=upper,
+    )
+    if not user.is_staff:
+        complaints = complaints.filter(created_by=user)
+        tombstones = tombstones.filter(creator_id=user.pk)
+    return (
+        complaints.order_by().values_list('updated_at', 'id', 'ticket_number', Value(False)),
+        tombstones.order_by().values_list('deleted_at', 'complaint_id', 'ticket_number', Value(True)),
+    )
+
+
+def _changes_query(user, since, upper, limit):
+    complaints, tombstones = _change_sources(user, since, upper)
+    changes = complaints.union(tombstones, all=True)
+    return changes.order_by('updated_at', 'id')[:limit + 1]
+
+
+def _sharded_changes(user, since, upper, limit):
+    complaints, tombstones = _change_sources(user, since, upper)
+    sources = sharding.querysets(complaints.order_by('updated_at', 'id')) + [
+        tombstones.order_by('deleted_at', 'complaint_id')
+    ]
+    results = sharding.fan_out(lambda queryset: list(queryset[:limit + 1]), sources)
+    return list(islice(heapq.merge(*results, key=itemgetter(0, 1)), limit + 1))
+
+
+def _rows_query(changes):
+    ids = [pk for _, pk, _, deleted in changes if not deleted]
+    return project(Complaint.objects.filter(id__in=ids).order_by(), LIST_FIELDS + ['updated_at'])
+
+
+def _sharded_rows(changes):
+    changed = [change for change in changes if not change[3]]
+    results = sharding.fan_out(
+        lambda group: list(_rows_query(group[1]).using(group[0])),
+        sharding.group_by_shard(changed, itemgetter(1)).items(),
+    )
+    return [row for rows in results for row in rows]
+
+
+def _build(since, upper, changes, rows, limit):
+    has_more = len(changes) > limit
+    changes = changes[:limit]
+    rows = {row['id']: row for row in rows}
+    complaints, deleted = [], []
+    for _, pk, ticket_number, is_deleted in changes:
+        if is_deleted:
+            deleted.append(ticket_number)
+        elif pk in rows:
+            # Complaints deleted since the first query show up as tombstones next time
+            entry = to_api_dict(rows[pk])
+            entry['updated_at'] = rows[pk]['updated_at'].strftime('%Y-%m-%d %H:%M:%S')
+            complaints.append(entry)
+    # Nothing new keeps the cursor as it was, so the response (and its ETag) repeats
+    position = list(changes[-1][:2]) if changes else list(since)
+    # ...until it ages: everything up to ``upper`` has been seen, so move there
+    # before the cursor would expire (rows stamped exactly ``upper`` come again)
+    if not has_more and position[0] < upper - min(timedelta(days=1), _retention() / 2):
+        position = [upper, 0]
+    return {
+        'complaints': complaints,
+        'deleted': deleted,
+        'next_cursor': encode_cursor(position, 'next'),
+        'has_more': has_more,
+    }
+
+
+def changes_since(user, since, limit):
+    """Complaints changed and ticket numbers deleted in ``user``'s scope after ``since``."""
+    upper = _horizon()
+    if sharding.is_sharded():
+        changes = _sharded_changes(user, since, upper, limit)
+        rows = _sharded_rows(changes[:limit]) if any(not c[3] for c in changes[:limit]) else []
+        return _build(since, upper, changes, rows, limit)
+    changes = list(_changes_query(user, since, upper, limit))
+    rows = list(_rows_query(changes[:limit])) if any(not c[3] for c in changes[:limit]) else []
+    return _build(since, upper, changes, rows, limit)
+
+
+async def achanges_since(user, since, limit):
+    if sharding.is_sharded():
+        return await sync_to_async(changes_since)(user, since, limit)
+    upper = _horizon()
+    changes = [change async for change in _changes_query(user, since, upper, limit)]
+    rows = []
+    if any(not c[3] for c in changes[:limit]):
+        rows = [row async for row in _rows_query(changes[:limit])]
+    return _build(since, upper, changes, rows, limit)
+
+
+def record_deletion(complaint):
+    ComplaintTombstone.objects.create(
+        complaint_id=complaint.pk, ticket_number=complaint.ticket_number, creator_id=complaint.created_by_id,
+    )
+
+
+@periodic
+def purge_tombstones():
+    """Delete tombstones older than ``TOMBSTONE_RETENTION_DAYS``; older cursors get a 410."""
+    cutoff = timezone.now() - _retention()
+    deleted, _ = ComplaintTombstone.objects.filter(deleted_at__lt=cutoff).delete()
+    return deleted
+
+
+def conditional_json(request, data):
+    """``JsonResponse`` with a strong ETag; ``304`` when the client already has it."""
+    response = JsonResponse(data)
+    # Clients may keep the body but must revalidate every time
+    response['Cache-Control'] = 'private, no-cache'
+    set_response_etag(response)
+    return get_conditional_response(request, etag=response['ETag'], response=response)
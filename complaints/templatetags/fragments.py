@@ -0,0 +1,55 @@
+"""
+``{% fragment %}``: cache a rendered block in the versioned fragment cache.
+
+    {% load fragments %}
+    {% fragment "list_row" complaint.id is_staff version=complaint.updated_at %}
+        ...
+    {% endfragment %}
+
+The name and the complaint id come first, then any variant values that
+change the output (e.g. staff-only columns). The block is rendered again
+whenever ``version`` differs from the one it was cached with, or the
+complaint's fragments were invalidated since (see ``complaints/fragments.py``).
+"""
+from django import template
+from django.utils.safestring import mark_safe
+
+from complaints import fragments
+
+register = template.Library()
+
+
+class FragmentNode(template.Node):
+    def __init__(self, nodelist, name, identity, version):
+        self.nodelist = nodelist
+        self.name = name
+        self.identity = identity
+        self.version = version
+
+    def render(self, context):
+        name = self.name.resolve(context)
+        key = (name, *(value.resolve(context) for value in self.identity))
+        version = self.version.resolve(context)
+        html, version = fragments.lookup(name, key, version)
+        if html is None:
+            html = self.nodelist.render(context)
+            fragments.store(key, version, html)
+        return mark_safe(html)
+
+
+@register.tag
+def fragment(parser, token):
+    bits = token.split_contents()
+    tag_name = bits[0]
+    if len(bits) < 4 or not bits[-1].startswith('version='):
+        raise template.TemplateSyntaxError(
+            f"'{tag_name}' takes a name, a complaint id, optional variants and version=<value>"
+        )
+    nodelist = parser.parse(('endfragment',))
+    parser.delete_first_token()
+    return FragmentNode(
+        nodelist,
+        parser.compile_filter(bits[1]),
+        [parser.compile_filter(bit) for bit in bits[2:-1]],
+        parser.compile_filter(bits[-1][len('version='):]),
+    )
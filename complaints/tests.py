@@ -0,0 +1,1038 @@
+import json
+import os
+import tempfile
+import time
+import warnings
+from datetime import timedelta
+from io import StringIO
+from unittest import mock, skipUnless
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.contrib.sessions.models import Session
+from django.core.cache import CacheKeyWarning, cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import CommandError, call_command
+from django.db import OperationalError, connection, connections, router, transaction
+from django.http import HttpResponse
+from django.template import Context, Template
+from django.test import (
+    AsyncClient, AsyncRequestFactory, RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings,
+)
+from django.urls import reverse
+from django.utils import timezone
+
+from . import (
+    actions, api_async, auth, fragments, history_archive, jobs, middleware, rollups, search, sessions, sharding, stats,
+    throttle, tickets, tiering, transactions,
+)
+from .management.commands import import_complaints
+from .models import (
+    AttachmentBlob, Complaint, ComplaintCategory, ComplaintComment, ComplaintHistory, ComplaintRollup,
+    ComplaintTombstone, Job,
+)
+from .pagination import encode_cursor
+from .tickets import TicketNumberAllocator
+
+
+class TicketNumberAllocatorTests(TestCase):
+    def test_block_reused_within_committed_transaction(self):
+        allocator = TicketNumberAllocator(block_size=20)
+        with transaction.atomic():
+            first = allocator.next_value()
+        with transaction.atomic():
+            self.assertEqual(allocator.next_value(), first + 1)
+
+    def test_block_dropped_after_rollback(self):
+        allocator = TicketNumberAllocator(block_size=20)
+        with self.assertRaises(RuntimeError):
+            with transaction.atomic():
+                allocator.next_value()
+                raise RuntimeError
+        ours = [allocator.next_value() for _ in range(3)]
+        # Another process reserving now must not get the same numbers
+        theirs = TicketNumberAllocator(block_size=20).take_values(3)
+        self.assertFalse(set(ours) & set(theirs))
+
+
+class DashboardStatsTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        # Running on-commit hooks confirms a ticket block the test rollback undoes
+        self.addCleanup(tickets.allocator.reset)
+        self.user = User.objects.create_user('alice')
+        self.staff = User.objects.create_user('staff', is_staff=True)
+
+    def test_saving_a_complaint_invalidates_cached_stats(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            complaint = Complaint.objects.create(title='Printer', description='', created_by=self.user)
+        self.assertEqual((stats.get_stats(self.user)['total'], stats.get_stats(self.staff)['pending']), (1, 1))
+        # Served from the cache now
+        with self.assertNumQueries(0):
+            stats.get_stats(self.user)
+        with self.captureOnCommitCallbacks(execute=True):
+            complaint.status = 'resolved'
+            complaint.save()
+        self.assertEqual(stats.get_stats(self.user)['resolved'], 1)
+        self.assertEqual(stats.get_stats(self.staff)['pending'], 0)
+
+
+class RollupTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('alice')
+        self.staff = User.objects.create_user('staff', is_staff=True)
+        self.client.force_login(self.staff)
+
+    def run_rollup_jobs(self):
+        for job_row in jobs.claim('tests', limit=100, names=['rollups.apply']):
+            self.assertTrue(jobs.run(job_row))
+
+    def stored_rollups(self):
+        return sorted(ComplaintRollup.objects.values_list(
+            'granularity', 'bucket', 'dimension', 'value', 'created_count', 'entered_count', 'exited_count',
+        ))
+
+    def test_incremental_totals_match_recount(self):
+        category = ComplaintCategory.objects.create(name='Network')
+        complaints = [
+            Complaint.objects.create(title=f'Complaint {i}', description='', created_by=self.user,
+                                     category=category if i % 2 else None, priority='urgent' if i == 0 else 'medium')
+            for i in range(4)
+        ]
+        actions.update_status(complaints[0], 'in_progress', self.staff)
+        actions.update_status(complaints[0], 'resolved', self.staff)
+        actions.update_status(complaints[1], 'closed', self.staff)
+        self.run_rollup_jobs()
+        incremental = self.stored_rollups()
+
+        rollups.rebuild_rollups()
+        self.assertEqual(incremental, self.stored_rollups())
+        trends = self.client.get(reverse('api_stats_trends')).json()
+        self.assertEqual(trends['backlog'][-1], 2)
+        self.assertEqual(sum(trends['series']['status']['pending']['created']), 4)
+        self.assertEqual(trends['pending_updates'], 0)
+
+    def test_waiting_updates_reported(self):
+        Complaint.objects.create(title='Printer', description='', created_by=self.user)
+        Job.objects.filter(name='rollups.apply').update(run_after=timezone.now() - timedelta(hours=1))
+        with self.assertLogs('complaints.rollups', 'WARNING'):
+            trends = self.client.get(reverse('api_stats_trends')).json()
+        self.assertEqual(trends['pending_updates'], 1)
+        [warning] = rollups.check_pending_updates(databases=['default'])
+        self.assertEqual(warning.id, 'complaints.W001')
+        self.run_rollup_jobs()
+        self.assertEqual(rollups.check_pending_updates(databases=['default']), [])
+
+
+class SearchTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        user = User.objects.create_user('alice')
+        cls.complaints = [
+            Complaint.objects.create(title=f'Printer {i}', description='Out of toner', created_by=user)
+            for i in range(3)
+        ]
+
+    def search(self, query):
+        return set(search.search_complaints(Complaint.objects.all(), query).values_list('ticket_number', flat=True))
+
+    def test_full_ticket_number(self):
+        ticket_number = self.complaints[1].ticket_number
+        self.assertEqual(self.search(ticket_number.lower()), {ticket_number})
+
+    def test_partial_ticket_number(self):
+        ticket_number = self.complaints[1].ticket_number
+        self.assertIn(ticket_number, self.search(ticket_number[-2:].lstrip('0')))
+        self.assertIn(ticket_number, self.search(ticket_number[:-1]))
+
+    def test_words(self):
+        self.assertEqual(len(self.search('toner')), 3)
+
+    async def test_async_api_search(self):
+        # A fresh backend still has to look up whether its index exists
+        search._backends.clear()
+        request = AsyncRequestFactory().get(reverse('api_complaints'), {'search': 'toner'})
+        request.user = await User.objects.aget(username='alice')
+        response = await api_async.api_complaints(request)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(json.loads(response.content)['complaints']), 3)
+
+
+class KeysetPaginationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('alice')
+        for i in range(25):
+            Complaint.objects.create(title=f'Complaint {i}', description='Text', created_by=cls.user)
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def test_pages_follow_cursor(self):
+        first = self.client.get(reverse('api_complaints'), {'limit': 10}).json()
+        second = self.client.get(reverse('api_complaints'), {'limit': 10, 'cursor': first['next_cursor']}).json()
+        tickets = [row['ticket_number'] for row in first['complaints'] + second['complaints']]
+        self.assertEqual(len(set(tickets)), 20)
+
+    def test_tampered_cursor_starts_over(self):
+        first = self.client.get(reverse('api_complaints'), {'limit': 10}).json()['complaints']
+        for cursor in [encode_cursor(['notadate', 'x'], 'next'), encode_cursor([1.5, 'abc'], 'next'),
+                       encode_cursor([None, None], 'prev'), 'garbage']:
+            with self.subTest(cursor=cursor):
+                response = self.client.get(reverse('api_complaints'), {'limit': 10, 'cursor': cursor})
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(response.json()['complaints'], first)
+                self.assertEqual(self.client.get(reverse('complaints_list'), {'cursor': cursor}).status_code, 200)
+
+
+class ProjectionQueryCountTests(TestCase):
+    """Lists are built from one joined projection, whatever the number of rows."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.staff = User.objects.create_user('staff', is_staff=True, first_name='Sam')
+        cls.category = ComplaintCategory.objects.create(name='Network')
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.staff)
+
+    def create_complaints(self, count):
+        for i in range(count):
+            owner = User.objects.create_user(f'owner{Complaint.objects.count()}', first_name='Ann')
+            Complaint.objects.create(
+                title=f'Complaint {i}', description='Text', created_by=owner,
+                assigned_to=self.staff, category=self.category,
+            )
+
+    def test_api_query_count(self):
+        for count in (5, 50):
+            self.create_complaints(count)
+            # Session, user, one page of complaints
+            with self.assertNumQueries(3):
+                rows = self.client.get(reverse('api_complaints')).json()['complaints']
+            self.assertEqual(rows[0]['assigned_to'], 'staff')
+            self.assertEqual(rows[0]['category'], 'Network')
+
+    def test_list_query_count(self):
+        for count in (5, 50):
+            self.create_complaints(count)
+            cache.clear()
+            # Session, user, capped count, one page of complaints
+            with self.assertNumQueries(4):
+                response = self.client.get(reverse('complaints_list'))
+            self.assertContains(response, 'Network')
+
+
+@skipUnless(connection.vendor == 'sqlite', 'Query plans are checked on SQLite')
+class QueryPlanTests(TestCase):
+    def test_no_full_table_scans(self):
+        stderr = StringIO()
+        try:
+            call_command('check_query_plans', stdout=StringIO(), stderr=stderr)
+        except CommandError as e:
+            self.fail(f'{e}{stderr.getvalue()}')
+
+
+class MetricsAccessTests(TestCase):
+    def test_loopback_allowed(self):
+        self.assertEqual(self.client.get(reverse('metrics')).status_code, 200)
+
+    @override_settings(LOGIN_THROTTLE_PROXY_COUNT=1)
+    def test_proxied_client_denied(self):
+        response = self.client.get(reverse('metrics'), HTTP_X_FORWARDED_FOR='203.0.113.5')
+        self.assertEqual(response.status_code, 403)
+
+    @override_settings(METRICS_TOKEN='secret')
+    def test_token_required(self):
+        self.assertEqual(self.client.get(reverse('metrics')).status_code, 403)
+        response = self.client.get(reverse('metrics'), HTTP_AUTHORIZATION='Bearer secret')
+        self.assertEqual(response.status_code, 200)
+
+
+class RequestMetricsTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('alice')
+        Complaint.objects.create(title='Printer', description='', created_by=self.user)
+
+    async def test_async_requests_track_earlier_connections(self):
+        # As if the connection the views use had been opened before the
+        # middleware was imported
+        await sync_to_async(lambda: connection.execute_wrappers.remove(middleware.track_queries))()
+        client = AsyncClient()
+        await sync_to_async(client.force_login)(self.user)
+        response = await client.get(reverse('api_complaints'))
+        self.assertRegex(response['Server-Timing'], r'desc="[1-9]\d* queries"')
+
+
+class ImportTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('alice')
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, 'complaints.jsonl')
+
+    def write_rows(self, rows):
+        with open(self.path, 'w') as source:
+            source.writelines(row if isinstance(row, str) else json.dumps(row) + '\n' for row in rows)
+
+    def import_rows(self, *args):
+        stdout, stderr = StringIO(), StringIO()
+        call_command('import_complaints', self.path, '--created-by', 'alice', *args, stdout=stdout, stderr=stderr)
+        return stderr.getvalue()
+
+    def test_bad_rows_rejected(self):
+        self.write_rows([
+            {'title': 'Printer', 'description': 'Out of toner', 'created_at': '2024-01-02T03:04:05+00:00'},
+            {'title': '', 'description': 'No title'},
+            {'title': 'Desk', 'description': 'Wobbly', 'status': 'lost'},
+            {'title': 'Chair', 'description': 'Broken', 'created_by': 'nobody'},
+            'not json\n',
+        ])
+        errors = self.import_rows()
+        for row in range(2, 6):
+            self.assertIn(f'Row {row}:', errors)
+        complaint = Complaint.objects.get()
+        self.assertEqual(complaint.title, 'Printer')
+        # Kept from the file rather than stamped by auto_now_add
+        self.assertEqual(complaint.created_at.year, 2024)
+        self.assertEqual(ComplaintHistory.objects.get(complaint=complaint).changed_at, complaint.created_at)
+
+    def test_resume_skips_imported_rows(self):
+        self.write_rows([{'title': f'Complaint {i}', 'description': 'Text'} for i in range(5)])
+        save_batch = import_complaints.Command.save_batch
+        calls = []
+
+        def crash_on_second_batch(command, complaints):
+            calls.append(len(complaints))
+            if len(calls) == 2:
+                raise RuntimeError('crashed')
+            save_batch(command, complaints)
+
+        with mock.patch.object(import_complaints.Command, 'save_batch', crash_on_second_batch):
+            with self.assertRaises(RuntimeError):
+                self.import_rows('--batch-size', '2')
+        self.assertEqual(Complaint.objects.count(), 2)
+        self.import_rows('--batch-size', '2', '--resume')
+        titles = sorted(Complaint.objects.values_list('title', flat=True))
+        self.assertEqual(titles, [f'Complaint {i}' for i in range(5)])
+        self.assertFalse(os.path.exists(f'{self.path}.checkpoint'))
+
+
+class BulkActionTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('alice')
+        cls.staff = User.objects.create_user('staff', is_staff=True)
+        cls.assignee = User.objects.create_user('sam', is_staff=True)
+        cls.complaints = [
+            Complaint.objects.create(title=f'Complaint {i}', description='', created_by=cls.user) for i in range(3)
+        ]
+        cls.tickets = [complaint.ticket_number for complaint in cls.complaints]
+
+    def post(self, name, data, user=None):
+        self.client.force_login(user or self.staff)
+        return self.client.post(reverse(name), json.dumps(data), content_type='application/json').json()
+
+    def history(self, field_name):
+        return ComplaintHistory.objects.filter(field_name=field_name)
+
+    def test_status_change(self):
+        Complaint.objects.filter(pk=self.complaints[0].pk).update(status='resolved')
+        result = self.post('bulk_update_status', {'tickets': self.tickets + ['COMP-999999'], 'status': 'resolved'})
+        self.assertEqual(result['updated'], 2)
+        self.assertEqual(result['results'], {
+            self.tickets[0]: actions.UNCHANGED, self.tickets[1]: actions.UPDATED,
+            self.tickets[2]: actions.UPDATED, 'COMP-999999': actions.NOT_FOUND,
+        })
+        self.assertEqual(set(Complaint.objects.values_list('status', flat=True)), {'resolved'})
+        self.assertFalse(Complaint.objects.filter(resolved_at=None).exclude(pk=self.complaints[0].pk).exists())
+        self.assertEqual(
+            sorted(self.history('status').values_list('complaint_id', 'old_value', 'new_value')),
+            [(complaint.pk, 'pending', 'resolved') for complaint in self.complaints[1:]],
+        )
+
+    def test_assign(self):
+        result = self.post('bulk_assign', {'tickets': self.tickets, 'user_id': self.assignee.pk})
+        self.assertEqual(result['updated'], 3)
+        self.assertEqual(set(Complaint.objects.values_list('assigned_to', flat=True)), {self.assignee.pk})
+        self.assertEqual(self.history('assigned_to').filter(old_value='Unassigned', new_value='sam').count(), 3)
+        result = self.post('bulk_assign', {'tickets': self.tickets[:1]})
+        self.assertEqual(result['updated'], 1)
+        self.assertEqual(Complaint.objects.filter(assigned_to=None).count(), 1)
+        self.assertEqual(self.history('assigned_to').count(), 4)
+
+    def test_staff_only(self):
+        for name, data in [('bulk_update_status', {'tickets': self.tickets, 'status': 'closed'}),
+                           ('bulk_assign', {'tickets': self.tickets, 'user_id': self.assignee.pk})]:
+            self.assertEqual(self.post(name, data, user=self.user)['error'], 'Permission denied')
+        self.assertFalse(Complaint.objects.exclude(status='pending').exists())
+        self.assertFalse(Complaint.objects.exclude(assigned_to=None).exists())
+        self.assertFalse(self.history('status').exists())
+
+    def test_bad_request_writes_nothing(self):
+        bad_ticket = {'tickets': self.tickets + [42], 'status': 'closed'}
+        self.assertFalse(self.post('bulk_update_status', bad_ticket)['success'])
+        self.assertFalse(self.post('bulk_update_status', {'tickets': self.tickets, 'status': 'lost'})['success'])
+        self.assertFalse(self.post('bulk_assign', {'tickets': self.tickets, 'user_id': 0xBAD})['success'])
+        # A failure after the UPDATE rolls the whole batch back
+        with mock.patch.object(actions.events, 'publish_status', side_effect=RuntimeError):
+            with self.assertRaises(RuntimeError):
+                actions.bulk_update_status(self.tickets, 'closed', self.staff)
+        self.assertFalse(Complaint.objects.exclude(status='pending').exists())
+        self.assertFalse(Complaint.objects.exclude(assigned_to=None).exists())
+        self.assertFalse(self.history('status').exists())
+
+
+class AttachmentStorageTests(TestCase):
+    def setUp(self):
+        media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        media_settings = override_settings(MEDIA_ROOT=media_root.name)
+        media_settings.enable()
+        self.addCleanup(media_settings.disable)
+        self.addCleanup(tickets.allocator.reset)
+        self.user = User.objects.create_user('alice')
+
+    def upload(self, filename, content):
+        return Complaint.objects.create(
+            title=filename, description='', created_by=self.user,
+            attachment=SimpleUploadedFile(filename, content),
+        )
+
+    def test_identical_uploads_share_one_file(self):
+        first = self.upload('report.txt', b'same bytes')
+        second = self.upload('copy.TXT', b'same bytes')
+        other = self.upload('other.txt', b'other bytes')
+        self.assertEqual(first.attachment.name, second.attachment.name)
+        self.assertNotEqual(first.attachment.name, other.attachment.name)
+        blob = AttachmentBlob.objects.get(name=first.attachment.name)
+        self.assertEqual((blob.ref_count, blob.size), (2, len(b'same bytes')))
+        storage = first.attachment.storage
+        self.assertEqual(len(storage.listdir(os.path.dirname(first.attachment.name))[1]), 1)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            first.delete()
+        blob.refresh_from_db()
+        self.assertEqual(blob.ref_count, 1)
+        self.assertTrue(storage.exists(second.attachment.name))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            second.delete()
+        self.assertFalse(AttachmentBlob.objects.filter(name=second.attachment.name).exists())
+        self.assertFalse(storage.exists(second.attachment.name))
+        self.assertTrue(storage.exists(other.attachment.name))
+
+
+class ExportTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('alice')
+        Complaint.objects.create(title='=HYPERLINK("http://example.com")', description='-1+1', created_by=cls.user)
+        Complaint.objects.create(title='Printer', description='@SUM(A1)', created_by=cls.user)
+
+    def test_csv_formulas_escaped(self):
+        self.client.force_login(self.user)
+        response = self.client.get(reverse('export_complaints'), {'format': 'csv'})
+        body = b''.join(response.streaming_content).decode()
+        self.assertIn("'=HYPERLINK", body)
+        self.assertIn("'-1+1", body)
+        self.assertIn("'@SUM(A1)", body)
+        self.assertIn(',Printer,', body)
+
+    def test_ticket_number_search(self):
+        self.client.force_login(self.user)
+        complaint = Complaint.objects.get(title='Printer')
+        response = self.client.get(reverse('export_complaints'), {'format': 'jsonl', 'search': complaint.ticket_number})
+        [line] = b''.join(response.streaming_content).splitlines()
+        self.assertEqual(json.loads(line)['ticket_number'], complaint.ticket_number)
+
+    async def test_asgi_streams_async_iterator(self):
+        client = AsyncClient()
+        await sync_to_async(client.force_login)(self.user)
+        response = await client.get(reverse('export_complaints'), {'format': 'jsonl'})
+        self.assertTrue(response.is_async)
+        lines = b''.join([block async for block in response.streaming_content]).splitlines()
+        self.assertEqual(len(lines), 2)
+
+
+@jobs.job('tests.record')
+def record_job(title):
+    Complaint.objects.filter(title=title).update(description='ran')
+
+
+class JobQueueTests(TestCase):
+    def stale_job(self, attempts=0, max_attempts=3):
+        locked_at = timezone.now() - timedelta(hours=1)
+        return Job.objects.create(
+            name='tests.record', payload={'title': 'x'}, status=jobs.RUNNING,
+            attempts=attempts, max_attempts=max_attempts, locked_by='gone', locked_at=locked_at,
+        )
+
+    def test_requeue_counts_an_attempt(self):
+        job_row = self.stale_job()
+        self.assertEqual(jobs.requeue_stale(), 1)
+        job_row.refresh_from_db()
+        self.assertEqual((job_row.status, job_row.attempts), (jobs.PENDING, 1))
+
+    def test_requeue_fails_exhausted_job(self):
+        job_row = self.stale_job(attempts=2)
+        jobs.requeue_stale()
+        job_row.refresh_from_db()
+        self.assertEqual((job_row.status, job_row.attempts), (jobs.FAILED, 3))
+
+    def test_run_after_losing_claim(self):
+        user = User.objects.create_user('alice')
+        complaint = Complaint.objects.create(title='x', description='', created_by=user)
+        job_row = self.stale_job()
+        jobs.requeue_stale()
+        [claimed] = jobs.claim('other-worker', names=['tests.record'])
+        # The first worker finishing late must not complete the job
+        with self.assertLogs('complaints.jobs', 'WARNING'):
+            self.assertFalse(jobs.run(job_row))
+        complaint.refresh_from_db()
+        self.assertEqual(complaint.description, '')
+        self.assertTrue(jobs.run(claimed))
+        claimed.refresh_from_db()
+        self.assertEqual((claimed.status, claimed.attempts), (jobs.DONE, 2))
+
+
+class EventStreamTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('alice')
+        self.client.force_login(self.user)
+
+    def test_no_streams_under_wsgi(self):
+        complaint = Complaint.objects.create(title='Printer', description='', created_by=self.user)
+        self.assertEqual(self.client.get(reverse('dashboard_events')).status_code, 204)
+        url = reverse('complaint_events', args=[complaint.ticket_number])
+        self.assertEqual(self.client.get(url).status_code, 204)
+        response = self.client.get(reverse('dashboard'))
+        self.assertFalse(response.context['live_updates'])
+        self.assertContains(response, 'data-live-updates=""')
+
+
+class DeltaSyncTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('alice')
+        self.client.force_login(self.user)
+
+    def sync(self, since):
+        return self.client.get(reverse('api_complaints'), {'since': since})
+
+    def test_quiet_scope_cursor_does_not_expire(self):
+        complaint = Complaint.objects.create(title='Printer', description='', created_by=self.user)
+        Complaint.objects.filter(pk=complaint.pk).update(updated_at=timezone.now() - timedelta(days=40))
+        first = self.sync('')
+        self.assertEqual(first.status_code, 200)
+        self.assertEqual(len(first.json()['complaints']), 1)
+        second = self.sync(first.json()['next_cursor'])
+        self.assertEqual(second.status_code, 200)
+        self.assertEqual(second.json()['complaints'], [])
+        # Once caught up the cursor stays put, so polls keep revalidating
+        self.assertEqual(self.sync(second.json()['next_cursor']).json(), second.json())
+
+    def test_naive_cursor_rejected(self):
+        cursor = encode_cursor([timezone.now().replace(tzinfo=None), 1], 'next')
+        self.assertEqual(self.sync(cursor).status_code, 400)
+
+
+class FragmentCacheTests(TestCase):
+    template = Template(
+        '{% load fragments %}'
+        '{% fragment "row" complaint.id version=complaint.updated_at %}{{ complaint.title }}{% endfragment %}'
+    )
+
+    def setUp(self):
+        cache.clear()
+        fragments.cache.clear()
+        self.addCleanup(fragments.cache.clear)
+        self.user = User.objects.create_user('alice')
+        self.complaint = Complaint.objects.create(title='Old', description='', created_by=self.user)
+
+    def render(self):
+        return self.template.render(Context({'complaint': self.complaint}))
+
+    def test_rerendered_after_version_change(self):
+        self.assertEqual(self.render(), 'Old')
+        self.complaint.title = 'New'
+        self.assertEqual(self.render(), 'Old')
+        self.complaint.updated_at += timedelta(seconds=1)
+        self.assertEqual(self.render(), 'New')
+
+    def test_invalidated_by_another_process(self):
+        # Another process only shares the generation tokens, not the slots
+        self.assertEqual(self.render(), 'Old')
+        self.complaint.title = 'New'
+        cache.set(fragments._generation_key(self.complaint.pk), 'elsewhere')
+        self.assertEqual(self.render(), 'New')
+        self.complaint.title = 'Renamed'
+        cache.set(fragments.GLOBAL_GENERATION_KEY, 'elsewhere')
+        self.assertEqual(self.render(), 'Renamed')
+
+    def test_comment_edit_rerenders_detail(self):
+        self.client.force_login(self.user)
+        comment = ComplaintComment.objects.create(complaint=self.complaint, user=self.user, comment='first draft')
+        url = reverse('complaint_detail', args=[self.complaint.ticket_number])
+        self.assertContains(self.client.get(url), 'first draft')
+        comment.comment = 'second draft'
+        with self.captureOnCommitCallbacks(execute=True):
+            comment.save()
+        self.assertContains(self.client.get(url), 'second draft')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.first_name = 'Alice'
+            self.user.save()
+        self.assertContains(self.client.get(url), 'Alice')
+
+
+class LoginThrottleTests(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_cache_keys_valid_for_any_username(self):
+        login_throttle = throttle.LoginThrottle(throttle.CacheBackend())
+        for username in ['alice smith', 'bob\x00\n', 'x' * 300]:
+            with self.subTest(username=username[:20]), warnings.catch_warnings():
+                # LocMemCache warns about keys memcached would reject
+                warnings.simplefilter('error', CacheKeyWarning)
+                for _ in range(10):
+                    login_throttle.failure('203.0.113.5', username)
+                self.assertGreater(login_throttle.check(None, username), 0)
+                self.assertGreater(login_throttle.check(None, username.upper()), 0)
+
+    def test_failure_does_not_reveal_username(self):
+        User.objects.create_user('alice', password='correct horse')
+        responses = []
+        with mock.patch.object(throttle.LoginThrottle, 'failure') as failure:
+            for username in ['alice', 'mallory']:
+                # Only the authentication lookup
+                with self.assertNumQueries(1):
+                    response = self.client.post(reverse('login'), {'username': username, 'password': 'wrong'})
+                responses.append(response.json())
+        self.assertEqual(responses[0], responses[1])
+        self.assertFalse(responses[0]['success'])
+        self.assertEqual([call.args[1] for call in failure.call_args_list], ['alice', 'mallory'])
+
+
+class CachedUserTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        patcher = mock.patch.object(auth.cache, 'max_entries', 100)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(auth.cache.entries.clear)
+        self.user = User.objects.create_user('alice', password='correct horse', is_staff=True)
+        self.client.force_login(self.user)
+        self.assertEqual(self.client.get(reverse('dashboard')).status_code, 200)
+        self.assertIn(self.user.pk, auth.cache.entries)
+
+    def change(self, **fields):
+        with self.captureOnCommitCallbacks(execute=True):
+            for name, value in fields.items():
+                setattr(self.user, name, value)
+            self.user.save()
+
+    def test_served_from_memory(self):
+        with self.assertNumQueries(0):
+            user = auth.CachedModelBackend().get_user(self.user.pk)
+        self.assertEqual(user, self.user)
+        self.assertIsNot(user, auth.CachedModelBackend().get_user(self.user.pk))
+
+    def test_password_change_ends_session(self):
+        self.user.set_password('battery staple')
+        self.change()
+        self.assertRedirects(self.client.get(reverse('dashboard')), '/login/?next=/dashboard/', 302, 200)
+
+    def test_deactivated_user_refused(self):
+        self.change(is_active=False)
+        self.assertEqual(self.client.get(reverse('dashboard')).status_code, 302)
+
+    def test_staff_change_applies(self):
+        self.change(is_staff=False)
+        self.assertFalse(auth.CachedModelBackend().get_user(self.user.pk).is_staff)
+
+    def test_deleted_user_refused(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.delete()
+        self.assertIsNone(auth.CachedModelBackend().get_user(self.user.pk))
+        self.assertEqual(self.client.get(reverse('dashboard')).status_code, 302)
+
+
+@override_settings(SESSION_ENGINE='complaints.sessions')
+class WriteBehindSessionTests(TransactionTestCase):
+    def setUp(self):
+        cache.clear()
+        # Each test gets its own queue; the thread is a daemon and stays idle afterwards
+        self.write_behind = sessions.WriteBehind(0.01)
+        patcher = mock.patch.object(sessions, 'write_behind', self.write_behind)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def wait_for_row(self, session_key):
+        deadline = time.monotonic() + 5
+        while not Session.objects.filter(session_key=session_key).exists():
+            self.assertLess(time.monotonic(), deadline, 'session was never written')
+            time.sleep(0.01)
+
+    def test_written_by_thread_and_loaded_from_db(self):
+        store = sessions.SessionStore()
+        store['cart'] = [1, 2]
+        store.save()
+        self.wait_for_row(store.session_key)
+        cache.clear()
+        self.assertEqual(sessions.SessionStore(store.session_key).load(), {'cart': [1, 2]})
+
+    def test_logout_removes_session(self):
+        User.objects.create_user('alice', password='correct horse')
+        self.client.post(reverse('login'), {'username': 'alice', 'password': 'correct horse'})
+        session_key = self.client.cookies[settings.SESSION_COOKIE_NAME].value
+        self.assertTrue(sessions.SessionStore().exists(session_key))
+        self.wait_for_row(session_key)
+        self.client.get(reverse('logout'))
+        self.assertIsNone(cache.get(sessions.SessionStore.cache_key_prefix + session_key))
+        self.assertFalse(sessions.SessionStore().exists(session_key))
+        self.assertFalse(Session.objects.filter(session_key=session_key).exists())
+        self.assertEqual(self.client.get(reverse('dashboard')).status_code, 302)
+
+
+@skipUnless(connection.vendor == 'sqlite', 'SQLite backend')
+class SQLiteTuningTests(TestCase):
+    def pragma(self, conn, name):
+        with conn.cursor() as cursor:
+            cursor.execute(f'PRAGMA {name}')
+            return cursor.fetchone()[0]
+
+    def test_pragmas_applied_to_new_connections(self):
+        with tempfile.TemporaryDirectory() as directory:
+            conn = connections.create_connection('default')
+            conn.settings_dict = {**conn.settings_dict, 'NAME': os.path.join(directory, 'tuned.sqlite3')}
+            try:
+                pragmas = conn.settings_dict['OPTIONS']['pragmas']
+                self.assertEqual(self.pragma(conn, 'journal_mode'), 'wal')
+                self.assertEqual(self.pragma(conn, 'busy_timeout'), pragmas['busy_timeout'])
+                self.assertEqual(self.pragma(conn, 'cache_size'), pragmas['cache_size'])
+                synchronous = {'OFF': 0, 'NORMAL': 1, 'FULL': 2}[pragmas['synchronous']]
+                self.assertEqual(self.pragma(conn, 'synchronous'), synchronous)
+                self.assertEqual(self.pragma(conn, 'temp_store'), 2)
+            finally:
+                conn.close()
+
+
+class RetryOnLockTests(SimpleTestCase):
+    def setUp(self):
+        patcher = mock.patch.object(transactions.time, 'sleep')
+        self.sleep = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def flaky(self, *errors):
+        func = mock.Mock(side_effect=[*errors, 'done'], __name__='flaky')
+        return func, transactions.retry_on_lock(func)
+
+    def test_retries_when_locked(self):
+        func, retried = self.flaky(OperationalError('database is locked'), OperationalError('database is locked'))
+        self.assertEqual(retried(), 'done')
+        self.assertEqual(func.call_count, 3)
+        self.assertEqual(self.sleep.call_count, 2)
+
+    @override_settings(DB_LOCK_RETRIES=1)
+    def test_gives_up_after_retries(self):
+        func, retried = self.flaky(*[OperationalError('database is locked')] * 2)
+        with self.assertRaisesMessage(OperationalError, 'database is locked'):
+            retried()
+        self.assertEqual(func.call_count, 2)
+
+    def test_other_errors_not_retried(self):
+        func, retried = self.flaky(OperationalError('no such table: complaints_complaint'))
+        with self.assertRaises(OperationalError):
+            retried()
+        self.assertEqual(func.call_count, 1)
+
+    def test_not_retried_inside_outer_transaction(self):
+        func, retried = self.flaky(OperationalError('database is locked'))
+        with mock.patch.object(connections['default'], 'in_atomic_block', True):
+            with self.assertRaises(OperationalError):
+                retried()
+        self.assertEqual(func.call_count, 1)
+
+
+@override_settings(DATABASES={
+    **settings.DATABASES, 'replica_1': {**settings.DATABASES['default'], 'TEST': {'MIRROR': 'default'}},
+})
+class ReplicaRoutingTests(SimpleTestCase):
+    @classmethod
+    def setUpClass(cls):
+        # The routers only look at the aliases; no replica connection is opened
+        with warnings.catch_warnings():
+            warnings.filterwarnings('ignore', 'Overriding setting DATABASES')
+            super().setUpClass()
+
+    def setUp(self):
+        self.routed = []
+
+        def view(request):
+            self.routed.append((router.db_for_read(Complaint), router.db_for_read(User)))
+            return HttpResponse()
+        self.middleware = middleware.ReplicaRoutingMiddleware(view)
+        self.factory = RequestFactory()
+
+    def test_get_reads_from_replica(self):
+        self.middleware(self.factory.get('/complaints/'))
+        # Users stay on the primary so logouts and deactivations apply at once
+        self.assertEqual(self.routed, [('replica_1', 'default')])
+        self.assertEqual(router.db_for_read(Complaint), 'default')
+
+    def test_writes_go_to_primary_and_pin_client(self):
+        response = self.middleware(self.factory.post('/complaint/create/'))
+        self.assertEqual(self.routed, [('default', 'default')])
+        self.assertEqual(router.db_for_write(Complaint), 'default')
+        pinned_until = response.cookies[middleware.PRIMARY_PIN_COOKIE].value
+        self.assertGreater(float(pinned_until), time.time())
+
+        self.factory.cookies[middleware.PRIMARY_PIN_COOKIE] = pinned_until
+        self.middleware(self.factory.get('/complaints/'))
+        self.factory.cookies[middleware.PRIMARY_PIN_COOKIE] = str(int(time.time()) - 1)
+        self.middleware(self.factory.get('/complaints/'))
+        self.assertEqual(self.routed[1:], [('default', 'default'), ('replica_1', 'default')])
+
+    def test_failed_write_does_not_pin(self):
+        self.middleware = middleware.ReplicaRoutingMiddleware(lambda request: HttpResponse(status=400))
+        response = self.middleware(self.factory.post('/complaint/create/'))
+        self.assertNotIn(middleware.PRIMARY_PIN_COOKIE, response.cookies)
+
+    def test_no_migrations_on_replicas(self):
+        self.assertFalse(router.allow_migrate('replica_1', 'complaints', model_name='complaint'))
+        self.assertTrue(router.allow_migrate('default', 'complaints', model_name='complaint'))
+
+
+class ExtraDatabasesMixin:
+    """Adds migrated SQLite databases named ``extra_databases`` next to ``default`` for the test case."""
+    extra_databases = ()
+
+    @classmethod
+    def setUpClass(cls):
+        cls.directory = tempfile.TemporaryDirectory()
+        for alias in cls.extra_databases:
+            settings.DATABASES[alias] = {
+                **settings.DATABASES['default'], 'NAME': os.path.join(cls.directory.name, f'{alias}.sqlite3'),
+            }
+            call_command('migrate', database=alias, verbosity=0)
+        cls.databases = {'default', *cls.extra_databases}
+        super().setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        for alias in cls.extra_databases:
+            connections[alias].close()
+            del connections[alias]
+            del settings.DATABASES[alias]
+            search._backends.pop(alias, None)
+        cls.directory.cleanup()
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        self.addCleanup(sharding.id_allocator.reset)
+        self.addCleanup(tickets.allocator.reset)
+
+
+@skipUnless(connection.vendor == 'sqlite', 'SQLite shard files')
+class ShardedComplaintTests(ExtraDatabasesMixin, TestCase):
+    extra_databases = ('shard_0', 'shard_1')
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('alice')
+        cls.staff = User.objects.create_user('bob', is_staff=True)
+        cls.category = ComplaintCategory.objects.create(name='Facilities')
+        start = timezone.now() - timedelta(days=1)
+        for number in range(10):
+            complaint = Complaint.objects.create(
+                title=f'Printer {number}', description='', created_by=cls.user, category=cls.category,
+            )
+            # Interleave the creation times across the shards
+            Complaint.objects.using(sharding.shard_for_id(complaint.pk)).filter(pk=complaint.pk).update(
+                created_at=start + timedelta(minutes=number), updated_at=start + timedelta(minutes=number),
+            )
+
+    def setUp(self):
+        super().setUp()
+        self.client.force_login(self.staff)
+
+    def rows(self):
+        rows = [
+            row for alias in sharding.shard_aliases()
+            for row in Complaint.objects.using(alias).values('ticket_number', 'created_at', 'id')
+        ]
+        return sorted(rows, key=lambda row: (row['created_at'], row['id']), reverse=True)
+
+    def test_complaints_spread_over_shards(self):
+        counts = [Complaint.objects.using(alias).count() for alias in sharding.shard_aliases()]
+        self.assertEqual(sum(counts), 10)
+        self.assertNotIn(0, counts)
+        self.assertEqual(Complaint.objects.using('default').count(), 0)
+
+    def test_detail_reads_home_shard(self):
+        for row in self.rows()[:3]:
+            home = sharding.shard_for_ticket(row['ticket_number'])
+            self.assertEqual(sharding.shard_for_id(row['id']), home)
+            complaint = Complaint.objects.using(home).get(pk=row['id'])
+            ComplaintComment.objects.create(complaint=complaint, user=self.user, comment=f'on {home}')
+            response = self.client.get(reverse('complaint_detail', args=[row['ticket_number']]))
+            self.assertContains(response, complaint.title)
+            self.assertContains(response, f'on {home}')
+
+    def test_list_and_count_merged_in_order(self):
+        expected = [row['ticket_number'] for row in self.rows()]
+        seen, cursor = [], ''
+        while True:
+            page = self.client.get(reverse('api_complaints'), {'limit': 3, 'cursor': cursor}).json()
+            seen += [complaint['ticket_number'] for complaint in page['complaints']]
+            cursor = page['next_cursor']
+            if not cursor:
+                break
+        self.assertEqual(seen, expected)
+        with override_settings(COMPLAINT_LIST_COUNT_MODE='exact'):
+            response = self.client.get(reverse('complaints_list'), {'search': 'Printer'})
+        self.assertEqual(response.context['total_count'], 10)
+        self.assertEqual([row['ticket_number'] for row in response.context['complaints']], expected)
+
+    def test_user_created_later_reaches_every_shard(self):
+        carol = User.objects.create_user('carol')
+        for alias in sharding.shard_aliases():
+            self.assertTrue(User.objects.using(alias).filter(pk=carol.pk, username='carol').exists())
+        complaint = Complaint.objects.create(title='Heating', description='', created_by=carol)
+        carol.first_name = 'Carol'
+        carol.save()
+        self.assertEqual(
+            {User.objects.using(alias).get(pk=carol.pk).first_name for alias in sharding.shard_aliases()}, {'Carol'},
+        )
+        carol.delete()
+        self.assertFalse(Complaint.objects.for_ticket(complaint.ticket_number).exists())
+
+    def test_export_ticket_search(self):
+        ticket_number = self.rows()[4]['ticket_number']
+        response = self.client.get(reverse('export_complaints'), {'format': 'jsonl', 'search': ticket_number})
+        [line] = b''.join(response.streaming_content).splitlines()
+        self.assertEqual(json.loads(line)['ticket_number'], ticket_number)
+        response = self.client.get(reverse('export_complaints'), {'format': 'jsonl'})
+        ids = [json.loads(line)['ticket_number'] for line in b''.join(response.streaming_content).splitlines()]
+        self.assertEqual(sorted(ids), sorted(row['ticket_number'] for row in self.rows()))
+
+
+class HistoryArchiveTests(TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        archive_settings = override_settings(HISTORY_ARCHIVE_DIR=directory.name)
+        archive_settings.enable()
+        self.addCleanup(archive_settings.disable)
+        self.user = User.objects.create_user('alice')
+        self.complaints = [
+            Complaint.objects.create(title=f'Complaint {i}', description='', created_by=self.user) for i in range(2)
+        ]
+        old = timezone.now() - timedelta(days=400)
+        for complaint in self.complaints:
+            for hours, value in enumerate(['pending', 'in_progress', 'resolved', 'closed', 'pending']):
+                entry = ComplaintHistory.objects.create(
+                    complaint=complaint, changed_by=self.user, field_name='status', new_value=value,
+                )
+                # The first three fall outside the retention period
+                changed_at = old + timedelta(hours=hours) if hours < 3 else timezone.now() - timedelta(hours=5 - hours)
+                ComplaintHistory.objects.filter(pk=entry.pk).update(changed_at=changed_at)
+
+    def archive(self, *args):
+        call_command('archive_history', *args, days=365, stdout=StringIO())
+
+    def segments(self):
+        return sorted(path.name for path in history_archive.archive_dir().iterdir())
+
+    def test_older_history_round_trip(self):
+        complaint = self.complaints[0]
+        expected = list(complaint.history.order_by('-changed_at', '-id').values_list('id', 'new_value'))
+        self.archive()
+        self.assertEqual(complaint.history.count(), 2)
+        self.assertEqual(complaint.archived_history.get().entry_count, 3)
+        self.assertEqual(len(self.segments()), 1)
+
+        entries, has_more = history_archive.older_history(complaint)
+        self.assertFalse(has_more)
+        self.assertEqual([(entry.id, entry.new_value) for entry in entries], expected)
+        # Paging across the boundary between table and archive
+        seen, before = [], None
+        while True:
+            entries, has_more = history_archive.older_history(complaint, before_id=before, limit=2)
+            seen += [entry.id for entry in entries]
+            if not has_more:
+                break
+            before = entries[-1].id
+        self.assertEqual(seen, [entry_id for entry_id, _ in expected])
+
+    def test_prune_removes_segment_of_deleted_complaints(self):
+        self.archive()
+        [segment] = self.segments()
+        hour_ago = time.time() - 3601
+        os.utime(history_archive.archive_dir() / segment, (hour_ago, hour_ago))
+        self.complaints[0].delete()
+        self.archive('--prune')
+        self.assertEqual(self.segments(), [segment])
+        self.complaints[1].delete()
+        self.archive('--prune')
+        self.assertEqual(self.segments(), [])
+
+
+@skipUnless(connection.vendor == 'sqlite', 'SQLite cold database file')
+class ColdTierTests(ExtraDatabasesMixin, TestCase):
+    extra_databases = ('cold_0',)
+
+    def setUp(self):
+        super().setUp()
+        self.staff = User.objects.create_user('bob', is_staff=True)
+        self.client.force_login(self.staff)
+        self.complaint = Complaint.objects.create(
+            title='Broken heater', description='', created_by=self.staff, status='resolved',
+        )
+        for text in ['first', 'second']:
+            ComplaintComment.objects.create(complaint=self.complaint, user=self.staff, comment=f'{text} comment')
+        ComplaintHistory.objects.create(
+            complaint=self.complaint, changed_by=self.staff, field_name='status', new_value='resolved',
+        )
+        long_ago = timezone.now() - timedelta(days=200)
+        Complaint.objects.filter(pk=self.complaint.pk).update(created_at=long_ago, updated_at=long_ago)
+        ComplaintComment.objects.update(created_at=long_ago)
+        ComplaintHistory.objects.update(changed_at=long_ago)
+
+    def rows(self, alias):
+        return (
+            list(Complaint._base_manager.using(alias).values_list('id', 'created_at', 'updated_at', 'status')),
+            list(ComplaintComment.objects.using(alias).order_by('id').values_list('id', 'created_at', 'comment')),
+            list(ComplaintHistory.objects.using(alias).order_by('id').values_list('id', 'changed_at', 'new_value')),
+        )
+
+    def test_freeze_detail_update_thaw(self):
+        hot = self.rows('default')
+        self.assertEqual(tiering.freeze(), 1)
+        self.assertEqual(self.rows('cold_0'), hot)
+        self.assertEqual(self.rows('default'), ([], [], []))
+        self.assertFalse(ComplaintTombstone.objects.exists())
+
+        url = reverse('complaint_detail', args=[self.complaint.ticket_number])
+        response = self.client.get(url)
+        self.assertContains(response, 'Broken heater')
+        self.assertContains(response, 'second comment')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(
+                reverse('update_status', args=[self.complaint.ticket_number]),
+                json.dumps({'status': 'closed'}), content_type='application/json',
+            )
+        self.assertTrue(response.json()['success'])
+        self.assertEqual(self.rows('cold_0'), ([], [], []))
+        complaints, comments, history = self.rows('default')
+        self.assertEqual([row[:2] + row[3:] for row in complaints], [hot[0][0][:2] + ('closed',)])
+        self.assertEqual(comments, hot[1])
+        self.assertEqual(history[:-1], hot[2])
+        self.assertEqual(history[-1][2], 'closed')
+        self.assertFalse(ComplaintTombstone.objects.exists())
+        self.assertContains(self.client.get(url), 'first comment')
@@ -0,0 +1,203 @@
+"""
+Login throttling.
+
+Failed logins are counted in a sliding window per client IP and per
+username. ``login_view`` asks ``LoginThrottle.check`` before doing anything
+else, so an address or account over its limit is turned away without a
+password hash or a database query; that keeps a credential-stuffing burst
+from tying up every worker on PBKDF2.
+
+A failure that reaches a limit locks the key out for
+``LOGIN_LOCKOUT_SECONDS`` and sends ``login_locked_out``; while locked,
+attempts are refused with a ``429``. A successful login clears the username's failures.
+Counters live in the backend named by ``LOGIN_THROTTLE_BACKEND``:
+``LocalBackend`` keeps them in this process, ``CacheBackend`` in a Django
+cache shared by every process (memcached or Redis in production).
+Usernames go into the keys hashed, so whatever the form accepts makes a
+valid memcached key.
+"""
+import hashlib
+import threading
+import time
+from collections import OrderedDict, deque
+
+from django.conf import settings
+from django.core.cache import caches
+from django.dispatch import Signal
+from django.utils.module_loading import import_string
+
+from . import metrics
+
+# Sent with scope ('ip' or 'username'), key and seconds when a key gets locked out
+login_locked_out = Signal()
+
+login_attempts = metrics.registry.register(metrics.Counter(
+    'complaints_login_attempts_total', 'Login attempts by result (success, failure, throttled).', ('result',),
+))
+login_lockouts = metrics.registry.register(metrics.Counter(
+    'complaints_login_lockouts_total', 'Keys locked out after too many failed logins, by scope.', ('scope',),
+))
+
+
+class LocalBackend:
+    """Exact sliding log per key, in this process only; oldest keys go past ``max_keys``."""
+
+    def __init__(self, max_keys=100000):
+        self.max_keys = max_keys
+        self.hits = OrderedDict()
+        self.locks = {}
+        self.lock = threading.Lock()
+
+    def _window(self, key, window, now):
+        hits = self.hits.get(key)
+        if hits is None:
+            return None
+        while hits and hits[0] <= now - window:
+            hits.popleft()
+        if not hits:
+            del self.hits[key]
+            return None
+        return hits
+
+    def hit(self, key, window):
+        """Record an attempt; returns the attempts now in the window."""
+        now = time.monotonic()
+        with self.lock:
+            hits = self._window(key, window, now)
+            if hits is None:
+                hits = self.hits[key] = deque()
+            hits.append(now)
+            self.hits.move_to_end(key)
+            while len(self.hits) > self.max_keys:
+                self.hits.popitem(last=False)
+            return len(hits)
+
+    def reset(self, key, window):
+        with self.lock:
+            self.hits.pop(key, None)
+            self.locks.pop(key, None)
+
+    def lock_out(self, key, seconds):
+        with self.lock:
+            if len(self.locks) >= self.max_keys:
+                now = time.monotonic()
+                self.locks = {k: until for k, until in self.locks.items() if until > now}
+            self.locks[key] = time.monotonic() + seconds
+
+    def locked_for(self, key):
+        """Seconds left on ``key``'s lockout, 0 if none."""
+        with self.lock:
+            until = self.locks.get(key)
+            if until is None:
+                return 0
+            remaining = until - time.monotonic()
+            if remaining <= 0:
+                del self.locks[key]
+                return 0
+            return remaining
+
+
+class CacheBackend:
+    """Sliding-window counter in a shared Django cache.
+
+    Keeps one counter per fixed window and weights the previous window by
+    how much of it still overlaps, which needs only atomic ``incr`` from the
+    cache instead of a stored log of attempts.
+    """
+
+    def __init__(self, alias=None):
+        self.cache = caches[alias or getattr(settings, 'LOGIN_THROTTLE_CACHE', 'default')]
+
+    def _buckets(self, key, window):
+        now = time.time()
+        current = int(now // window)
+        overlap = 1 - (now % window) / window
+        return f'{key}:{current}', f'{key}:{current - 1}', overlap
+
+    def hit(self, key, window):
+        current_key, previous_key, overlap = self._buckets(key, window)
+        # add() first: incr() on a missing key raises
+        self.cache.add(current_key, 0, window * 2)
+        current = self.cache.incr(current_key)
+        return current + int((self.cache.get(previous_key) or 0) * overlap)
+
+    def reset(self, key, window):
+        current_key, previous_key, _ = self._buckets(key, window)
+        self.cache.delete_many([current_key, previous_key, f'{key}:locked'])
+
+    def lock_out(self, key, seconds):
+        self.cache.set(f'{key}:locked', time.time() + seconds, seconds)
+
+    def locked_for(self, key):
+        until = self.cache.get(f'{key}:locked')
+        return max(until - time.time(), 0) if until else 0
+
+
+class LoginThrottle:
+    def __init__(self, backend):
+        self.backend = backend
+
+    def rules(self, ip, username):
+        """``(scope, key, limit, window)`` for each counter an attempt goes against."""
+        rules = []
+        if ip:
+            rules.append((
+                'ip', f'login:ip:{ip}',
+                getattr(settings, 'LOGIN_THROTTLE_IP_LIMIT', 30),
+                getattr(settings, 'LOGIN_THROTTLE_IP_WINDOW', 300),
+            ))
+        if username:
+            rules.append((
+                'username', f'login:user:{hashlib.sha256(username.lower().encode()).hexdigest()}',
+                getattr(settings, 'LOGIN_THROTTLE_USERNAME_LIMIT', 10),
+                getattr(settings, 'LOGIN_THROTTLE_USERNAME_WINDOW', 900),
+            ))
+        return rules
+
+    def check(self, ip, username):
+        """Seconds the client has to wait before trying again, or 0 to go ahead."""
+        for scope, key, _, _ in self.rules(ip, username):
+            wait = self.backend.locked_for(key)
+            if wait:
+                login_attempts.inc('throttled')
+                return wait
+        return 0
+
+    def failure(self, ip, username):
+        login_attempts.inc('failure')
+        for scope, key, limit, window in self.rules(ip, username):
+            if self.backend.hit(key, window) >= limit:
+                seconds = getattr(settings, 'LOGIN_LOCKOUT_SECONDS', 900)
+                self.backend.lock_out(key, seconds)
+                login_lockouts.inc(scope)
+                login_locked_out.send(sender=self.__class__, scope=scope, key=key, seconds=seconds)
+
+    def success(self, ip, username):
+        login_attempts.inc('success')
+        # The address keeps its count: one good password shouldn't unlock a stuffing run
+        for scope, key, _, window in self.rules(None, username):
+            self.backend.reset(key, window)
+
+
+_throttle = None
+_throttle_lock = threading.Lock()
+
+
+def login_throttle():
+    global _throttle
+    if _throttle is None:
+        with _throttle_lock:
+            if _throttle is None:
+                backend = getattr(settings, 'LOGIN_THROTTLE_BACKEND', 'complaints.throttle.LocalBackend')
+                _throttle = LoginThrottle(import_string(backend)())
+    return _throttle
+
+
+def client_ip(request):
+    """The client address, skipping ``LOGIN_THROTTLE_PROXY_COUNT`` trusted proxies in X-Forwarded-For."""
+    proxies = getattr(settings, 'LOGIN_THROTTLE_PROXY_COUNT', 0)
+    if proxies:
+        forwarded = [part.strip() for part in request.META.get('HTTP_X_FORWARDED_FOR', '').split(',') if part.strip()]
+        if len(forwarded) >= proxies:
+            return forwarded[-proxies]
+    return request.META.get('REMOTE_ADDR', '')
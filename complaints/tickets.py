@@ -0,0 +1,149 @@
+"""
+Ticket number allocation.
+
+Ticket numbers come from a single ``TicketSequence`` row instead of looking
+up the latest complaint on every insert. Each worker process reserves a block
+of numbers with one atomic UPDATE and then hands them out from memory, so
+creating a complaint normally costs no extra query and concurrent writers can
+never be given the same number.
+
+A block reserved inside a caller's transaction is only handed out within
+that transaction until it commits: if it rolls back, the sequence is rolled
+back with it and the block is dropped, so another process reserving the
+same numbers can't produce duplicates.
+"""
+import os
+import threading
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import F
+
+TICKET_PREFIX = 'COMP-'
+SEQUENCE_NAME = 'complaint_ticket'
+
+
+def format_ticket_number(value):
+    return f"{TICKET_PREFIX}{str(value).zfill(6)}"
+
+
+def reserve_block(count, name=SEQUENCE_NAME):
+    """Reserve ``count`` consecutive numbers and return the first one.
+
+    The UPDATE takes the row lock (MySQL) or the write lock (SQLite) before
+    the value is read back, so two callers can never see the same range.
+    """
+    from .models import TicketSequence
+
+    if count < 1:
+        raise ValueError('count must be at least 1')
+
+    with transaction.atomic():
+        updated = TicketSequence.objects.filter(name=name).update(
+            next_value=F('next_value') + count
+        )
+        if not updated:
+            try:
+                with transaction.atomic():
+                    TicketSequence.objects.create(name=name, next_value=1 + count)
+                return 1
+            except IntegrityError:
+                # Another process created the row first
+                TicketSequence.objects.filter(name=name).update(
+                    next_value=F('next_value') + count
+                )
+        end = TicketSequence.objects.filter(name=name).values_list('next_value', flat=True).get()
+    return end - count
+
+
+class TicketNumberAllocator:
+    """Hands out ticket numbers from a block reserved per worker process."""
+
+    def __init__(self, name=SEQUENCE_NAME, block_size=None):
+        self.name = name
+        self.block_size = block_size
+        self._lock = threading.Lock()
+        self._pid = None
+        self._next = 0
+        self._end = 0
+        # (connection, on_commit callback) while the block's reservation is uncommitted
+        self._pending = None
+
+    def get_block_size(self):
+        if self.block_size is not None:
+            return self.block_size
+        return getattr(settings, 'TICKET_NUMBER_BLOCK_SIZE', 20)
+
+    def _confirm(self, callback):
+        with self._lock:
+            if self._pending is not None and self._pending[1] is callback:
+                self._pending = None
+
+    def _block_usable(self):
+        # A forked worker must not reuse the parent's block
+        if self._pid != os.getpid() or self._next >= self._end:
+            return False
+        if self._pending is None:
+            return True
+        # Uncommitted: only the reserving transaction may use it, and only
+        # while its commit hook is still queued (a rollback discards it)
+        connection, callback = self._pending
+        return connection is transaction.get_connection() and any(
+            func is callback for _sids, func, _robust in connection.run_on_commit
+        )
+
+    def next_value(self):
+        with self._lock:
+            if not self._block_usable():
+                block_size = self.get_block_size()
+                connection = transaction.get_connection()
+                self._next = reserve_block(block_size, self.name)
+                self._end = self._next + block_size
+                self._pid = os.getpid()
+                self._pending = None
+                if connection.in_atomic_block:
+                    def confirm():
+                        self._confirm(confirm)
+                    self._pending = (connection, confirm)
+                    transaction.on_commit(confirm)
+            value = self._next
+            self._next += 1
+            return value
+
+    def take_values(self, count):
+        """Return ``count`` values for bulk inserts.
+
+        Large requests get their own contiguous range directly from the
+        sequence so the per-process block is left untouched.
+        """
+        if count <= 0:
+            return []
+        if count > self.get_block_size():
+            start = reserve_block(count, self.name)
+            return list(range(start, start + count))
+        return [self.next_value() for _ in range(count)]
+
+    def take(self, count):
+        """Return ``count`` ticket numbers for bulk inserts."""
+        return [format_ticket_number(value) for value in self.take_values(count)]
+
+    def reset(self):
+        with self._lock:
+            self._pid = None
+            self._next = self._end = 0
+            self._pending = None
+
+
+allocator = TicketNumberAllocator()
+
+
+def next_ticket_number():
+    return format_ticket_number(allocator.next_value())
+
+
+def assign_ticket_numbers(complaints):
+    """Fill in missing ticket numbers on unsaved complaints before ``bulk_create``."""
+    missing = [c for c in complaints if not c.ticket_number]
+    for complaint, number in zip(missing, allocator.take(len(missing))):
+        complaint.ticket_number = number
+    return complaints
@@ -0,0 +1,237 @@
+"""
+Hot/cold tiering of finished complaints.
+
+Most complaints are resolved or closed within weeks and never change again,
+yet they stay in the tables and indexes every dashboard, list and API query
+works through. Once a resolved or closed complaint hasn't been updated for
+``COLD_TIER_AFTER_DAYS`` it is moved, with its comments, history and history
+archive index, from its shard (or ``default``) to the paired cold database
+(``COMPLAINT_COLD_DATABASES``, see ``settings.py``). The cold databases
+carry the full schema, so archived tickets keep their own indexes and
+full-text search while the hot tables only hold live work.
+
+Reads:
+
+* Lookups by ticket number (``get_complaint``) try the hot tier and then the
+  cold one, so detail pages, links and the per-complaint APIs work for
+  archived tickets unchanged; rows related to a cold complaint are read
+  from its database (``routers.ShardRouter``).
+* Lists, search, the JSON API and exports only query the hot tier unless
+  asked for archived tickets (``?archived=1``, ``with_archived()``).
+  Dashboard counters, attachment recounts and rollup rebuilds cover both.
+
+Writes move the complaint back to the hot tier first (``thaw``): a status
+change, assignment or comment on an archived ticket reopens it there, and
+it ages out again later.
+
+Rows are copied as they are -- same ids, same timestamps, no model signals,
+so rollups, stats, attachments and delta sync don't see a move as a delete
+and a create -- and deleted from the source only after the copy committed.
+A crash in between leaves a duplicate that the hot tier shadows and the
+next move of the complaint replaces. Moves in both directions hold the hot
+database's write lock while they copy, so they can't interleave.
+"""
+from datetime import timedelta
+from functools import partial
+
+from django.conf import settings
+from django.db import transaction
+from django.http import Http404
+from django.utils import timezone
+
+from . import bulk, sharding
+from .jobs import periodic
+from .models import Complaint, ComplaintComment, ComplaintHistory, HistoryArchiveBlock
+
+TERMINAL_STATUSES = ['resolved', 'closed']
+# Moved along with their complaint. The full-text index follows the
+# complaints table by itself (triggers on SQLite, FULLTEXT on MySQL)
+RELATED_MODELS = [ComplaintComment, ComplaintHistory, HistoryArchiveBlock]
+
+
+def is_enabled():
+    return bool(sharding.cold_aliases())
+
+
+def is_archived(complaint):
+    return sharding.is_cold(complaint._state.db)
+
+
+def cold_queryset(ticket_number, queryset=None):
+    """``queryset`` filtered to ``ticket_number`` on the cold database that would hold it."""
+    queryset = Complaint.objects.all() if queryset is None else queryset
+    alias = sharding.cold_for(sharding.shard_for_ticket(ticket_number))
+    return queryset.using(alias).filter(ticket_number=ticket_number)
+
+
+def get_complaint(ticket_number, queryset=None):
+    """The complaint with ``ticket_number`` from the hot tier, or else the cold one.
+
+    ``queryset`` may add annotations; raises ``Complaint.DoesNotExist``.
+    """
+    queryset = Complaint.objects.all() if queryset is None else queryset
+    try:
+        return queryset.for_ticket(ticket_number).get()
+    except Complaint.DoesNotExist:
+        if not is_enabled():
+            raise
+    return cold_queryset(ticket_number, queryset).get()
+
+
+def get_complaint_or_404(ticket_number, queryset=None):
+    try:
+        return get_complaint(ticket_number, queryset)
+    except Complaint.DoesNotExist:
+        raise Http404('No Complaint matches the given query.')
+
+
+def _related(alias, complaint_ids):
+    return {
+        model: list(model._base_manager.using(alias).filter(complaint_id__in=complaint_ids).order_by('id'))
+        for model in RELATED_MODELS
+    }
+
+
+def _copy(model, objs, alias):
+    """Insert ``objs`` into ``alias`` as they are: same ids and timestamps, no signals."""
+    if not objs:
+        return
+    # bulk_create applies auto_now(_add); the original values are written back
+    timestamps = bulk.timestamps_of(model, objs) if model in bulk.TIMESTAMP_FIELDS else None
+    model._base_manager.using(alias).bulk_create(objs)
+    if timestamps is not None:
+        bulk.restore_timestamps(model, objs, timestamps)
+
+
+def _copy_all(alias, complaints, related):
+    _copy(Complaint, complaints, alias)
+    for model, objs in related.items():
+        _copy(model, objs, alias)
+
+
+def _raw_delete(queryset, alias):
+    # QuerySet._raw_delete() is private; checked on Django 4.2. The public
+    # delete() sends post_delete, which would release the complaint's
+    # attachment and record a tombstone as if it had been deleted
+    return queryset._raw_delete(alias)
+
+
+def _delete(alias, complaint_ids):
+    """Delete complaints and their related rows from ``alias``; no signals, as nothing is gone."""
+    for model in RELATED_MODELS:
+        _raw_delete(model._base_manager.using(alias).filter(complaint_id__in=complaint_ids), alias)
+    _raw_delete(Complaint._base_manager.using(alias).filter(id__in=complaint_ids), alias)
+
+
+def cutoff_for(days=None):
+    if days is None:
+        days = getattr(settings, 'COLD_TIER_AFTER_DAYS', 90)
+    return timezone.now() - timedelta(days=days)
+
+
+def freeze_batch(alias, cutoff, batch_size):
+    """Move up to ``batch_size`` finished complaints not updated since ``cutoff`` off ``alias``.
+
+    Returns how many moved to ``alias``'s cold database.
+    """
+    cold = sharding.cold_for(alias)
+    with transaction.atomic(using=alias):
+        complaints = []
+        for status in TERMINAL_STATUSES:
+            complaints += (
+                Complaint._base_manager.using(alias).select_for_update()
+                .filter(status=status, updated_at__lt=cutoff)
+                .order_by('updated_at', 'id')[:batch_size - len(complaints)]
+            )
+        if not complaints:
+            return 0
+        ids = [complaint.pk for complaint in complaints]
+        related = _related(alias, ids)
+        with transaction.atomic(using=cold):
+            # Copies left behind by an interrupted move
+            _delete(cold, ids)
+            _copy_all(cold, complaints, related)
+        _delete(alias, ids)
+    return len(complaints)
+
+
+def freeze(cutoff=None, batch_size=None, max_batches=None):
+    """Move finished complaints not updated since ``cutoff`` to the cold tier; returns how many.
+
+    ``max_batches`` limits the batches per database.
+    """
+    if cutoff is None:
+        cutoff = cutoff_for()
+    if batch_size is None:
+        batch_size = getattr(settings, 'COLD_TIER_BATCH_SIZE', 200)
+    total = 0
+    for alias in sharding.complaint_databases():
+        batches = 0
+        while max_batches is None or batches < max_batches:
+            moved = freeze_batch(alias, cutoff, batch_size)
+            total += moved
+            batches += 1
+            if moved < batch_size:
+                break
+    return total
+
+
+@periodic
+def freeze_old_complaints():
+    """Move one batch of aged-out complaints per database to the cold tier."""
+    if not is_enabled() or not getattr(settings, 'COLD_TIER_AFTER_DAYS', 90):
+        return 0
+    return freeze(max_batches=1)
+
+
+def _thaw(cold, complaint_ids):
+    hot = sharding.hot_for(cold)
+    with transaction.atomic(using=hot):
+        # Locks the ids (gap locks on MySQL) so a concurrent thaw waits here
+        present = set(
+            Complaint._base_manager.using(hot).select_for_update()
+            .filter(id__in=complaint_ids).values_list('id', flat=True)
+        )
+        missing = [complaint_id for complaint_id in complaint_ids if complaint_id not in present]
+        complaints = list(Complaint._base_manager.using(cold).filter(id__in=missing))
+        if complaints:
+            _copy_all(hot, complaints, _related(cold, [complaint.pk for complaint in complaints]))
+        # Only once the hot copies are safe, which inside a caller's
+        # transaction is when that commits
+        transaction.on_commit(partial(_delete_cold, cold, complaint_ids), using=hot)
+    return len(complaints)
+
+
+def _delete_cold(alias, complaint_ids):
+    with transaction.atomic(using=alias):
+        _delete(alias, complaint_ids)
+
+
+def thaw(complaint):
+    """Move an archived ``complaint`` back to the hot tier before it is changed.
+
+    The instance is updated in place, so saving it afterwards writes to the
+    hot tier; complaints already there are left alone.
+    """
+    cold = complaint._state.db
+    if not sharding.is_cold(cold):
+        return complaint
+    _thaw(cold, [complaint.pk])
+    complaint._state.db = sharding.hot_for(cold)
+    return complaint
+
+
+def thaw_tickets(ticket_numbers):
+    """Move the archived ones among ``ticket_numbers`` back to the hot tier (bulk actions)."""
+    if not is_enabled():
+        return 0
+    by_database = {}
+    for ticket_number in ticket_numbers:
+        alias = sharding.cold_for(sharding.shard_for_ticket(ticket_number))
+        by_database.setdefault(alias, []).append(ticket_number)
+    moved = 0
+    for alias, tickets in sorted(by_database.items()):
+        ids = list(Complaint._base_manager.using(alias).filter(ticket_number__in=tickets).values_list('id', flat=True))
+        if ids:
+            moved += _thaw(alias, ids)
+    return moved
@@ -0,0 +1,55 @@
+"""
+Retrying transactions that lose a lock race.
+
+``retry_on_lock`` reruns a function that opens its own transaction when the
+database reports lock contention: SQLite's "database is locked" once
+``busy_timeout`` runs out, or a MySQL deadlock or lock wait timeout. The
+transaction has been rolled back by then (with its ``on_commit``
+callbacks), so running it again is safe. Inside an outer transaction the
+error is raised as is, since only the outermost block can be retried.
+"""
+import functools
+import random
+import time
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, OperationalError, connections
+
+from . import metrics
+
+lock_retries = metrics.registry.register(metrics.Counter(
+    'complaints_db_lock_retries_total', 'Transactions rerun after lock contention, by function.', ('function',),
+))
+
+# ER_LOCK_WAIT_TIMEOUT, ER_LOCK_DEADLOCK
+MYSQL_LOCK_ERRORS = {1205, 1213}
+
+
+def is_lock_error(exc):
+    if not isinstance(exc, OperationalError):
+        return False
+    if exc.args and exc.args[0] in MYSQL_LOCK_ERRORS:
+        return True
+    return 'database is locked' in str(exc) or 'database table is locked' in str(exc)
+
+
+def retry_on_lock(func=None, *, using=DEFAULT_DB_ALIAS):
+    """Rerun ``func`` up to ``DB_LOCK_RETRIES`` times with jittered exponential backoff."""
+    if func is None:
+        return functools.partial(retry_on_lock, using=using)
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        retries = getattr(settings, 'DB_LOCK_RETRIES', 3)
+        backoff = getattr(settings, 'DB_LOCK_RETRY_BACKOFF_MS', 50) / 1000
+        attempt = 0
+        while True:
+            try:
+                return func(*args, **kwargs)
+            except OperationalError as exc:
+                if attempt >= retries or not is_lock_error(exc) or connections[using].in_atomic_block:
+                    raise
+            lock_retries.inc(func.__name__)
+            time.sleep(backoff * 2 ** attempt * random.uniform(0.5, 1.5))
+            attempt += 1
+    return wrapper
@@ -1,5 +1,9 @@
+from django.conf import settings
 from django.urls import path
-from . import views
+from . import api_async, views
+
+# Polled JSON endpoints and event streams: async views under ASGI, sync ones under WSGI
+api = api_async if settings.ASYNC_API_VIEWS else views
 
 urlpatterns = [
     path('', views.dashboard, name='dashboard'),
@@ -7,12 +11,19 @@ urlpatterns = [
     path('register/', views.register_view, name='register'),
     path('logout/', views.logout_view, name='logout'),
     path('dashboard/', views.dashboard, name='dashboard'),
+    path('dashboard/events/', api.dashboard_events, name='dashboard_events'),
     path('complaints/', views.complaints_list, name='complaints_list'),
+    path('complaints/export/', views.export_complaints, name='export_complaints'),
     path('complaint/create/', views.create_complaint, name='create_complaint'),
     path('complaint/<str:ticket_number>/', views.complaint_detail, name='complaint_detail'),
-    path('api/complaints/', views.api_complaints, name='api_complaints'),
-    path('api/stats/', views.api_stats, name='api_stats'),
-    path('api/complaint/<str:ticket_number>/status/', views.update_complaint_status, name='update_status'),
+    path('complaint/<str:ticket_number>/events/', api.complaint_events, name='complaint_events'),
+    path('api/complaints/', api.api_complaints, name='api_complaints'),
+    path('api/complaints/bulk/status/', views.bulk_update_status, name='bulk_update_status'),
+    path('api/complaints/bulk/assign/', views.bulk_assign, name='bulk_assign'),
+    path('api/stats/', api.api_stats, name='api_stats'),
+    path('api/stats/trends/', views.api_stats_trends, name='api_stats_trends'),
+    path('api/complaint/<str:ticket_number>/status/', api.update_complaint_status, name='update_status'),
     path('api/complaint/<str:ticket_number>/assign/', views.assign_complaint, name='assign_complaint'),
-    path('api/complaint/<str:ticket_number>/comment/', views.add_comment, name='add_comment'),
+    path('api/complaint/<str:ticket_number>/comment/', api.add_comment, name='add_comment'),
+    path('api/complaint/<str:ticket_number>/history/', views.complaint_history, name='complaint_history'),
 ]
@@ -2,16 +2,31 @@ from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth import login, authenticate, logout
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
-from django.http import JsonResponse
+from django.http import HttpResponse, HttpResponseForbidden, JsonResponse, StreamingHttpResponse
 from django.views.decorators.http import require_http_methods
 from django.views.decorators.csrf import csrf_exempt
-from django.core.paginator import Paginator
-from django.db.models import Q, Count
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.db.models import Exists, OuterRef, Subquery
 from django.utils import timezone
+from django.utils.crypto import constant_time_compare
 import json
+import math
+from datetime import timedelta
 
-from .models import Complaint, ComplaintCategory, ComplaintComment, ComplaintHistory
+from . import actions, events, metrics, sharding, tiering
+from .attachments import thumbnail_url
+from .export import FORMATS as EXPORT_FORMATS, aiter_export, export_queryset, filter_complaints, iter_export
+from .models import Complaint, ComplaintCategory, ComplaintComment, ComplaintHistory, HistoryArchiveBlock
 from .forms import ComplaintForm, UserRegistrationForm
+from .history_archive import older_history
+from .pagination import KeysetPaginator, approximate_count
+from .rollups import get_trends
+from .search import search_complaints
+from .serializers import project, to_api_dict, to_list_row
+from .stats import get_stats, status_distribution
+from .sync import CursorError, changes_since, conditional_json, parse_since
+from .throttle import client_ip, login_throttle
 
 
 def login_view(request):
@@ -35,10 +50,23 @@ def login_view(request):
                 'error': 'Password is required. Please enter your password.'
             })
         
+        # Refuse locked-out addresses and accounts before hashing anything
+        throttle = login_throttle()
+        ip = client_ip(request)
+        retry_after = throttle.check(ip, username)
+        if retry_after:
+            response = JsonResponse({
+                'success': False,
+                'error': 'Too many failed login attempts. Please try again later.'
+            }, status=429)
+            response['Retry-After'] = str(math.ceil(retry_after))
+            return response
+        
         # Authenticate user
         user = authenticate(request, username=username, password=password)
         if user is not None:
             if user.is_active:
+                throttle.success(ip, username)
                 login(request, user)
                 return JsonResponse({'success': True, 'redirect': '/dashboard/'})
             else:
@@ -47,18 +75,13 @@ def login_view(request):
                     'error': 'Your account is inactive. Please contact administrator.'
                 })
         else:
-            # Check if username exists to provide better error message
-            from django.contrib.auth.models import User
-            if User.objects.filter(username=username).exists():
-                return JsonResponse({
-                    'success': False, 
-                    'error': 'Invalid password. Please check your password and try again.'
-                })
-            else:
-                return JsonResponse({
-                    'success': False, 
-                    'error': 'Invalid username or password. Please check your credentials and try again.'
-                })
+            throttle.failure(ip, username)
+            
+            # Same answer whether or not the username exists, so failures don't reveal accounts
+            return JsonResponse({
+                'success': False, 
+                'error': 'Invalid username or password. Please check your credentials and try again.'
+            })
     
     return render(request, 'complaints/login.html')
 
@@ -94,25 +117,18 @@ def dashboard(request):
         complaints = complaints.filter(created_by=user)
     
     # Statistics
-    stats = {
-        'total': complaints.count(),
-        'pending': complaints.filter(status='pending').count(),
-        'in_progress': complaints.filter(status='in_progress').count(),
-        'resolved': complaints.filter(status='resolved').count(),
-        'urgent': complaints.filter(priority='urgent', status__in=['pending', 'in_progress']).count(),
-    }
+    stats = get_stats(user)
     
     # Recent complaints
-    recent_complaints = complaints.order_by('-created_at')[:10]
-    
-    # Status distribution
-    status_distribution = complaints.values('status').annotate(count=Count('id'))
+    recent_complaints = sharding.head(complaints.order_by('-created_at'), 10)
     
     context = {
         'stats': stats,
         'recent_complaints': recent_complaints,
-        'status_distribution': list(status_distribution),
+        'status_distribution': status_distribution(stats),
         'is_staff': user.is_staff,
+        'live_updates': events.streams_enabled(request),
+        'poll_seconds': getattr(settings, 'DASHBOARD_POLL_SECONDS', 30),
     }
     return render(request, 'complaints/dashboard.html', context)
 
@@ -120,33 +136,41 @@ def dashboard(request):
 @login_required
 def complaints_list(request):
     user = request.user
-    complaints = Complaint.objects.all()
-    
-    if not user.is_staff:
-        complaints = complaints.filter(created_by=user)
     
     # Search and filters
     search = request.GET.get('search', '')
     status_filter = request.GET.get('status', '')
     priority_filter = request.GET.get('priority', '')
+    # Archived (cold tier) complaints are only searched when asked for
+    include_archived = bool(request.GET.get('archived'))
     
-    if search:
-        complaints = complaints.filter(
-            Q(ticket_number__icontains=search) |
-            Q(title__icontains=search) |
-            Q(description__icontains=search)
-        )
+    complaints = filter_complaints(
+        Complaint.objects.all(), user, status_filter, priority_filter, include_archived,
+    )
+    
+    count_mode = getattr(settings, 'COMPLAINT_LIST_COUNT_MODE', 'approximate')
+    if count_mode != 'off':
+        matching = search_complaints(complaints, search, ranked=False) if search else complaints
+        if count_mode == 'exact':
+            total_count, count_is_exact = sharding.count(matching), True
+        else:
+            total_count, count_is_exact = approximate_count(matching)
+    else:
+        total_count, count_is_exact = None, False
     
-    if status_filter:
-        complaints = complaints.filter(status=status_filter)
+    # Search results come back ranked by relevance
+    if search:
+        complaints = search_complaints(complaints, search)
+    else:
+        complaints = complaints.order_by('-created_at')
     
-    if priority_filter:
-        complaints = complaints.filter(priority=priority_filter)
+    # Cursor pagination: deep pages cost the same as the first one
+    complaints_page = KeysetPaginator(project(complaints), 20).get_page(request.GET.get('cursor'))
+    complaints_page.object_list = [to_list_row(row) for row in complaints_page]
     
-    # Pagination
-    paginator = Paginator(complaints.order_by('-created_at'), 20)
-    page = request.GET.get('page', 1)
-    complaints_page = paginator.get_page(page)
+    # Filters carried over to the next/previous page links
+    filter_query = request.GET.copy()
+    filter_query.pop('cursor', None)
     
     categories = ComplaintCategory.objects.all()
     
@@ -156,36 +180,109 @@ def complaints_list(request):
         'current_status': status_filter,
         'current_priority': priority_filter,
         'search_query': search,
+        'include_archived': include_archived,
+        'archive_available': tiering.is_enabled(),
+        'filter_query': filter_query.urlencode(),
+        'total_count': total_count,
+        'count_is_exact': count_is_exact,
         'is_staff': user.is_staff,
     }
     return render(request, 'complaints/complaints_list.html', context)
 
 
+@login_required
+def export_complaints(request):
+    export_format = request.GET.get('format', 'csv')
+    if export_format not in EXPORT_FORMATS:
+        return JsonResponse({'success': False, 'error': 'Invalid format'}, status=400)
+    
+    complaints = filter_complaints(
+        Complaint.objects.all(), request.user,
+        request.GET.get('status', ''), request.GET.get('priority', ''), bool(request.GET.get('archived')),
+    )
+    complaints = export_queryset(complaints, request.GET.get('search', ''))
+    
+    # Rows are read and sent chunk by chunk while the response streams; under
+    # ASGI only an async iterator is streamed rather than collected first
+    stream = aiter_export if isinstance(request, ASGIRequest) else iter_export
+    response = StreamingHttpResponse(
+        stream(complaints, export_format), content_type=EXPORT_FORMATS[export_format]
+    )
+    filename = f"complaints-{timezone.now():%Y%m%d-%H%M%S}.{export_format}"
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
+
+
 @login_required
 def complaint_detail(request, ticket_number):
-    complaint = get_object_or_404(Complaint, ticket_number=ticket_number)
+    # The latest comment and history ids version the cached panels; the lists
+    # themselves are only queried when a panel has to be rendered again
+    complaint = tiering.get_complaint_or_404(ticket_number, Complaint.objects.annotate(
+        last_comment_id=Subquery(
+            ComplaintComment.objects.filter(complaint=OuterRef('pk')).order_by('-id').values('id')[:1]
+        ),
+        last_history_id=Subquery(
+            ComplaintHistory.objects.filter(complaint=OuterRef('pk')).order_by('-id').values('id')[:1]
+        ),
+        # Entries beyond the 20 shown, in the table or archived, are
+        # loaded by complaint_history when the user asks for them
+        has_older_history=Exists(ComplaintHistory.objects.filter(complaint=OuterRef('pk')).order_by()[20:]),
+        has_archived_history=Exists(HistoryArchiveBlock.objects.filter(complaint=OuterRef('pk'))),
+    ))
     user = request.user
     
     # Check permission
-    if not user.is_staff and complaint.created_by != user:
+    if not user.is_staff and complaint.created_by_id != user.pk:
         messages.error(request, 'You do not have permission to view this complaint.')
         return redirect('complaints_list')
     
-    comments = complaint.comments.all()
-    history = complaint.history.all()[:20]
+    comments = complaint.comments.select_related('user')
+    history = complaint.history.select_related('changed_by')[:20]
+    
+    # Thumbnails are rendered in the background; until then only the link shows
+    attachment_thumbnail = thumbnail_url(complaint.attachment.name) if complaint.attachment else None
     
     context = {
         'complaint': complaint,
+        'attachment_thumbnail': attachment_thumbnail,
         'comments': comments,
         'history': history,
         'is_staff': user.is_staff,
-        'can_edit': user.is_staff or complaint.created_by == user,
+        'is_archived': tiering.is_archived(complaint),
+        'live_updates': events.streams_enabled(request),
+        'can_edit': user.is_staff or complaint.created_by_id == user.pk,
         'status_choices': Complaint.STATUS_CHOICES,
         'priority_choices': Complaint.PRIORITY_CHOICES,
     }
     return render(request, 'complaints/complaint_detail.html', context)
 
 
+@login_required
+def complaint_history(request, ticket_number):
+    """History entries older than ``?before=<history id>`` (newest first), archived or not"""
+    complaint = tiering.get_complaint_or_404(ticket_number)
+    
+    if not request.user.is_staff and complaint.created_by_id != request.user.pk:
+        return JsonResponse({'success': False, 'error': 'Permission denied'}, status=403)
+    
+    before = request.GET.get('before', '')
+    try:
+        before = int(before) if before else None
+    except ValueError:
+        return JsonResponse({'success': False, 'error': 'Invalid history id'}, status=400)
+    
+    entries, has_more = older_history(complaint, before, limit=50)
+    # Archived entries only carry the user id
+    from django.contrib.auth.models import User
+    users = User.objects.in_bulk({entry.changed_by_id for entry in entries if entry.changed_by_id})
+    
+    return JsonResponse({
+        'success': True,
+        'history': [events.history_event(entry, users.get(entry.changed_by_id)) for entry in entries],
+        'has_more': has_more,
+    })
+
+
 @login_required
 def create_complaint(request):
     if request.method == 'POST':
@@ -198,15 +295,18 @@ def create_complaint(request):
                 category_id = request.POST.get('category', '').strip()
                 if not category_id:
                     complaint.category = None
-                complaint.save()
                 
-                # Create history entry
-                ComplaintHistory.objects.create(
-                    complaint=complaint,
-                    changed_by=request.user,
-                    field_name='created',
-                    new_value='Complaint created'
-                )
+                # Background jobs queued by the save commit together with it
+                with sharding.atomic_for(complaint):
+                    complaint.save()
+                    
+                    # Create history entry
+                    ComplaintHistory.objects.create(
+                        complaint=complaint,
+                        changed_by=request.user,
+                        field_name='created',
+                        new_value='Complaint created'
+                    )
                 
                 return JsonResponse({
                     'success': True,
@@ -235,7 +335,7 @@ def create_complaint(request):
 @login_required
 @require_http_methods(["POST"])
 def update_complaint_status(request, ticket_number):
-    complaint = get_object_or_404(Complaint, ticket_number=ticket_number)
+    complaint = tiering.get_complaint_or_404(ticket_number)
     
     if not request.user.is_staff:
         return JsonResponse({'success': False, 'error': 'Permission denied'})
@@ -247,20 +347,7 @@ def update_complaint_status(request, ticket_number):
     if new_status not in dict(Complaint.STATUS_CHOICES):
         return JsonResponse({'success': False, 'error': 'Invalid status'})
     
-    old_status = complaint.status
-    complaint.status = new_status
-    if resolution_notes:
-        complaint.resolution_notes = resolution_notes
-    complaint.save()
-    
-    # Create history entry
-    ComplaintHistory.objects.create(
-        complaint=complaint,
-        changed_by=request.user,
-        field_name='status',
-        old_value=old_status,
-        new_value=new_status
-    )
+    actions.update_status(complaint, new_status, request.user, resolution_notes)
     
     return JsonResponse({'success': True, 'status': new_status})
 
@@ -268,7 +355,7 @@ def update_complaint_status(request, ticket_number):
 @login_required
 @require_http_methods(["POST"])
 def assign_complaint(request, ticket_number):
-    complaint = get_object_or_404(Complaint, ticket_number=ticket_number)
+    complaint = tiering.get_complaint_or_404(ticket_number)
     
     if not request.user.is_staff:
         return JsonResponse({'success': False, 'error': 'Permission denied'})
@@ -276,6 +363,9 @@ def assign_complaint(request, ticket_number):
     data = json.loads(request.body)
     user_id = data.get('user_id')
     
+    # Archived complaints move back to the hot tier before they change
+    tiering.thaw(complaint)
+    
     if user_id:
         from django.contrib.auth.models import User
         assigned_user = get_object_or_404(User, id=user_id)
@@ -306,10 +396,75 @@ def assign_complaint(request, ticket_number):
     return JsonResponse({'success': True})
 
 
+def _bulk_tickets(data):
+    """Return the de-duplicated ticket list of a bulk request, or an error message."""
+    tickets = data.get('tickets')
+    if not isinstance(tickets, list) or not tickets or not all(isinstance(t, str) for t in tickets):
+        return None, 'Provide a non-empty list of ticket numbers'
+    limit = getattr(settings, 'BULK_ACTION_MAX_TICKETS', 1000)
+    tickets = list(dict.fromkeys(tickets))
+    if len(tickets) > limit:
+        return None, f'At most {limit} tickets per request'
+    return tickets, None
+
+
+@login_required
+@require_http_methods(["POST"])
+def bulk_update_status(request):
+    """Change the status of many complaints in one transaction"""
+    if not request.user.is_staff:
+        return JsonResponse({'success': False, 'error': 'Permission denied'})
+    
+    try:
+        data = json.loads(request.body)
+    except ValueError:
+        return JsonResponse({'success': False, 'error': 'Invalid JSON'}, status=400)
+    
+    tickets, error = _bulk_tickets(data)
+    if error:
+        return JsonResponse({'success': False, 'error': error})
+    
+    new_status = data.get('status')
+    if new_status not in dict(Complaint.STATUS_CHOICES):
+        return JsonResponse({'success': False, 'error': 'Invalid status'})
+    
+    results = actions.bulk_update_status(tickets, new_status, request.user, data.get('resolution_notes', ''))
+    updated = sum(1 for outcome in results.values() if outcome == actions.UPDATED)
+    return JsonResponse({'success': True, 'status': new_status, 'updated': updated, 'results': results})
+
+
+@login_required
+@require_http_methods(["POST"])
+def bulk_assign(request):
+    """Assign (or unassign) many complaints in one transaction"""
+    if not request.user.is_staff:
+        return JsonResponse({'success': False, 'error': 'Permission denied'})
+    
+    try:
+        data = json.loads(request.body)
+    except ValueError:
+        return JsonResponse({'success': False, 'error': 'Invalid JSON'}, status=400)
+    
+    tickets, error = _bulk_tickets(data)
+    if error:
+        return JsonResponse({'success': False, 'error': error})
+    
+    assignee = None
+    if data.get('user_id'):
+        from django.contrib.auth.models import User
+        assignee = User.objects.filter(id=data['user_id']).first()
+        if assignee is None:
+            return JsonResponse({'success': False, 'error': 'User not found'})
+    
+    results = actions.bulk_assign(tickets, assignee, request.user)
+    updated = sum(1 for outcome in results.values() if outcome == actions.UPDATED)
+    return JsonResponse({'success': True, 'updated': updated, 'results': results})
+
+
 @login_required
 @require_http_methods(["POST"])
 def add_comment(request, ticket_number):
-    complaint = get_object_or_404(Complaint, ticket_number=ticket_number)
+    complaint = tiering.get_complaint_or_404(ticket_number)
     
     user = request.user
     if not user.is_staff and complaint.created_by != user:
@@ -322,12 +477,7 @@ def add_comment(request, ticket_number):
     if not comment_text:
         return JsonResponse({'success': False, 'error': 'Comment cannot be empty'})
     
-    comment = ComplaintComment.objects.create(
-        complaint=complaint,
-        user=user,
-        comment=comment_text,
-        is_internal=is_internal and user.is_staff
-    )
+    comment = actions.add_comment(complaint, user, comment_text, is_internal and user.is_staff)
     
     return JsonResponse({
         'success': True,
@@ -345,11 +495,29 @@ def add_comment(request, ticket_number):
 def api_complaints(request):
     """API endpoint for fetching complaints"""
     user = request.user
+    
+    try:
+        limit = min(max(int(request.GET.get('limit', 100)), 1), 100)
+    except ValueError:
+        limit = 100
+    
+    # Delta sync: only what changed since the client's cursor
+    if 'since' in request.GET:
+        try:
+            since = parse_since(request.GET['since'])
+        except CursorError as e:
+            return JsonResponse({'success': False, 'error': str(e)}, status=e.status)
+        return conditional_json(request, changes_since(user, since, limit))
+    
     complaints = Complaint.objects.all()
     
     if not user.is_staff:
         complaints = complaints.filter(created_by=user)
     
+    # Archived (cold tier) complaints only with ?archived=1
+    if request.GET.get('archived'):
+        complaints = complaints.with_archived()
+    
     # Apply filters
     status = request.GET.get('status')
     priority = request.GET.get('priority')
@@ -360,44 +528,70 @@ def api_complaints(request):
     if priority:
         complaints = complaints.filter(priority=priority)
     if search:
-        complaints = complaints.filter(
-            Q(ticket_number__icontains=search) |
-            Q(title__icontains=search)
-        )
+        complaints = search_complaints(complaints, search)
+    else:
+        complaints = complaints.order_by('-created_at')
     
-    complaints_list = []
-    for complaint in complaints.order_by('-created_at')[:100]:
-        complaints_list.append({
-            'id': complaint.id,
-            'ticket_number': complaint.ticket_number,
-            'title': complaint.title,
-            'status': complaint.status,
-            'priority': complaint.priority,
-            'created_by': complaint.created_by.username,
-            'assigned_to': complaint.assigned_to.username if complaint.assigned_to else None,
-            'created_at': complaint.created_at.strftime('%Y-%m-%d %H:%M:%S'),
-            'category': complaint.category.name if complaint.category else None,
-        })
+    page = KeysetPaginator(project(complaints), limit).get_page(request.GET.get('cursor'))
+    complaints_list = [to_api_dict(row) for row in page]
     
-    return JsonResponse({'complaints': complaints_list})
+    return conditional_json(request, {
+        'complaints': complaints_list,
+        'next_cursor': page.next_cursor,
+        'prev_cursor': page.prev_cursor,
+    })
 
 
 @login_required
 def api_stats(request):
     """API endpoint for dashboard statistics"""
-    user = request.user
-    complaints = Complaint.objects.all()
+    stats = get_stats(request.user)
+    keys = ['total', 'pending', 'in_progress', 'resolved', 'closed', 'urgent']
+    return conditional_json(request, {key: stats[key] for key in keys})
+
+
+@login_required
+def api_stats_trends(request):
+    """API endpoint for complaint trends over time"""
+    if not request.user.is_staff:
+        return JsonResponse({'success': False, 'error': 'Permission denied'})
     
-    if not user.is_staff:
-        complaints = complaints.filter(created_by=user)
+    granularity = request.GET.get('granularity', 'day')
+    if granularity not in ('hour', 'day', 'week'):
+        return JsonResponse({'success': False, 'error': 'Invalid granularity'})
     
-    stats = {
-        'total': complaints.count(),
-        'pending': complaints.filter(status='pending').count(),
-        'in_progress': complaints.filter(status='in_progress').count(),
-        'resolved': complaints.filter(status='resolved').count(),
-        'closed': complaints.filter(status='closed').count(),
-        'urgent': complaints.filter(priority='urgent', status__in=['pending', 'in_progress']).count(),
-    }
+    # Hourly series are limited to a week to keep the response small
+    max_days = 7 if granularity == 'hour' else 366
+    try:
+        days = min(max(int(request.GET.get('days', 30)), 1), max_days)
+    except ValueError:
+        return JsonResponse({'success': False, 'error': 'Invalid number of days'})
     
-    return JsonResponse(stats)
+    end = timezone.now()
+    start = end - timedelta(days=days)
+    return JsonResponse(get_trends(start, end, granularity))
+
+
+@login_required
+def complaint_events(request, ticket_number):
+    """Server-Sent Events stream of status, assignment and comment changes"""
+    # Streams are served by the async views under ASGI; here one would hold a worker
+    return events.no_stream_response()
+
+
+@login_required
+def dashboard_events(request):
+    """Server-Sent Events stream of complaints created, changing status or deleted in the user's scope"""
+    return events.no_stream_response()
+
+
+def metrics_view(request):
+    """Prometheus metrics for this worker process"""
+    token = getattr(settings, 'METRICS_TOKEN', '')
+    if token and not constant_time_compare(request.META.get('HTTP_AUTHORIZATION', ''), f'Bearer {token}'):
+        return HttpResponseForbidden('Forbidden')
+    allowed = getattr(settings, 'METRICS_ALLOWED_IPS', ['127.0.0.1', '::1'])
+    # Behind a reverse proxy REMOTE_ADDR is the proxy's; client_ip skips it
+    if '*' not in allowed and client_ip(request) not in allowed:
+        return HttpResponseForbidden('Forbidden')
+    return HttpResponse(metrics.registry.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
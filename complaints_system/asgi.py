@@ -12,5 +12,7 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'complaints_system.settings')
+# Serve the async versions of the polled JSON API views
+os.environ.setdefault('ASYNC_API_VIEWS', 'True')
 
 application = get_asgi_application()
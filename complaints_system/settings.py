@@ -4,7 +4,8 @@ Django settings for complaints_system project.
 
 from pathlib import Path
 import os
-from decouple import config
+from decouple import Csv, config
+from django.core.exceptions import ImproperlyConfigured
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -36,6 +37,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'complaints.middleware.RequestMetricsMiddleware',
+    'complaints.middleware.ReplicaRoutingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'corsheaders.middleware.CorsMiddleware',
@@ -88,13 +91,78 @@ if DB_ENGINE == 'mysql':
         }
     }
 else:
+    # Tuned SQLite (complaints/sqlite): WAL so readers don't wait for writers,
+    # write transactions that queue for the lock instead of failing, and
+    # connections kept open between requests
     DATABASES = {
         'default': {
-            'ENGINE': 'django.db.backends.sqlite3',
+            'ENGINE': 'complaints.sqlite',
             'NAME': BASE_DIR / 'db.sqlite3',
+            'CONN_MAX_AGE': config('DB_CONN_MAX_AGE', default=600, cast=int),
+            'CONN_HEALTH_CHECKS': True,
+            'OPTIONS': {
+                'transaction_mode': 'IMMEDIATE',
+                'pragmas': {
+                    'journal_mode': 'WAL',
+                    # NORMAL is durable against crashes in WAL mode; FULL also survives power loss
+                    'synchronous': config('SQLITE_SYNCHRONOUS', default='NORMAL'),
+                    'busy_timeout': config('SQLITE_BUSY_TIMEOUT_MS', default=5000, cast=int),
+                    'mmap_size': config('SQLITE_MMAP_SIZE', default=256 * 1024 * 1024, cast=int),
+                    # Negative: size in KiB rather than pages
+                    'cache_size': -config('SQLITE_CACHE_SIZE_KB', default=64 * 1024, cast=int),
+                    'temp_store': 'MEMORY',
+                },
+            },
         }
     }
 
+# Read replicas, as hosts (MySQL) or database files (SQLite), added as
+# replica_1, replica_2, ... GET requests read from them (complaints/routers.py);
+# clients that just wrote read from the primary for REPLICA_PIN_SECONDS, which
+# should exceed the replicas' lag, as should DELTA_SYNC_LAG_SECONDS below.
+# Locally, `manage.py sync_replicas` copies a SQLite primary into its replicas
+DATABASE_REPLICAS = config('DATABASE_REPLICAS', default='', cast=Csv())
+for number, replica in enumerate(DATABASE_REPLICAS, 1):
+    DATABASES[f'replica_{number}'] = {
+        **DATABASES['default'],
+        **({'HOST': replica} if DB_ENGINE == 'mysql' else {'NAME': BASE_DIR / replica}),
+        'TEST': {'MIRROR': 'default'},
+    }
+
+# Complaint shards, as hosts (MySQL) or database files (SQLite), added as
+# shard_0, shard_1, ... Complaints, comments and history are spread over them
+# by ticket number (complaints/sharding.py); the rest stays on default. Each
+# shard needs `manage.py migrate --database shard_N`, and the list can't
+# change once complaints exist
+COMPLAINT_SHARDS = config('COMPLAINT_SHARDS', default='', cast=Csv())
+for number, shard in enumerate(COMPLAINT_SHARDS):
+    DATABASES[f'shard_{number}'] = {
+        **DATABASES['default'],
+        **({'HOST': shard} if DB_ENGINE == 'mysql' else {'NAME': BASE_DIR / shard}),
+    }
+# Threads running the per-shard queries of lists, searches and stats
+SHARD_QUERY_THREADS = config('SHARD_QUERY_THREADS', default=8, cast=int)
+
+# Cold tier for old resolved and closed complaints (complaints/tiering.py), as
+# hosts (MySQL) or database files (SQLite) added as cold_0, cold_1, ... One per
+# complaint database: a single entry, or one per shard in COMPLAINT_SHARDS order.
+# Each needs `manage.py migrate --database cold_N`; empty disables tiering
+COMPLAINT_COLD_DATABASES = config('COMPLAINT_COLD_DATABASES', default='', cast=Csv())
+if COMPLAINT_COLD_DATABASES and len(COMPLAINT_COLD_DATABASES) != max(len(COMPLAINT_SHARDS), 1):
+    raise ImproperlyConfigured('COMPLAINT_COLD_DATABASES needs one entry per shard (or one when unsharded)')
+for number, cold in enumerate(COMPLAINT_COLD_DATABASES):
+    DATABASES[f'cold_{number}'] = {
+        **DATABASES['default'],
+        **({'HOST': cold} if DB_ENGINE == 'mysql' else {'NAME': BASE_DIR / cold}),
+    }
+# Resolved and closed complaints untouched for this many days move to the cold
+# tier, a batch per worker housekeeping round
+COLD_TIER_AFTER_DAYS = config('COLD_TIER_AFTER_DAYS', default=90, cast=int)
+COLD_TIER_BATCH_SIZE = config('COLD_TIER_BATCH_SIZE', default=200, cast=int)
+
+DATABASE_ROUTERS = ['complaints.routers.ShardRouter', 'complaints.routers.ReplicaRouter']
+REPLICA_PIN_SECONDS = config('REPLICA_PIN_SECONDS', default=5, cast=int)
+
 
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
@@ -137,6 +205,12 @@ STATIC_ROOT = BASE_DIR / 'staticfiles'
 MEDIA_URL = 'media/'
 MEDIA_ROOT = BASE_DIR / 'media'
 
+# Uploads stream to a temp file and are hashed on the way in (see complaints/uploads.py)
+FILE_UPLOAD_HANDLERS = ['complaints.uploads.HashingFileUploadHandler']
+
+# Attachment thumbnails: longest side in pixels (rendered by the job worker)
+ATTACHMENT_THUMBNAIL_SIZE = config('ATTACHMENT_THUMBNAIL_SIZE', default=320, cast=int)
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/4.2/ref/settings/#default-auto-field
 
@@ -154,3 +228,120 @@ CORS_ALLOW_CREDENTIALS = True
 LOGIN_URL = '/login/'
 LOGIN_REDIRECT_URL = '/dashboard/'
 LOGOUT_REDIRECT_URL = '/login/'
+
+# Ticket numbers reserved per worker process in one round-trip
+TICKET_NUMBER_BLOCK_SIZE = config('TICKET_NUMBER_BLOCK_SIZE', default=20, cast=int)
+
+# Seconds a cached dashboard statistics entry may live before recomputation
+COMPLAINT_STATS_CACHE_TIMEOUT = config('COMPLAINT_STATS_CACHE_TIMEOUT', default=300, cast=int)
+
+# Complaint list header count: 'exact', 'approximate' (capped / estimated) or 'off'
+COMPLAINT_LIST_COUNT_MODE = config('COMPLAINT_LIST_COUNT_MODE', default='approximate')
+COMPLAINT_LIST_COUNT_CAP = config('COMPLAINT_LIST_COUNT_CAP', default=1000, cast=int)
+
+# Most tickets a bulk status/assign request may touch
+BULK_ACTION_MAX_TICKETS = config('BULK_ACTION_MAX_TICKETS', default=1000, cast=int)
+
+# Route the polled JSON API and event streams to the async views in complaints/api_async.py (set by asgi.py)
+ASYNC_API_VIEWS = config('ASYNC_API_VIEWS', default=False, cast=bool)
+
+# Request metrics: requests slower than this (ms) get their SQL logged; 0 disables
+SLOW_REQUEST_THRESHOLD_MS = config('SLOW_REQUEST_THRESHOLD_MS', default=500, cast=int)
+
+# Clients allowed to scrape /metrics ('*' allows everyone). Behind a reverse proxy
+# on the same host every request comes from loopback, so the endpoint is public
+# unless LOGIN_THROTTLE_PROXY_COUNT is set (the client address is then taken from
+# X-Forwarded-For) or METRICS_TOKEN is
+METRICS_ALLOWED_IPS = config('METRICS_ALLOWED_IPS', default='127.0.0.1,::1', cast=Csv())
+# When set, scrapers must also send "Authorization: Bearer <METRICS_TOKEN>"
+METRICS_TOKEN = config('METRICS_TOKEN', default='')
+
+# Background jobs (manage.py run_worker). JOBS_EAGER runs them in-process on commit instead
+JOBS_EAGER = config('JOBS_EAGER', default=False, cast=bool)
+JOB_POLL_INTERVAL = config('JOB_POLL_INTERVAL', default=1.0, cast=float)
+JOB_MAX_ATTEMPTS = config('JOB_MAX_ATTEMPTS', default=5, cast=int)
+JOB_RETRY_BACKOFF = config('JOB_RETRY_BACKOFF', default=5, cast=int)  # seconds, doubled per attempt
+JOB_RETRY_BACKOFF_MAX = config('JOB_RETRY_BACKOFF_MAX', default=3600, cast=int)
+JOB_LOCK_TIMEOUT = config('JOB_LOCK_TIMEOUT', default=300, cast=int)  # requeue jobs running longer
+JOB_RETENTION_HOURS = config('JOB_RETENTION_HOURS', default=24, cast=int)
+# Pending rollup updates older than this (seconds) make the trends endpoint and
+# `manage.py check --database default` warn that no worker is running
+ROLLUP_STALE_SECONDS = config('ROLLUP_STALE_SECONDS', default=300, cast=int)
+
+# Live updates (Server-Sent Events), served only under ASGI (asgi.py); under WSGI
+# the dashboard polls /api/stats/ every DASHBOARD_POLL_SECONDS (0 disables)
+# instead. The default broker is in-process, so with several server processes
+# point EVENTS_BROKER at a shared implementation.
+EVENTS_BROKER = config('EVENTS_BROKER', default='complaints.events.LocalBroker')
+# Recent events kept for clients reconnecting with Last-Event-ID
+EVENTS_REPLAY_SIZE = config('EVENTS_REPLAY_SIZE', default=1000, cast=int)
+# Unread events per stream before the client is told to reload instead
+EVENTS_MAX_PENDING = config('EVENTS_MAX_PENDING', default=1000, cast=int)
+SSE_HEARTBEAT_SECONDS = config('SSE_HEARTBEAT_SECONDS', default=15, cast=int)
+# Streams end after this long and the browser reconnects
+SSE_MAX_STREAM_SECONDS = config('SSE_MAX_STREAM_SECONDS', default=300, cast=int)
+SSE_RETRY_MS = config('SSE_RETRY_MS', default=3000, cast=int)
+DASHBOARD_POLL_SECONDS = config('DASHBOARD_POLL_SECONDS', default=30, cast=int)
+
+# Delta sync (api_complaints?since=): changes younger than this are held back so
+# late-committing transactions can't be skipped; cursors older than the
+# tombstone retention must sync again from the start
+DELTA_SYNC_LAG_SECONDS = config('DELTA_SYNC_LAG_SECONDS', default=2, cast=int)
+TOMBSTONE_RETENTION_DAYS = config('TOMBSTONE_RETENTION_DAYS', default=30, cast=int)
+
+# Complaint history older than this many days is moved from the database into
+# compressed segment files (complaints/history_archive.py); 0 keeps it all
+HISTORY_RETENTION_DAYS = config('HISTORY_RETENTION_DAYS', default=365, cast=int)
+HISTORY_ARCHIVE_DIR = config('HISTORY_ARCHIVE_DIR', default=str(BASE_DIR / 'archive' / 'history'))
+# History rows moved per segment file and transaction
+HISTORY_ARCHIVE_BATCH_SIZE = config('HISTORY_ARCHIVE_BATCH_SIZE', default=5000, cast=int)
+
+# Rendered complaint rows and detail panels kept per process (approximate bytes); 0 disables
+FRAGMENT_CACHE_MAX_BYTES = config('FRAGMENT_CACHE_MAX_BYTES', default=32 * 1024 * 1024, cast=int)
+# Slots are checked against generation tokens in this cache, so it must be
+# shared between processes for comment edits and renames to reach all of them
+FRAGMENT_CACHE_ALIAS = config('FRAGMENT_CACHE_ALIAS', default='default')
+
+# Login throttling: failed logins per client IP and per username within a
+# sliding window (seconds); reaching a limit locks that key out. Anyone who
+# knows a username can keep it locked out for LOGIN_LOCKOUT_SECONDS at a time
+# by failing its logins, so keep the lockout short
+LOGIN_THROTTLE_IP_LIMIT = config('LOGIN_THROTTLE_IP_LIMIT', default=30, cast=int)
+LOGIN_THROTTLE_IP_WINDOW = config('LOGIN_THROTTLE_IP_WINDOW', default=300, cast=int)
+LOGIN_THROTTLE_USERNAME_LIMIT = config('LOGIN_THROTTLE_USERNAME_LIMIT', default=10, cast=int)
+LOGIN_THROTTLE_USERNAME_WINDOW = config('LOGIN_THROTTLE_USERNAME_WINDOW', default=900, cast=int)
+LOGIN_LOCKOUT_SECONDS = config('LOGIN_LOCKOUT_SECONDS', default=900, cast=int)
+# Counters are per process by default; with several server processes use
+# complaints.throttle.CacheBackend and a shared LOGIN_THROTTLE_CACHE
+LOGIN_THROTTLE_BACKEND = config('LOGIN_THROTTLE_BACKEND', default='complaints.throttle.LocalBackend')
+LOGIN_THROTTLE_CACHE = config('LOGIN_THROTTLE_CACHE', default='default')
+# Reverse proxies in front of the app whose X-Forwarded-For entries are trusted
+# (also used for METRICS_ALLOWED_IPS)
+LOGIN_THROTTLE_PROXY_COUNT = config('LOGIN_THROTTLE_PROXY_COUNT', default=0, cast=int)
+
+# Cache shared by sessions, the user cache and login throttling. The default is
+# per process; with several server processes point it at memcached or Redis
+CACHES = {
+    'default': {
+        'BACKEND': config('CACHE_BACKEND', default='django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': config('CACHE_LOCATION', default=''),
+    }
+}
+
+# SESSION_ENGINE=complaints.sessions keeps sessions in the cache and writes
+# them to the database in batches every SESSION_WRITE_BEHIND_SECONDS
+SESSION_ENGINE = config('SESSION_ENGINE', default='django.contrib.sessions.backends.db')
+SESSION_WRITE_BEHIND_SECONDS = config('SESSION_WRITE_BEHIND_SECONDS', default=5, cast=int)
+
+# Session users resolved from an in-process LRU (complaints/auth.py); 0 disables.
+# Entries are checked against version tokens in USER_CACHE_ALIAS, so that cache
+# must be shared between processes for changes to reach all of them
+AUTHENTICATION_BACKENDS = ['complaints.auth.CachedModelBackend']
+USER_CACHE_SIZE = config('USER_CACHE_SIZE', default=0, cast=int)
+USER_CACHE_TIMEOUT = config('USER_CACHE_TIMEOUT', default=300, cast=int)
+USER_CACHE_ALIAS = config('USER_CACHE_ALIAS', default='default')
+
+# Transactions that lose a lock race (SQLite busy timeout, MySQL deadlock) are
+# rerun this many times, backing off from this delay
+DB_LOCK_RETRIES = config('DB_LOCK_RETRIES', default=3, cast=int)
+DB_LOCK_RETRY_BACKOFF_MS = config('DB_LOCK_RETRY_BACKOFF_MS', default=50, cast=int)
@@ -6,10 +6,16 @@ from django.urls import path, include
 from django.conf import settings
 from django.conf.urls.static import static
 
+from complaints.views import metrics_view
+
 urlpatterns = [
     path('admin/', admin.site.urls),
-    path('api/', include('complaints.urls')),
+    path('metrics', metrics_view, name='metrics'),
+    # Unprefixed routes first so /api/complaints/ reaches api_complaints
+    # instead of complaints_list under the api/ prefix. The prefixed copy is
+    # namespaced so reverse() keeps returning the unprefixed URLs.
     path('', include('complaints.urls')),
+    path('api/', include(('complaints.urls', 'complaints'), namespace='api')),
 ]
 
 if settings.DEBUG:
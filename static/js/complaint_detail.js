@@ -30,7 +30,13 @@ document.addEventListener('DOMContentLoaded', function() {
                 const result = await response.json();
 
                 if (result.success) {
-                    location.reload();
+                    // Without live updates nothing else adds the history entry
+                    if (!receivesLiveUpdates()) {
+                        location.reload();
+                        return;
+                    }
+                    const select = document.getElementById('status-select');
+                    applyStatus(result.status, select.options[select.selectedIndex].text, resolutionNotes);
                 } else {
                     alert('Failed to update status: ' + (result.error || 'Unknown error'));
                 }
@@ -69,19 +75,7 @@ document.addEventListener('DOMContentLoaded', function() {
                 const result = await response.json();
 
                 if (result.success) {
-                    // Add comment to the list
-                    const commentsList = document.getElementById('comments-list');
-                    const commentDiv = document.createElement('div');
-                    commentDiv.className = `comment-item ${result.comment.is_internal ? 'comment-internal' : ''}`;
-                    commentDiv.innerHTML = `
-                        <div class="comment-header">
-                            <strong>${result.comment.user}</strong>
-                            ${result.comment.is_internal ? '<span class="badge badge-info">Internal</span>' : ''}
-                            <span class="comment-time">${result.comment.created_at}</span>
-                        </div>
-                        <div class="comment-body">${result.comment.comment.replace(/\n/g, '<br>')}</div>
-                    `;
-                    commentsList.insertBefore(commentDiv, commentsList.firstChild);
+                    addComment(result.comment);
                     
                     // Clear form
                     document.getElementById('comment-text').value = '';
@@ -109,8 +103,154 @@ document.addEventListener('DOMContentLoaded', function() {
             }
         });
     }
+
+    // Older history, including archived entries, is only fetched on request
+    const olderHistoryBtn = document.getElementById('older-history-btn');
+    if (olderHistoryBtn) {
+        olderHistoryBtn.addEventListener('click', loadOlderHistory);
+    }
+
+    subscribeToUpdates();
 });
 
+// Live updates: status, assignment and comment changes by anyone are patched
+// into the page as they happen (see complaints/events.py). Only served under
+// ASGI; otherwise the page reloads after changes made from it, as before
+function receivesLiveUpdates() {
+    return liveUpdates && !!window.EventSource;
+}
+
+function subscribeToUpdates() {
+    if (!receivesLiveUpdates()) {
+        return;
+    }
+    const source = new EventSource(`/complaint/${ticketNumber}/events/`);
+
+    source.addEventListener('status', function(e) {
+        const event = JSON.parse(e.data);
+        applyStatus(event.status, event.status_display, event.resolution_notes);
+        const select = document.getElementById('status-select');
+        if (select) {
+            select.value = event.status;
+        }
+        addHistory(event.history);
+    });
+
+    source.addEventListener('assignment', function(e) {
+        const event = JSON.parse(e.data);
+        const assignedUser = document.getElementById('assigned-user');
+        if (assignedUser) {
+            assignedUser.textContent = event.assigned_to;
+        }
+        addHistory(event.history);
+    });
+
+    source.addEventListener('comment', function(e) {
+        addComment(JSON.parse(e.data).comment);
+    });
+
+    // Events were missed (reconnected too late or fell behind)
+    source.addEventListener('resync', function() {
+        source.close();
+        location.reload();
+    });
+}
+
+function applyStatus(status, statusDisplay, resolutionNotes) {
+    const badge = document.getElementById('status-badge');
+    badge.className = `status-badge status-${status}`;
+    badge.textContent = statusDisplay;
+
+    if (resolutionNotes) {
+        document.getElementById('resolution-notes-text').innerHTML = paragraphs(resolutionNotes);
+        document.getElementById('resolution-notes-section').style.display = '';
+    }
+}
+
+function addComment(comment) {
+    const commentsList = document.getElementById('comments-list');
+    // Our own comments arrive both in the response and as a live update
+    if (commentsList.querySelector(`[data-comment-id="${comment.id}"]`)) {
+        return;
+    }
+    document.getElementById('no-comments')?.remove();
+
+    const commentDiv = document.createElement('div');
+    commentDiv.className = `comment-item ${comment.is_internal ? 'comment-internal' : ''}`;
+    commentDiv.dataset.commentId = comment.id;
+    commentDiv.innerHTML = `
+        <div class="comment-header">
+            <strong>${escapeHtml(comment.user)}</strong>
+            ${comment.is_internal ? '<span class="badge badge-info">Internal</span>' : ''}
+            <span class="comment-time">${escapeHtml(comment.created_at)}</span>
+        </div>
+        <div class="comment-body">${paragraphs(comment.comment)}</div>
+    `;
+    commentsList.insertBefore(commentDiv, commentsList.firstChild);
+}
+
+function addHistory(entry, older = false) {
+    const historyList = document.getElementById('history-list');
+    if (entry.id && historyList.querySelector(`[data-history-id="${entry.id}"]`)) {
+        return;
+    }
+    document.getElementById('no-history')?.remove();
+
+    let change = '';
+    if (entry.old_value && entry.new_value) {
+        change = `from "${escapeHtml(entry.old_value)}" to "${escapeHtml(entry.new_value)}"`;
+    } else if (entry.new_value) {
+        change = `to "${escapeHtml(entry.new_value)}"`;
+    }
+    const item = document.createElement('div');
+    item.className = 'history-item';
+    if (entry.id) {
+        item.dataset.historyId = entry.id;
+    }
+    item.innerHTML = `
+        <div class="history-time">${escapeHtml(entry.changed_at)}</div>
+        <div class="history-detail">
+            <strong>${escapeHtml(entry.changed_by)}</strong>
+            changed <strong>${escapeHtml(entry.field_name)}</strong>
+            ${change}
+        </div>
+    `;
+    if (older) {
+        historyList.appendChild(item);
+    } else {
+        historyList.insertBefore(item, historyList.firstChild);
+    }
+}
+
+async function loadOlderHistory() {
+    const button = document.getElementById('older-history-btn');
+    const items = document.querySelectorAll('#history-list [data-history-id]');
+    const before = items.length ? items[items.length - 1].dataset.historyId : '';
+    button.disabled = true;
+
+    try {
+        const response = await fetch(`/api/complaint/${ticketNumber}/history/?before=${before}`);
+        const result = await response.json();
+
+        if (result.success) {
+            result.history.forEach(entry => addHistory(entry, true));
+            if (!result.has_more) {
+                button.remove();
+            }
+        } else {
+            alert('Failed to load history: ' + (result.error || 'Unknown error'));
+        }
+    } catch (error) {
+        alert('An error occurred. Please try again.');
+    }
+    button.disabled = false;
+}
+
+// Plain text as paragraphs, like Django's linebreaks filter
+function paragraphs(text) {
+    return text.split(/\n{2,}/).map(p => `<p>${escapeHtml(p).replace(/\n/g, '<br>')}</p>`).join('');
+}
+
 async function loadUsers() {
     // In a real application, you would fetch users from an API
     // For now, we'll use a simple approach
@@ -142,7 +282,13 @@ async function saveAssignment() {
         const result = await response.json();
 
         if (result.success) {
-            location.reload();
+            if (!receivesLiveUpdates()) {
+                location.reload();
+                return;
+            }
+            assignedUser.textContent = userId ? select.options[select.selectedIndex].text : 'Unassigned';
+            select.style.display = 'none';
+            assignBtn.textContent = 'Change Assignment';
         } else {
             alert('Failed to assign: ' + (result.error || 'Unknown error'));
         }
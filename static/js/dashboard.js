@@ -0,0 +1,120 @@
+// Dashboard JavaScript
+
+// Live updates: counters and the recent complaints table follow complaints
+// being created, changing status or deleted (see complaints/events.py). The
+// streams are only served under ASGI; otherwise the counters are polled
+const OPEN_STATUSES = ['pending', 'in_progress'];
+const RECENT_LIMIT = 10;
+
+document.addEventListener('DOMContentLoaded', function() {
+    const container = document.querySelector('.dashboard-container');
+    if (container.dataset.liveUpdates && window.EventSource) {
+        subscribeToUpdates();
+        return;
+    }
+    const seconds = parseInt(container.dataset.pollSeconds, 10);
+    if (seconds > 0) {
+        setInterval(refreshStats, seconds * 1000);
+    }
+});
+
+function subscribeToUpdates() {
+    const source = new EventSource('/dashboard/events/');
+
+    // Counters move by event deltas, so start from fresh ones once subscribed:
+    // events published since the page was rendered aren't replayed. Reconnects
+    // replay from Last-Event-ID (or get a resync), so they don't need this
+    source.addEventListener('open', refreshStats, {once: true});
+
+    source.addEventListener('created', function(e) {
+        const event = JSON.parse(e.data);
+        adjustStat('total', 1);
+        countComplaint(event.status, event.priority, 1);
+        addRecentComplaint(event);
+    });
+
+    source.addEventListener('status', function(e) {
+        const event = JSON.parse(e.data);
+        countComplaint(event.old_status, event.priority, -1);
+        countComplaint(event.status, event.priority, 1);
+
+        const badge = document.querySelector(`#recent-complaints tr[data-ticket="${event.ticket_number}"] .status-badge`);
+        if (badge) {
+            badge.className = `status-badge status-${event.status}`;
+            badge.textContent = event.status_display;
+        }
+    });
+
+    source.addEventListener('deleted', function(e) {
+        const event = JSON.parse(e.data);
+        adjustStat('total', -1);
+        countComplaint(event.status, event.priority, -1);
+        document.querySelector(`#recent-complaints tr[data-ticket="${event.ticket_number}"]`)?.remove();
+    });
+
+    // Events were missed (reconnected too late or fell behind)
+    source.addEventListener('resync', function() {
+        source.close();
+        location.reload();
+    });
+}
+
+// The stats API answers 304 while the counts are unchanged
+async function refreshStats() {
+    try {
+        const response = await fetch('/api/stats/', {cache: 'no-cache'});
+        if (!response.ok) {
+            return;
+        }
+        const stats = await response.json();
+        for (const [key, value] of Object.entries(stats)) {
+            const element = document.querySelector(`[data-stat="${key}"]`);
+            if (element) {
+                element.textContent = value;
+            }
+        }
+    } catch (error) {
+        // Try again on the next poll or reconnect
+    }
+}
+
+function adjustStat(key, delta) {
+    const element = document.querySelector(`[data-stat="${key}"]`);
+    if (element) {
+        element.textContent = Math.max(parseInt(element.textContent, 10) + delta, 0);
+    }
+}
+
+// Add (delta 1) or remove (delta -1) a complaint from its status and urgent counters
+function countComplaint(status, priority, delta) {
+    adjustStat(status, delta);
+    if (priority === 'urgent' && OPEN_STATUSES.includes(status)) {
+        adjustStat('urgent', delta);
+    }
+}
+
+function addRecentComplaint(complaint) {
+    const tbody = document.getElementById('recent-complaints');
+    document.getElementById('no-complaints')?.remove();
+
+    const row = document.createElement('tr');
+    row.dataset.ticket = complaint.ticket_number;
+    row.innerHTML = `
+        <td><strong>${escapeHtml(complaint.ticket_number)}</strong></td>
+        <td>${escapeHtml(truncateWords(complaint.title, 10))}</td>
+        <td><span class="status-badge status-${complaint.status}">${escapeHtml(complaint.status_display)}</span></td>
+        <td><span class="priority-badge priority-${complaint.priority}">${escapeHtml(complaint.priority_display)}</span></td>
+        <td>${escapeHtml(complaint.created_at)}</td>
+        <td><a href="/complaint/${encodeURIComponent(complaint.ticket_number)}/" class="btn btn-sm btn-secondary">View</a></td>
+    `;
+    tbody.insertBefore(row, tbody.firstChild);
+
+    while (tbody.rows.length > RECENT_LIMIT) {
+        tbody.deleteRow(-1);
+    }
+}
+
+function truncateWords(text, count) {
+    const words = text.split(/\s+/);
+    return words.length > count ? words.slice(0, count).join(' ') + ' …' : text;
+}
@@ -71,6 +71,13 @@ function showSuccess(message) {
     }, 3000);
 }
 
+// Escape text for insertion with innerHTML
+function escapeHtml(text) {
+    const div = document.createElement('div');
+    div.textContent = text == null ? '' : String(text);
+    return div.innerHTML;
+}
+
 // Format date
 function formatDate(dateString) {
     const date = new Date(dateString);